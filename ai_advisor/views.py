@@ -161,6 +161,8 @@ class AIConversationViewSet(viewsets.ModelViewSet):
 class SubjectRecommendationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = SubjectRecommendationSerializer
     permission_classes = [IsAuthenticated]
+    # page in recommendation order rather than newest first
+    keyset_ordering = ('-confidence_score', '-id')
     
     def get_queryset(self):
         try:
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django.test import TestCase, Client
 from django.urls import reverse
 from users.models import User
@@ -25,3 +26,78 @@ class FinanceViewsTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         content = resp.content.decode('utf-8')
         self.assertIn('Finance Dashboard', content)
+
+    def test_fee_tracking_keyset_pages_and_csv_export(self):
+        for idx in range(4):
+            Payment.objects.create(student=self.student, fee_structure=self.fee, amount_paid='10.00', payment_method='cash', transaction_id=f'tx-page-{idx}', status='pending')
+        newest_first = list(Payment.objects.order_by('-payment_date', '-id').values_list('id', flat=True))
+        self.client.force_login(self.finance)
+        seen = []
+        params = {}
+        with self.settings(FINANCE_PAGE_SIZE=2):
+            while True:
+                resp = self.client.get(reverse('fee_tracking'), params)
+                seen.extend(p.id for p in resp.context['payments'])
+                if not resp.context['next_cursor']:
+                    break
+                params = {'after': resp.context['next_cursor']}
+        self.assertEqual(seen, newest_first)
+
+        resp = self.client.get(reverse('fee_tracking'), {'status': 'completed', 'format': 'csv'})
+        self.assertTrue(resp.streaming)
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ','.join(finance_views.PAYMENT_CSV_HEADER))
+        self.assertEqual(len(lines), 2)
+        self.assertIn('tx1', lines[1])
+
+    def test_financial_reports_stream_revenue_csv(self):
+        self.client.force_login(self.finance)
+        resp = self.client.get(reverse('financial_reports'), {'format': 'csv', 'report': 'fee_types'})
+        self.assertTrue(resp.streaming)
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'Fee Type,Total Revenue,Payment Count')
+        self.assertEqual(lines[1].split(',')[0::2], ['Tuition', '1'])
+        self.assertEqual(len(lines), 2)
+
+    def test_daily_revenue_follows_payment_status(self):
+        from payments.models import DailyRevenue, rebuild_daily_revenue
+        pending = Payment.objects.create(student=self.student, fee_structure=self.fee, amount_paid='250.00', payment_method='cash', transaction_id='tx-roll', status='pending')
+
+        def rollup():
+            return {row.status: (row.payment_count, row.amount_total) for row in DailyRevenue.objects.filter(fee_structure=self.fee)}
+
+        self.assertEqual(rollup(), {'completed': (1, Decimal('1000.00')), 'pending': (1, Decimal('250.00'))})
+        self.client.force_login(self.finance)
+        self.client.post(reverse('process_payments'), {'payment_id': pending.id, 'action': 'approve'})
+        self.assertEqual(rollup(), {'completed': (2, Decimal('1250.00')), 'pending': (0, Decimal('0.00'))})
+        Payment.objects.get(id=self.payment.id).delete()
+        incremental = rollup()
+        self.assertEqual(incremental['completed'], (1, Decimal('250.00')))
+
+        rebuild_daily_revenue()
+        self.assertEqual(rollup(), {'completed': incremental['completed']})
+        resp = self.client.get(reverse('finance_dashboard'))
+        self.assertEqual(resp.context['total_revenue'], Decimal('250.00'))
+        self.assertEqual(resp.context['pending_payments'], 0)
+
+    def test_bulk_approval_reports_outcome_per_payment(self):
+        from payments.models import DailyRevenue
+        other_fee = FeeStructure.objects.create(name='Books', amount='50.00', description='Books', created_by=self.finance)
+        small = [Payment.objects.create(student=self.student, fee_structure=self.fee, amount_paid='100.00', payment_method='cash', transaction_id=f'tx-small-{idx}') for idx in range(3)]
+        large = Payment.objects.create(student=self.student, fee_structure=self.fee, amount_paid='900.00', payment_method='cash', transaction_id='tx-large')
+        books = Payment.objects.create(student=self.student, fee_structure=other_fee, amount_paid='50.00', payment_method='cash', transaction_id='tx-books')
+        self.client.force_login(self.finance)
+        url = reverse('bulk_process_payments')
+
+        resp = self.client.post(url, {'action': 'approve', 'payment_ids': [small[0].id, self.payment.id, 999999, 'x']}, HTTP_ACCEPT='application/json')
+        self.assertEqual(resp.json()['results'], {str(small[0].id): 'approved', str(self.payment.id): 'not_pending', '999999': 'not_found', 'x': 'invalid'})
+
+        with self.assertNumQueries(8):  # session, user, savepoint, select, update, 2 rollup rows, release
+            resp = self.client.post(url, {'action': 'approve', 'scope': 'filter', 'fee_structure': self.fee.id, 'max_amount': '500'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(resp.json()['updated'], 2)
+        statuses = dict(Payment.objects.values_list('transaction_id', 'status'))
+        self.assertEqual([statuses[p.transaction_id] for p in small], ['completed'] * 3)
+        self.assertEqual((statuses['tx-large'], statuses['tx-books']), ('pending', 'pending'))
+        completed = DailyRevenue.objects.get(fee_structure=self.fee, status='completed')
+        self.assertEqual((completed.payment_count, completed.amount_total), (4, Decimal('1300.00')))
+        self.assertEqual(DailyRevenue.objects.get(fee_structure=self.fee, status='pending').payment_count, 1)
@@ -1,23 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Sum, Count
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from users.decorators import finance_required
 from users.models import User
-from payments.models import Payment, FeeStructure
+from payments.models import DailyRevenue, Payment, FeeStructure, update_pending_payments
 # `courses` app may not be present in all deployments; import defensively
 try:
     from courses.models import Course
 except Exception:
     Course = None
 import csv
-from datetime import datetime, timedelta
+import json
+from decimal import Decimal, InvalidOperation
+from datetime import datetime, time, timedelta
 
 @finance_required
 def finance_dashboard(request):
-    # Financial statistics
-    total_revenue = Payment.objects.filter(status='completed').aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0
-    pending_payments = Payment.objects.filter(status='pending').count()
+    # Financial statistics, from the daily revenue rollup
+    totals = DailyRevenue.objects.filter(status__in=['completed', 'pending']).values('status').annotate(
+        amount=Sum('amount_total'), count=Sum('payment_count')
+    ).order_by()
+    totals = {row['status']: row for row in totals}
+    total_revenue = totals.get('completed', {}).get('amount') or 0
+    pending_payments = totals.get('pending', {}).get('count') or 0
     total_fee_structures = FeeStructure.objects.filter(is_active=True).count()
     
     # Recent payments
@@ -31,9 +41,64 @@ def finance_dashboard(request):
     }
     return render(request, 'finance/finance_dashboard.html', context)
 
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(filename, header, rows):
+    """Stream `rows` as a CSV attachment one line at a time.
+
+    `rows` should be lazy (a generator or queryset .iterator()) so the export
+    is never held in memory.
+    """
+    writer = csv.writer(_Echo())
+    lines = (writer.writerow(row) for row in _with_header(header, rows))
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _with_header(header, rows):
+    if header:
+        yield header
+    yield from rows
+
+
+def _export_chunk_size():
+    return getattr(settings, 'FINANCE_EXPORT_CHUNK_SIZE', 2000)
+
+
+PAYMENT_CSV_HEADER = ['Payment ID', 'Date', 'Student', 'Fee Type', 'Amount', 'Method', 'Transaction ID', 'Status']
+
+
+def payment_csv_rows(payments):
+    """CSV rows of a Payment queryset, fetched in chunks without model instances."""
+    return payments.values_list(
+        'id', 'payment_date', 'student__username', 'fee_structure__name',
+        'amount_paid', 'payment_method', 'transaction_id', 'status',
+    ).iterator(chunk_size=_export_chunk_size())
+
+
+def _payment_cursor(payment):
+    return f"{payment.payment_date.isoformat()}~{payment.id}"
+
+
+def _after_payment_cursor(payments, cursor):
+    """Payments after `cursor` in (-payment_date, -id) order; an invalid cursor starts over."""
+    timestamp, _, payment_id = (cursor or '').rpartition('~')
+    payment_date = parse_datetime(timestamp) if timestamp else None
+    if payment_date is None or not payment_id.isdigit():
+        return payments
+    return payments.filter(Q(payment_date__lt=payment_date) | Q(payment_date=payment_date, id__lt=int(payment_id)))
+
+
 @finance_required
 def fee_tracking(request):
-    payments = Payment.objects.all().select_related('student', 'fee_structure').order_by('-payment_date')
+    # newest first; id breaks ties so keyset pages never skip or repeat a row
+    payments = Payment.objects.all().select_related('student', 'fee_structure').order_by('-payment_date', '-id')
     
     # Filters
     status_filter = request.GET.get('status')
@@ -44,9 +109,27 @@ def fee_tracking(request):
     if student_filter:
         payments = payments.filter(student__username__icontains=student_filter)
     
+    if request.GET.get('format') == 'csv':
+        return stream_csv('payments.csv', PAYMENT_CSV_HEADER, payment_csv_rows(payments))
+    
+    # Keyset pagination: ?after=<cursor> continues below the last row shown,
+    # so deep pages cost the same as the first one
+    page_size = getattr(settings, 'FINANCE_PAGE_SIZE', 50)
+    cursor = request.GET.get('after')
+    page = list(_after_payment_cursor(payments, cursor)[:page_size + 1])
+    has_next = len(page) > page_size
+    page = page[:page_size]
+    
+    filters = request.GET.copy()
+    filters.pop('after', None)
+    filters.pop('format', None)
+    
     context = {
-        'payments': payments,
+        'payments': page,
         'status_choices': Payment.STATUS_CHOICES,
+        'next_cursor': _payment_cursor(page[-1]) if has_next else None,
+        'is_first_page': not cursor,
+        'filter_query': filters.urlencode(),
     }
     return render(request, 'finance/fee_tracking.html', context)
 
@@ -66,14 +149,114 @@ def process_payments(request):
             payment.status = 'failed'
             messages.success(request, f'Payment rejected for {payment.student.username}.')
         
-        payment.save()
+        # the daily revenue rollup moves with the status, in the same transaction
+        with transaction.atomic():
+            payment.save(update_fields=['status'])
         return redirect('process_payments')
     
     context = {
         'pending_payments': pending_payments,
+        'fee_structures': FeeStructure.objects.order_by('name'),
     }
     return render(request, 'finance/process_payments.html', context)
 
+BULK_PAYMENT_ACTIONS = {'approve': 'completed', 'reject': 'failed'}
+
+def _bulk_payment_params(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return {
+        'action': request.POST.get('action'),
+        'payment_ids': request.POST.getlist('payment_ids'),
+        'scope': request.POST.get('scope'),
+        'fee_structure': request.POST.get('fee_structure'),
+        'max_amount': request.POST.get('max_amount'),
+    }
+
+@finance_required
+def bulk_process_payments(request):
+    """Approve or reject many pending payments at once.
+
+    Targets are either `payment_ids` or, with scope=filter, every pending
+    payment matching the optional `fee_structure` and `max_amount` (at most
+    that amount). Accepts form posts and JSON bodies; JSON clients get an
+    outcome per payment id: approved/rejected, not_pending, not_found or
+    invalid.
+    """
+    wants_json = (
+        request.headers.get('Accept') == 'application/json'
+        or request.content_type == 'application/json'
+    )
+
+    def fail(message, status=400):
+        if wants_json:
+            return JsonResponse({'success': False, 'error': message}, status=status)
+        messages.error(request, message)
+        return redirect('process_payments')
+
+    if request.method != 'POST':
+        return fail('POST required.', status=405)
+    params = _bulk_payment_params(request)
+    if params is None:
+        return fail('Invalid JSON body.')
+    action = params.get('action')
+    if action not in BULK_PAYMENT_ACTIONS:
+        return fail('Action must be "approve" or "reject".')
+
+    outcomes = {}
+    payment_ids = params.get('payment_ids') or []
+    if payment_ids:
+        requested = []
+        for value in payment_ids:
+            try:
+                requested.append(int(value))
+            except (TypeError, ValueError):
+                outcomes[str(value)] = 'invalid'
+        targets = Payment.objects.filter(id__in=requested)
+    elif params.get('scope') == 'filter':
+        requested = None
+        targets = Payment.objects.all()
+        if params.get('fee_structure'):
+            try:
+                targets = targets.filter(fee_structure_id=int(params['fee_structure']))
+            except (TypeError, ValueError):
+                return fail('Invalid fee structure.')
+        if params.get('max_amount') not in (None, ''):
+            try:
+                targets = targets.filter(amount_paid__lte=Decimal(str(params['max_amount'])))
+            except InvalidOperation:
+                return fail('Invalid maximum amount.')
+    else:
+        return fail('Select payments or choose scope=filter.')
+
+    try:
+        changed = update_pending_payments(targets, BULK_PAYMENT_ACTIONS[action])
+    except Exception as e:
+        print(f"Bulk payment update failed: {e}")
+        return fail(f'Could not update payments: {e}', status=500)
+
+    done = 'approved' if action == 'approve' else 'rejected'
+    changed = set(changed)
+    for payment_id in changed:
+        outcomes[str(payment_id)] = done
+    if requested:
+        existing = set(Payment.objects.filter(id__in=set(requested) - changed).values_list('id', flat=True))
+        for payment_id in requested:
+            if payment_id not in changed:
+                outcomes[str(payment_id)] = 'not_pending' if payment_id in existing else 'not_found'
+
+    skipped = len(outcomes) - len(changed)
+    if wants_json:
+        return JsonResponse({'success': True, 'action': action, 'updated': len(changed), 'results': outcomes})
+    messages.success(request, f'{len(changed)} payment(s) {done}.')
+    if skipped:
+        messages.warning(request, f'{skipped} selected payment(s) were skipped (no longer pending or not found).')
+    return redirect('process_payments')
+
 @finance_required
 def update_fee_policies(request):
     fee_structures = FeeStructure.objects.all()
@@ -116,30 +299,54 @@ def update_fee_policies(request):
     }
     return render(request, 'finance/update_fee_policies.html', context)
 
+def _report_period(params):
+    """(start, end) dates of a report, both inclusive; the last 30 days by default."""
+    def parse(value):
+        try:
+            return parse_date(value or '')
+        except ValueError:
+            return None
+    end_date = parse(params.get('end_date')) or timezone.localdate()
+    start_date = parse(params.get('start_date')) or end_date - timedelta(days=30)  # Last 30 days
+    return start_date, end_date
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
 @finance_required
 def generate_financial_reports(request):
-    # Date range for reports
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)  # Last 30 days
-    
+    # Date range for reports; export links carry the period shown on the page
     if request.method == 'POST':
-        start_date = request.POST.get('start_date')
-        end_date = request.POST.get('end_date')
+        start_date, end_date = _report_period(request.POST)
         report_type = request.POST.get('report_type')
+    else:
+        start_date, end_date = _report_period(request.GET)
+    
+    # Summaries sum the daily revenue rollup: a few rows per day, whatever the number of payments
+    completed = DailyRevenue.objects.filter(status='completed', date__range=[start_date, end_date])
     
     # Financial data
-    revenue_data = Payment.objects.filter(
-        status='completed',
-        payment_date__range=[start_date, end_date]
-    ).values('payment_date__date').annotate(total=Sum('amount_paid')).order_by('payment_date__date')
-    
-    fee_type_data = Payment.objects.filter(
-        status='completed',
-        payment_date__range=[start_date, end_date]
-    ).values('fee_structure__name').annotate(
-        total=Sum('amount_paid'),
-        count=Count('id')
-    )
+    revenue_data = completed.values('date').annotate(total=Sum('amount_total')).order_by('date')
+    
+    fee_type_data = completed.values('fee_structure__name').annotate(
+        total=Sum('amount_total'),
+        count=Sum('payment_count')
+    ).order_by('fee_structure__name')
+    
+    if request.GET.get('format') == 'csv':
+        report = request.GET.get('report')
+        if report == 'payments':
+            payments = Payment.objects.filter(
+                status='completed',
+                payment_date__gte=_day_start(start_date),
+                payment_date__lt=_day_start(end_date + timedelta(days=1)),
+            ).order_by('payment_date', 'id')
+            return stream_csv('payments_report.csv', PAYMENT_CSV_HEADER, payment_csv_rows(payments))
+        if report == 'revenue':
+            return stream_csv('revenue_by_day.csv', ['Date', 'Revenue'], _revenue_csv_rows(revenue_data))
+        if report == 'fee_types':
+            return stream_csv('revenue_by_fee_type.csv', ['Fee Type', 'Total Revenue', 'Payment Count'], _fee_type_csv_rows(fee_type_data))
+        return generate_financial_csv(revenue_data, fee_type_data)
     
     context = {
         'revenue_data': list(revenue_data),
@@ -148,25 +355,23 @@ def generate_financial_reports(request):
         'end_date': end_date,
     }
     
-    if request.GET.get('format') == 'csv':
-        return generate_financial_csv(revenue_data, fee_type_data)
-    
     return render(request, 'finance/financial_reports.html', context)
 
+def _revenue_csv_rows(revenue_data):
+    for item in revenue_data.iterator(chunk_size=_export_chunk_size()):
+        yield [item['date'], item['total']]
+
+def _fee_type_csv_rows(fee_type_data):
+    for item in fee_type_data.iterator(chunk_size=_export_chunk_size()):
+        yield [item['fee_structure__name'], item['total'], item['count']]
+
 def generate_financial_csv(revenue_data, fee_type_data):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Revenue'])
-    
-    for item in revenue_data:
-        writer.writerow([item['payment_date__date'], item['total']])
-    
-    writer.writerow([])
-    writer.writerow(['Fee Type', 'Total Revenue', 'Payment Count'])
-    
-    for item in fee_type_data:
-        writer.writerow([item['fee_structure__name'], item['total'], item['count']])
+    """Both summaries in one streamed CSV, revenue by date first."""
+    def rows():
+        yield ['Date', 'Revenue']
+        yield from _revenue_csv_rows(revenue_data)
+        yield []
+        yield ['Fee Type', 'Total Revenue', 'Payment Count']
+        yield from _fee_type_csv_rows(fee_type_data)
     
-    return response
\ No newline at end of file
+    return stream_csv('financial_report.csv', None, rows())
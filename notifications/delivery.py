@@ -0,0 +1,270 @@
+"""Background fan-out of announcements to in-app notifications and email.
+
+Posting an announcement only records an AnnouncementDelivery; the fan-out
+runs after the transaction commits, in a background thread by default
+(ANNOUNCEMENT_DELIVERY_ASYNC). Notifications are inserted with bulk_create
+in chunks and emails go out in send_messages() batches over one reused
+connection, rate limited and retried with exponential backoff. Progress is
+written to the delivery row as each chunk finishes. Deliveries that failed,
+or whose worker died mid-run, are picked up again by resume_deliveries()
+(manage.py resume_announcement_deliveries).
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from users.models import User
+from .models import AnnouncementDelivery, Notification
+from .push import notifications_changed
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def queue_announcement_delivery(announcement, target_roles, send_email=False, requested_by=None, link='/announcements/'):
+    """Record a delivery for `announcement` and start it once the transaction commits.
+
+    `target_roles` empty means every active user. Returns the
+    AnnouncementDelivery, whose counters report progress.
+    """
+    delivery = AnnouncementDelivery.objects.create(
+        announcement=announcement,
+        requested_by=requested_by,
+        target_roles=list(target_roles or []),
+        send_email=send_email,
+        link=link,
+    )
+    transaction.on_commit(lambda: start_delivery(delivery.id))
+    return delivery
+
+
+def start_delivery(delivery_id):
+    """Run a delivery in a background thread, or inline when async delivery is off."""
+    if not _setting('ANNOUNCEMENT_DELIVERY_ASYNC', True):
+        deliver_announcement(delivery_id)
+        return
+
+    def run():
+        try:
+            deliver_announcement(delivery_id)
+        finally:
+            # the thread has its own DB connection; do not leak it
+            close_old_connections()
+
+    threading.Thread(target=run, name=f'announcement-delivery-{delivery_id}', daemon=True).start()
+
+
+def _recipients(delivery):
+    recipients = User.objects.filter(is_active=True)
+    if delivery.target_roles:
+        recipients = recipients.filter(role__in=delivery.target_roles)
+    return recipients.order_by('id')
+
+
+def _build_email(announcement, email, from_email, site_name):
+    posted = announcement.created_at.strftime('%B %d, %Y at %H:%M')
+    # Format content properly - replace newlines with <br> for HTML
+    formatted_content = announcement.content.replace('\n', '<br>').replace('\r', '')
+    text_content = f"{announcement.content}\n\nPosted on {posted}\n\n---\n{site_name}"
+    html_content = f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px;">{announcement.title}</h2>
+            <div style="margin: 20px 0;">
+                {formatted_content}
+            </div>
+            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+            <p style="color: #7f8c8d; font-size: 12px;">
+                Posted on {posted}<br>
+                ---<br>
+                {site_name}
+            </p>
+        </div>
+    </body>
+    </html>
+    """
+    msg = EmailMultiAlternatives(f"[{site_name}] {announcement.title}", text_content, from_email, [email])
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+class _EmailSender:
+    """Sends message batches over one SMTP connection with rate limit and retries."""
+
+    def __init__(self):
+        self.batch_size = max(1, _setting('ANNOUNCEMENT_EMAIL_BATCH_SIZE', 50))
+        rate = _setting('ANNOUNCEMENT_EMAILS_PER_SECOND', 10)
+        self.min_interval = self.batch_size / rate if rate else 0
+        self.retries = _setting('ANNOUNCEMENT_EMAIL_RETRIES', 3)
+        self.retry_delay = _setting('ANNOUNCEMENT_EMAIL_RETRY_DELAY', 2)
+        self.connection = get_connection(fail_silently=False)
+        self.last_send = None
+        self.last_error = ''
+
+    def _throttle(self):
+        if self.min_interval and self.last_send is not None:
+            wait = self.min_interval - (time.monotonic() - self.last_send)
+            if wait > 0:
+                time.sleep(wait)
+        self.last_send = time.monotonic()
+
+    def send(self, messages):
+        """Send messages in batches; returns (sent, failed).
+
+        Messages go out one at a time on the open connection, so when the
+        server fails partway through a batch only the messages not yet
+        delivered are retried and nobody receives the email twice.
+        last_error keeps the error of messages that were given up on;
+        failures that a retry got past are not reported.
+        """
+        sent = failed = 0
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            done = 0
+            delay = self.retry_delay
+            for attempt in range(self.retries + 1):
+                self._throttle()
+                try:
+                    self.connection.open()
+                    while done < len(batch):
+                        # 0 means the backend refused this message (e.g. no valid recipient); not retried
+                        if self.connection.send_messages(batch[done:done + 1]):
+                            sent += 1
+                        else:
+                            failed += 1
+                        done += 1
+                    break
+                except Exception as exc:
+                    error = f'{type(exc).__name__}: {exc}'
+                    logger.warning('Announcement email batch failed (attempt %d, %d/%d sent): %s', attempt + 1, done, len(batch), exc)
+                    # drop the broken connection; open() reconnects on the next attempt
+                    try:
+                        self.connection.close()
+                    except Exception:
+                        pass
+                    if attempt == self.retries:
+                        failed += len(batch) - done
+                        self.last_error = error
+                    else:
+                        time.sleep(delay)
+                        delay *= 2
+        return sent, failed
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+def resume_deliveries(stale_after=None):
+    """Put failed deliveries, and running ones whose worker died, back to pending.
+
+    A delivery runs in a thread of the web process, so a recycled or crashed
+    worker leaves it 'running'; one that has not reported progress for
+    `stale_after` seconds (ANNOUNCEMENT_DELIVERY_STALE_AFTER) is taken to be
+    dead. Returns the re-queued ids; run them with deliver_announcement().
+    """
+    if stale_after is None:
+        stale_after = _setting('ANNOUNCEMENT_DELIVERY_STALE_AFTER', 30 * 60)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stalled = (
+        Q(status='failed')
+        | Q(status='running', heartbeat_at__lt=cutoff)
+        | Q(status='running', heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    delivery_ids = list(AnnouncementDelivery.objects.filter(stalled).order_by('id').values_list('id', flat=True))
+    # filtered again, so a delivery that reported progress meanwhile is left running
+    AnnouncementDelivery.objects.filter(stalled, id__in=delivery_ids).update(status='pending', finished_at=None)
+    return delivery_ids
+
+
+def deliver_announcement(delivery_id):
+    """Fan an announcement out to its recipients, recording progress.
+
+    Safe to call more than once: only a pending delivery is picked up, and
+    users who already have the notification are skipped. A resumed delivery
+    (one that was started before) only emails the users it notifies now, so
+    nobody the earlier run reached gets the email twice.
+    """
+    delivery = AnnouncementDelivery.objects.select_related('announcement').filter(pk=delivery_id, status='pending').first()
+    if delivery is None:
+        return None
+    resumed = delivery.started_at is not None
+    now = timezone.now()
+    claimed = AnnouncementDelivery.objects.filter(pk=delivery_id, status='pending').update(
+        status='running', started_at=now, heartbeat_at=now, last_error='',
+    )
+    if not claimed:
+        return None
+    announcement = delivery.announcement
+    chunk_size = max(1, _setting('ANNOUNCEMENT_NOTIFICATION_CHUNK_SIZE', 500))
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@localhost')
+    site_name = getattr(settings, 'SITE_NAME', 'SIMS')
+    recipients = _recipients(delivery)
+    AnnouncementDelivery.objects.filter(pk=delivery_id).update(total_recipients=recipients.count())
+
+    sender = _EmailSender() if delivery.send_email else None
+    status = 'completed'
+    try:
+        # walk recipients by primary key so no read cursor stays open while writing
+        last_id = 0
+        while True:
+            chunk = list(recipients.filter(id__gt=last_id).values_list('id', 'email')[:chunk_size])
+            if not chunk:
+                break
+            _deliver_chunk(delivery, announcement, chunk, sender, from_email, site_name, resumed)
+            last_id = chunk[-1][0]
+    except Exception as exc:
+        logger.exception('Announcement delivery %s failed', delivery_id)
+        status = 'failed'
+        AnnouncementDelivery.objects.filter(pk=delivery_id).update(last_error=f'{type(exc).__name__}: {exc}')
+    finally:
+        if sender is not None:
+            sender.close()
+            if sender.last_error:
+                AnnouncementDelivery.objects.filter(pk=delivery_id).update(last_error=sender.last_error)
+    AnnouncementDelivery.objects.filter(pk=delivery_id).update(status=status, finished_at=timezone.now())
+    delivery.refresh_from_db()
+    logger.info('Announcement delivery %s %s: %d notifications, %d emails sent, %d failed',
+                delivery_id, status, delivery.notifications_created, delivery.emails_sent, delivery.emails_failed)
+    return delivery
+
+
+def _deliver_chunk(delivery, announcement, chunk, sender, from_email, site_name, resumed=False):
+    user_ids = [user_id for user_id, _ in chunk]
+    # same de-duplication as the old get_or_create(user, title, message)
+    already = set(Notification.objects.filter(
+        user_id__in=user_ids, title=announcement.title, message=announcement.content,
+    ).values_list('user_id', flat=True))
+    with transaction.atomic():
+        created = Notification.objects.bulk_create([
+            Notification(user_id=user_id, title=announcement.title, message=announcement.content, link=delivery.link)
+            for user_id in user_ids
+            if user_id not in already
+        ])
+        # bulk_create skips post_save; bump the unread counters and wake waiting clients
+        notifications_changed({notification.user_id: 1 for notification in created})
+    sent = failed = 0
+    if sender is not None:
+        messages = [
+            _build_email(announcement, email, from_email, site_name)
+            for user_id, email in chunk
+            if email and not (resumed and user_id in already)
+        ]
+        sent, failed = sender.send(messages)
+    AnnouncementDelivery.objects.filter(pk=delivery.pk).update(
+        notifications_created=F('notifications_created') + len(created),
+        emails_sent=F('emails_sent') + sent,
+        emails_failed=F('emails_failed') + failed,
+        heartbeat_at=timezone.now(),
+    )
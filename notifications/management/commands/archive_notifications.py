@@ -0,0 +1,41 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from notifications.models import Notification, NotificationArchive
+
+
+class Command(BaseCommand):
+    help = 'Move read notifications older than --days into the notification archive, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='Archive read notifications older than this many days')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many notifications would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = max(1, options['batch_size'])
+        candidates = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} read notifications older than {options["days"]} days would be archived.')
+            return
+
+        archived = 0
+        last_id = 0
+        while True:
+            # walk by primary key so each batch is an index range scan
+            batch = list(candidates.filter(id__gt=last_id).values('id', 'user_id', 'title', 'message', 'link', 'created_at')[:batch_size])
+            if not batch:
+                break
+            ids = [row['id'] for row in batch]
+            # short transactions keep the table available to the dashboards between batches
+            with transaction.atomic():
+                NotificationArchive.objects.bulk_create([NotificationArchive(**row) for row in batch], ignore_conflicts=True)
+                Notification.objects.filter(id__in=ids, is_read=True).delete()
+            archived += len(batch)
+            last_id = ids[-1]
+            self.stdout.write(f'Archived {archived} notifications...')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} read notifications older than {options["days"]} days.'))
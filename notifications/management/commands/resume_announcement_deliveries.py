@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from notifications.delivery import deliver_announcement, resume_deliveries
+
+
+class Command(BaseCommand):
+    help = 'Re-run announcement deliveries that failed or whose worker died while they were running.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int, default=None,
+                            help='Treat running deliveries without progress for this long as dead (default: ANNOUNCEMENT_DELIVERY_STALE_AFTER)')
+
+    def handle(self, *args, **options):
+        stale_after = options['stale_minutes'] * 60 if options['stale_minutes'] is not None else None
+        delivery_ids = resume_deliveries(stale_after)
+        if not delivery_ids:
+            self.stdout.write('No announcement deliveries to resume.')
+            return
+
+        # run here rather than in a thread: the command exits when it is done
+        for delivery_id in delivery_ids:
+            delivery = deliver_announcement(delivery_id)
+            if delivery is None:
+                self.stdout.write(f'Delivery {delivery_id} was picked up elsewhere.')
+                continue
+            self.stdout.write(
+                f'Delivery {delivery_id} {delivery.status}: {delivery.notifications_created} notifications, '
+                f'{delivery.emails_sent} emails sent, {delivery.emails_failed} failed'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Resumed {len(delivery_ids)} announcement deliveries.'))
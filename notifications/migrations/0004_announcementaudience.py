@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 04:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_announcementdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnouncementAudience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Administrator'), ('teacher', 'Teacher'), ('student', 'Student'), ('registrar', 'Registrar'), ('finance', 'Finance Officer'), ('parent', 'Parent')], max_length=20)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['is_active', '-created_at'], name='notif_announcement_active_idx'),
+        ),
+        migrations.AddField(
+            model_name='announcementaudience',
+            name='announcement',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience', to='notifications.announcement'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='announcementaudience',
+            unique_together={('role', 'announcement')},
+        ),
+    ]
@@ -0,0 +1,45 @@
+import json
+from django.db import migrations
+
+ROLES = ['admin', 'teacher', 'student', 'registrar', 'finance', 'parent']
+
+
+def forwards(apps, schema_editor):
+    Announcement = apps.get_model('notifications', 'Announcement')
+    AnnouncementAudience = apps.get_model('notifications', 'AnnouncementAudience')
+
+    rows = []
+    for announcement_id, target_roles in Announcement.objects.values_list('id', 'target_roles'):
+        # target_roles was written as a list, a JSON string or CSV over time
+        if isinstance(target_roles, str):
+            try:
+                target_roles = json.loads(target_roles)
+            except ValueError:
+                pass
+        if isinstance(target_roles, str):
+            # CSV, or a JSON-encoded role name such as '"student"'
+            target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
+        if not isinstance(target_roles, list):
+            target_roles = []
+        roles = [role for role in ROLES if role in target_roles] if target_roles else ROLES
+        rows.extend(AnnouncementAudience(announcement_id=announcement_id, role=role) for role in roles)
+        if len(rows) >= 1000:
+            AnnouncementAudience.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    AnnouncementAudience.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def reverse(apps, schema_editor):
+    # target_roles is still the source of truth; the audience rows can simply go
+    apps.get_model('notifications', 'AnnouncementAudience').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_announcementaudience'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, reverse),
+    ]
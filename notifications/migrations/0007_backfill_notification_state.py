@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def forwards(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationState = apps.get_model('notifications', 'NotificationState')
+
+    counts = (
+        Notification.objects.values('user_id')
+        .annotate(unread=Count('id', filter=Q(is_read=False)))
+        .order_by()
+    )
+    NotificationState.objects.bulk_create(
+        [NotificationState(user_id=row['user_id'], unread_count=row['unread']) for row in counts],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def reverse(apps, schema_editor):
+    apps.get_model('notifications', 'NotificationState').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notificationstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, reverse),
+    ]
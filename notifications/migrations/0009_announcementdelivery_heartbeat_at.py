@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_notificationarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcementdelivery',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
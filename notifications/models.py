@@ -1,5 +1,33 @@
+import json
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from users.models import User
+from .push import notifications_changed
+
+ANNOUNCEMENT_ROLES = [role for role, _ in User.ROLE_CHOICES]
+# Default number of announcements a list page or API returns
+ANNOUNCEMENT_PAGE_SIZE = 50
+
+
+def normalize_target_roles(target_roles):
+    """Return target_roles as a list, accepting a list, a JSON string or CSV.
+
+    An empty list means the announcement is for everyone.
+    """
+    if isinstance(target_roles, str):
+        try:
+            target_roles = json.loads(target_roles)
+        except ValueError:
+            pass
+    if isinstance(target_roles, str):
+        # CSV, or a JSON-encoded role name such as '"student"'
+        target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
+    if not isinstance(target_roles, list):
+        return []
+    return [role for role in target_roles if role]
+
+
 class Announcement(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
@@ -8,9 +36,60 @@ class Announcement(models.Model):
     is_active = models.BooleanField(default=True)
     target_roles = models.JSONField(default=list)  # List of roles that should see this
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', '-created_at'], name='notif_announcement_active_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def audience_roles(self):
+        """Roles this announcement is shown to; an empty target means every role."""
+        roles = normalize_target_roles(self.target_roles)
+        return sorted(set(roles) & set(ANNOUNCEMENT_ROLES)) if roles else list(ANNOUNCEMENT_ROLES)
+
+
+def visible_announcements(role):
+    """Active announcements shown to `role`, newest first, as one indexed query.
+
+    Slice the result ([:n]) to get a LIMIT.
+    """
+    return Announcement.objects.filter(is_active=True, audience__role=role).order_by('-created_at', '-id')
+
+
+class AnnouncementAudience(models.Model):
+    """Normalized target_roles: one row per role an announcement is shown to.
+
+    Kept in sync with Announcement.target_roles on save, so "announcements
+    for role X" is an index lookup instead of parsing JSON per row.
+    """
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='audience')
+    role = models.CharField(max_length=20, choices=User.ROLE_CHOICES)
+
+    class Meta:
+        unique_together = ['role', 'announcement']
+
+    def __str__(self):
+        return f"{self.announcement_id} -> {self.role}"
+
+
+@receiver(post_save, sender=Announcement)
+def _sync_announcement_audience(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    roles = set(instance.audience_roles())
+    if not created:
+        current = set(instance.audience.values_list('role', flat=True))
+        if current == roles:
+            return
+        instance.audience.exclude(role__in=roles).delete()
+        roles -= current
+    AnnouncementAudience.objects.bulk_create(
+        [AnnouncementAudience(announcement=instance, role=role) for role in sorted(roles)],
+        ignore_conflicts=True,
+    )
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -19,5 +98,89 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.CharField(max_length=200, blank=True)
     
+    class Meta:
+        indexes = [
+            # per-user unread lists and counts
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.title}"
+
+
+class NotificationState(models.Model):
+    """Denormalized per-user notification counters.
+
+    unread_count is adjusted with F() expressions in the same transaction as
+    the Notification writes (see notifications/push.py), so a badge is one
+    primary-key read however many notifications the user has.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_state')
+    unread_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_count} unread"
+
+
+@receiver(post_save, sender=Notification)
+def _notification_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        notifications_changed({instance.user_id: 0 if instance.is_read else 1})
+    else:
+        # is_read may have flipped; the previous value is not known here
+        notifications_changed({instance.user_id: None})
+
+
+@receiver(post_delete, sender=Notification)
+def _notification_deleted(sender, instance, **kwargs):
+    # read notifications are neither counted nor pushed, so removing them changes nothing
+    if not instance.is_read:
+        notifications_changed({instance.user_id: -1})
+
+
+class NotificationArchive(models.Model):
+    """Read notifications moved out of the hot table by `manage.py archive_notifications`.
+
+    Rows keep the id they had in Notification, so re-running an interrupted
+    archive never duplicates them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    link = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.title} (archived)"
+
+class AnnouncementDelivery(models.Model):
+    """Progress of one announcement fan-out (in-app notifications + emails)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='deliveries')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    target_roles = models.JSONField(default=list)  # empty list means every active user
+    send_email = models.BooleanField(default=False)
+    link = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.PositiveIntegerField(default=0)
+    notifications_created = models.PositiveIntegerField(default=0)
+    emails_sent = models.PositiveIntegerField(default=0)
+    emails_failed = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # bumped as each chunk finishes; a running delivery that stops bumping it has died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"{self.user.username}: {self.title}"
\ No newline at end of file
+        return f"{self.announcement.title} ({self.status})"
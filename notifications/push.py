@@ -0,0 +1,140 @@
+"""Per-user unread notification counters and an in-process pub/sub.
+
+Writers of Notification rows report the change through notifications_changed()
+(post_save/post_delete do it for single rows). The user's NotificationState
+counter is adjusted right away, inside the writer's transaction, and once the
+transaction commits every request waiting on that user in this process is
+woken up. The notification stream and long-poll views wait on the broker
+instead of re-querying the database on a timer.
+
+The broker lives in process memory, so with several worker processes a
+waiter only hears about writes made by its own process; the stream and poll
+timeouts bound how stale such a client can get.
+"""
+import threading
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+
+def _count_unread(user_ids):
+    from .models import Notification
+    counts = {user_id: 0 for user_id in user_ids}
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids)
+        .values_list('user_id')
+        .annotate(unread=Count('id', filter=Q(is_read=False)))
+        .order_by()
+    )
+    return counts
+
+
+def _create_states(user_ids):
+    """Create missing counters from a grouped count of the users' unread rows."""
+    from .models import NotificationState
+    NotificationState.objects.bulk_create(
+        [NotificationState(user_id=user_id, unread_count=count) for user_id, count in _count_unread(user_ids).items()],
+        ignore_conflicts=True,
+    )
+
+
+def get_unread_count(user):
+    """Number of unread notifications of `user` (a User or a user id); one primary-key read."""
+    from .models import NotificationState
+    user_id = getattr(user, 'pk', user)
+    count = NotificationState.objects.filter(pk=user_id).values_list('unread_count', flat=True).first()
+    if count is None:
+        _create_states([user_id])
+        count = NotificationState.objects.filter(pk=user_id).values_list('unread_count', flat=True).first() or 0
+    return count
+
+
+def _adjust_unread(deltas):
+    from .models import NotificationState
+    states = NotificationState.objects.filter(pk__in=deltas.keys())
+    existing = set(states.values_list('pk', flat=True))
+
+    recount = [user_id for user_id, delta in deltas.items() if delta is None and user_id in existing]
+    for user_id, count in _count_unread(recount).items():
+        NotificationState.objects.filter(pk=user_id).update(unread_count=count)
+
+    # one UPDATE per distinct delta; a bulk insert is a single +1 for everyone
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta and user_id in existing:
+            by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        value = F('unread_count') + delta if delta > 0 else Greatest(F('unread_count') + delta, 0)
+        NotificationState.objects.filter(pk__in=user_ids).update(unread_count=value)
+
+    # missing counters are counted from scratch, which already includes this
+    # write; a decrement alone never creates one (the user may be being deleted)
+    missing = [user_id for user_id, delta in deltas.items() if user_id not in existing and (delta is None or delta > 0)]
+    if missing:
+        _create_states(missing)
+
+
+class _Broker:
+    """Wakes up requests waiting for a user's notifications to change.
+
+    Each user has a version number bumped on every change; waiters pass the
+    version they last saw and return as soon as it differs.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = {}
+
+    def version(self, user_id):
+        with self._condition:
+            return self._versions.get(user_id, 0)
+
+    def publish(self, user_ids):
+        with self._condition:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def wait(self, user_id, since, timeout):
+        """Block until the user's version differs from `since` or `timeout` seconds pass; return the version."""
+        with self._condition:
+            # != rather than >: a restarted process starts counting from 0 again
+            self._condition.wait_for(lambda: self._versions.get(user_id, 0) != since, timeout)
+            return self._versions.get(user_id, 0)
+
+
+broker = _Broker()
+
+
+def notifications_changed(deltas):
+    """Report notification writes as {user_id: change in unread count}.
+
+    Counters are updated immediately, in the caller's transaction; waiting
+    clients are woken once it commits, so they read the new rows. Use a
+    delta of 0 for changes that keep the unread count and None when it is
+    unknown (the counter is recounted).
+    """
+    deltas = dict(deltas)
+    if not deltas:
+        return
+    counted = {user_id: delta for user_id, delta in deltas.items() if delta != 0}
+    if counted:
+        _adjust_unread(counted)
+    transaction.on_commit(lambda: broker.publish(deltas.keys()))
+
+
+def mark_notifications_read(user, notification_ids=None):
+    """Mark `user`'s notifications read with one UPDATE; returns how many changed.
+
+    `notification_ids` None marks every unread notification of the user.
+    """
+    from .models import Notification
+    unread = Notification.objects.filter(user=user, is_read=False)
+    if notification_ids is not None:
+        unread = unread.filter(id__in=notification_ids)
+    with transaction.atomic():
+        updated = unread.update(is_read=True)
+        if updated:
+            notifications_changed({user.pk: -updated})
+    return updated
@@ -0,0 +1,267 @@
+import json
+import threading
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from users.models import User
+from notifications.models import (
+    Announcement, AnnouncementAudience, AnnouncementDelivery, Notification, NotificationArchive, NotificationState,
+    normalize_target_roles, visible_announcements,
+)
+from notifications.push import broker, get_unread_count
+
+
+@override_settings(
+    ANNOUNCEMENT_DELIVERY_ASYNC=False,
+    ANNOUNCEMENT_NOTIFICATION_CHUNK_SIZE=2,
+    ANNOUNCEMENT_EMAIL_BATCH_SIZE=2,
+    ANNOUNCEMENT_EMAILS_PER_SECOND=0,
+    ANNOUNCEMENT_EMAIL_RETRY_DELAY=0,
+)
+class AnnouncementDeliveryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin1', password='pass', role='admin', email='admin1@example.com')
+        for idx in range(5):
+            User.objects.create_user(username=f'student{idx}', password='pass', role='student', email=f'student{idx}@example.com')
+        User.objects.create_user(username='noemail', password='pass', role='student')
+        User.objects.create_user(username='teacher1', password='pass', role='teacher', email='teacher1@example.com')
+        self.client = Client()
+        self.client.login(username='admin1', password='pass')
+
+    def _post(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('post_announcement'), {'title': 'Exams', 'content': 'Start Monday', **data})
+        self.assertEqual(resp.status_code, 302)
+        return AnnouncementDelivery.objects.get()
+
+    def test_fan_out_creates_notifications_and_batches_emails(self):
+        delivery = self._post(target_roles=['student'], send_email='on')
+
+        self.assertEqual(delivery.status, 'completed')
+        self.assertEqual((delivery.total_recipients, delivery.notifications_created), (6, 6))
+        self.assertEqual((delivery.emails_sent, delivery.emails_failed), (5, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'student{idx}@example.com' for idx in range(5)])
+        self.assertFalse(Notification.objects.filter(user__role='teacher').exists())
+        # bulk inserts keep the denormalized unread counters in step
+        self.assertEqual(
+            dict(NotificationState.objects.filter(user__role='student').values_list('user_id', 'unread_count')),
+            dict.fromkeys(User.objects.filter(role='student').values_list('id', flat=True), 1),
+        )
+
+        # delivering the same announcement again does not duplicate notifications
+        AnnouncementDelivery.objects.filter(pk=delivery.pk).update(status='pending', notifications_created=0)
+        from notifications.delivery import deliver_announcement
+        self.assertEqual(deliver_announcement(delivery.pk).notifications_created, 0)
+
+    def test_all_roles_without_email(self):
+        delivery = self._post(target_roles=['all'])
+        self.assertEqual(Announcement.objects.get().target_roles, [])
+        self.assertEqual(delivery.notifications_created, User.objects.filter(is_active=True).count())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_batch_is_retried_on_a_fresh_connection(self):
+        real_send = EmailBackend.send_messages
+        calls = []
+
+        def flaky(backend, messages):
+            calls.append(len(messages))
+            # the connection drops on the second message of the first batch
+            if len(calls) == 2:
+                raise ConnectionError('SMTP dropped')
+            return real_send(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', flaky):
+            delivery = self._post(target_roles=['student', 'teacher'], send_email='on')
+        self.assertEqual((delivery.emails_sent, delivery.emails_failed), (6, 0))
+        self.assertEqual(set(calls), {1})
+        # only the undelivered message was retried: nobody got it twice
+        recipients = [m.to[0] for m in mail.outbox]
+        self.assertEqual(len(recipients), 6)
+        self.assertEqual(len(set(recipients)), 6)
+        # the retry succeeded, so no error is reported
+        self.assertEqual(delivery.last_error, '')
+
+        status = self.client.get(reverse('announcement_delivery_status', args=[delivery.id])).json()
+        self.assertEqual(status['status'], 'completed')
+
+    @override_settings(ANNOUNCEMENT_EMAIL_RETRIES=1)
+    def test_messages_given_up_on_keep_the_error(self):
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=ConnectionError('SMTP down')):
+            delivery = self._post(target_roles=['teacher'], send_email='on')
+        self.assertEqual((delivery.emails_sent, delivery.emails_failed), (0, 1))
+        self.assertIn('SMTP down', delivery.last_error)
+
+
+    def test_resume_reruns_failed_and_dead_deliveries_without_duplicate_emails(self):
+        from notifications import delivery as delivery_module
+        real_chunk = delivery_module._deliver_chunk
+        calls = []
+
+        def dies_on_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return real_chunk(*args)
+
+        with mock.patch.object(delivery_module, '_deliver_chunk', dies_on_second_chunk):
+            delivery = self._post(target_roles=['student'], send_email='on')
+        self.assertEqual(delivery.status, 'failed')
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['student0@example.com', 'student1@example.com'])
+        mail.outbox = []
+
+        now = timezone.now()
+        dead = AnnouncementDelivery.objects.create(
+            announcement=delivery.announcement, target_roles=['teacher'], status='running',
+            started_at=now - timedelta(hours=2), heartbeat_at=now - timedelta(hours=1),
+        )
+        live = AnnouncementDelivery.objects.create(
+            announcement=delivery.announcement, target_roles=['teacher'], status='running', started_at=now, heartbeat_at=now,
+        )
+        out = StringIO()
+        call_command('resume_announcement_deliveries', stdout=out)
+        self.assertIn('Resumed 2 announcement deliveries.', out.getvalue())
+
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.last_error), ('completed', ''))
+        self.assertEqual(Notification.objects.filter(user__role='student').count(), 6)
+        # students notified by the first run already had their email
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'student{idx}@example.com' for idx in range(2, 5)])
+        self.assertEqual(AnnouncementDelivery.objects.get(pk=dead.pk).status, 'completed')
+        self.assertTrue(Notification.objects.filter(user__role='teacher').exists())
+        self.assertEqual(AnnouncementDelivery.objects.get(pk=live.pk).status, 'running')
+
+
+class AnnouncementAudienceTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin2', password='pass', role='admin')
+
+    def test_audience_follows_target_roles(self):
+        everyone = Announcement.objects.create(title='Holiday', content='No school', created_by=self.admin, target_roles=[])
+        parents = Announcement.objects.create(title='PTA', content='Meeting', created_by=self.admin, target_roles=['parent'])
+        # legacy rows stored roles as a comma separated string
+        Announcement.objects.create(title='Fees', content='Due', created_by=self.admin, target_roles='student, parent')
+        Announcement.objects.create(title='Old', content='Hidden', created_by=self.admin, target_roles=[], is_active=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            titles = [a.title for a in visible_announcements('parent')[:10]]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(titles, ['Fees', 'PTA', 'Holiday'])
+        self.assertEqual([a.title for a in visible_announcements('student')], ['Fees', 'Holiday'])
+        self.assertEqual(everyone.audience.count(), len(User.ROLE_CHOICES))
+
+        parents.target_roles = ['teacher']
+        parents.save()
+        self.assertEqual(list(parents.audience.values_list('role', flat=True)), ['teacher'])
+        self.assertEqual([a.title for a in visible_announcements('teacher')], ['PTA', 'Holiday'])
+
+
+    def test_json_encoded_role_name_keeps_its_audience(self):
+        Announcement.objects.create(title='Trip', content='Bus at 8', created_by=self.admin, target_roles='"student"')
+        self.assertEqual(normalize_target_roles('"student"'), ['student'])
+        self.assertEqual(normalize_target_roles('"student, parent"'), ['student', 'parent'])
+        self.assertEqual(normalize_target_roles('42'), [])
+        self.assertEqual([a.title for a in visible_announcements('student')], ['Trip'])
+        self.assertEqual(list(visible_announcements('parent')), [])
+
+        # the backfill reads stored rows the same way
+        AnnouncementAudience.objects.all().delete()
+        import_module('notifications.migrations.0005_backfill_announcement_audience').forwards(django_apps, None)
+        self.assertEqual(list(AnnouncementAudience.objects.values_list('role', flat=True)), ['student'])
+
+class NotificationPushTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='pupil', password='pass', role='student')
+        self.client = Client()
+        self.client.login(username='pupil', password='pass')
+
+    def _notify(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(user=self.user, title=title, message='...')
+
+    def test_counter_follows_inserts_and_mark_read(self):
+        self.assertEqual(get_unread_count(self.user), 0)
+        first = self._notify('One')
+        self._notify('Two')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_unread_count(self.user), 2)
+        # a primary-key read of the counter row, no COUNT over the notifications
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('mark_notification_read', args=[first.id]))
+        self.assertEqual(resp.json()['updated'], 1)
+        self.assertEqual(get_unread_count(self.user), 1)
+        # reading it again changes nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('mark_notification_read', args=[first.id]))
+        self.assertEqual(resp.json()['updated'], 0)
+        self.assertEqual(get_unread_count(self.user), 1)
+
+    def test_waiters_wake_up_on_new_notification(self):
+        version = broker.version(self.user.pk)
+        woken = []
+        waiter = threading.Thread(target=lambda: woken.append(broker.wait(self.user.pk, version, 5)))
+        waiter.start()
+        self._notify('Exam moved')
+        waiter.join(5)
+        self.assertEqual(woken, [version + 1])
+
+    def test_poll_and_stream_return_unread_notifications(self):
+        version = self.client.get(reverse('notification_poll')).json()['version']
+        self._notify('Fees due')
+        data = self.client.get(reverse('notification_poll'), {'since': version}).json()
+        self.assertEqual((data['version'], data['unread_count']), (version + 1, 1))
+        self.assertEqual([n['title'] for n in data['notifications']], ['Fees due'])
+
+        resp = self.client.get(reverse('notification_stream'))
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        events = iter(resp.streaming_content)
+        next(events)
+        event = next(events).decode()
+        resp.close()
+        self.assertTrue(event.startswith('event: notifications\n'))
+        self.assertEqual(json.loads(event.split('data: ', 1)[1])['unread_count'], 1)
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass', role='parent')
+        self.client = Client()
+        self.client.login(username='reader', password='pass')
+
+    def test_mark_all_read_is_one_update(self):
+        for idx in range(3):
+            Notification.objects.create(user=self.user, title=f'N{idx}', message='...')
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(reverse('mark_all_notifications_read'))
+        self.assertEqual((resp.json()['updated'], resp.json()['unread_count']), (3, 0))
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "notifications_notification"')]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_archive_moves_old_read_notifications_in_batches(self):
+        old_read = [Notification.objects.create(user=self.user, title=f'Old {idx}', message='...', is_read=True) for idx in range(3)]
+        old_unread = Notification.objects.create(user=self.user, title='Old unread', message='...')
+        recent_read = Notification.objects.create(user=self.user, title='Recent', message='...', is_read=True)
+        Notification.objects.exclude(pk=recent_read.pk).update(created_at=timezone.now() - timedelta(days=400))
+
+        out = StringIO()
+        call_command('archive_notifications', days=365, batch_size=2, stdout=out)
+
+        self.assertIn('Archived 3 read notifications', out.getvalue())
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)), {old_unread.id, recent_read.id})
+        self.assertEqual(set(NotificationArchive.objects.values_list('id', flat=True)), {n.id for n in old_read})
+        self.assertEqual(NotificationState.objects.get(user=self.user).unread_count, 1)
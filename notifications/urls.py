@@ -1,8 +1,16 @@
 # In your urls.py
 from django.urls import path
-from .views import student_announcements_api
+from .views import (
+    student_announcements_api, announcement_delivery_status,
+    notification_stream, notification_poll, mark_notification_read, mark_all_notifications_read,
+)
 
 urlpatterns = [
     path('api/students/announcements/', student_announcements_api, name='student_announcements_api'),
     path('api/announcements/', student_announcements_api, name='student_announcements_api'),
+    path('deliveries/<int:delivery_id>/', announcement_delivery_status, name='announcement_delivery_status'),
+    path('stream/', notification_stream, name='notification_stream'),
+    path('poll/', notification_poll, name='notification_poll'),
+    path('<int:notification_id>/read/', mark_notification_read, name='mark_notification_read'),
+    path('read-all/', mark_all_notifications_read, name='mark_all_notifications_read'),
 ]
\ No newline at end of file
@@ -1,45 +1,34 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from notifications.models import Announcement
+import json
+import time
+from notifications.models import Announcement, AnnouncementDelivery, Notification, ANNOUNCEMENT_PAGE_SIZE, visible_announcements
+from notifications.push import broker, get_unread_count, mark_notifications_read
+from django.conf import settings
 from django.utils import timezone
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_GET, require_POST
+from users.decorators import admin_required
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def student_announcements_api(request):
     """API endpoint for student announcements - returns real data from database"""
     try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter announcements relevant to the user's role
-        relevant_announcements = []
-        user_role = request.user.role
-        
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets this user's role or is for everyone
-            if not target_roles or len(target_roles) == 0 or user_role in target_roles:
-                relevant_announcements.append({
-                    "id": announcement.id,
-                    "title": announcement.title,
-                    "content": announcement.content,
-                    "created_at": announcement.created_at.isoformat(),
-                    "is_important": False  # You can add a priority field to Announcement model if needed
-                })
+        # Active announcements for the user's role, resolved in the database
+        relevant_announcements = [
+            {
+                "id": announcement.id,
+                "title": announcement.title,
+                "content": announcement.content,
+                "created_at": announcement.created_at.isoformat(),
+                "is_important": False  # You can add a priority field to Announcement model if needed
+            }
+            for announcement in visible_announcements(request.user.role)[:ANNOUNCEMENT_PAGE_SIZE]
+        ]
         
         return Response({
             "announcements": relevant_announcements,
@@ -58,35 +47,10 @@ def student_announcements_api(request):
 @login_required
 def student_announcements(request):
     """Render the student announcements page"""
-    from notifications.models import Announcement
-    
     try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter announcements relevant to the user's role
-        relevant_announcements = []
-        user_role = request.user.role
-        
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets this user's role or is for everyone
-            if not target_roles or len(target_roles) == 0 or user_role in target_roles:
-                relevant_announcements.append(announcement)
-                
+        relevant_announcements = list(visible_announcements(request.user.role)[:ANNOUNCEMENT_PAGE_SIZE])
     except Exception as e:
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
+        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:ANNOUNCEMENT_PAGE_SIZE]
         print(f"Error filtering announcements: {e}")
     
     context = {
@@ -94,3 +58,122 @@ def student_announcements(request):
         'announcements': relevant_announcements,
     }
     return render(request, 'students/announcements.html', context)
+
+
+@admin_required
+def announcement_delivery_status(request, delivery_id):
+    """JSON progress of an announcement fan-out started from post_announcement"""
+    delivery = get_object_or_404(AnnouncementDelivery, id=delivery_id)
+    return JsonResponse({
+        'id': delivery.id,
+        'announcement': delivery.announcement.title,
+        'status': delivery.status,
+        'total_recipients': delivery.total_recipients,
+        'notifications_created': delivery.notifications_created,
+        'emails_sent': delivery.emails_sent,
+        'emails_failed': delivery.emails_failed,
+        'last_error': delivery.last_error,
+        'created_at': delivery.created_at.isoformat(),
+        'started_at': delivery.started_at.isoformat() if delivery.started_at else None,
+        'heartbeat_at': delivery.heartbeat_at.isoformat() if delivery.heartbeat_at else None,
+        'finished_at': delivery.finished_at.isoformat() if delivery.finished_at else None,
+    })
+
+
+def _unread_payload(user, version):
+    """Unread count and the latest unread notifications, as sent to the dashboards."""
+    notifications = Notification.objects.filter(user=user, is_read=False).order_by('-created_at')[:10]
+    return {
+        'version': version,
+        'unread_count': get_unread_count(user),
+        'notifications': [
+            {
+                'id': notif.id,
+                'title': notif.title or 'Notification',
+                'message': notif.message or '',
+                'link': notif.link,
+                'created_at': notif.created_at.strftime('%B %d, %Y at %I:%M %p'),
+            }
+            for notif in notifications
+        ],
+    }
+
+
+@login_required
+@require_GET
+def notification_stream(request):
+    """Server-Sent Events stream of the user's unread notifications.
+
+    Sends the current state, then a new event whenever a notification of the
+    user is created, read or deleted. The stream closes after
+    NOTIFICATION_STREAM_MAX_SECONDS; EventSource reconnects on its own.
+    """
+    user = request.user
+    max_seconds = getattr(settings, 'NOTIFICATION_STREAM_MAX_SECONDS', 55)
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+
+    def events():
+        version = broker.version(user.pk)
+        deadline = time.monotonic() + max_seconds
+        yield 'retry: 3000\n\n'
+        yield f'event: notifications\ndata: {json.dumps(_unread_payload(user, version))}\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            latest = broker.wait(user.pk, version, min(heartbeat, remaining))
+            if latest == version:
+                # comment line keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            version = latest
+            yield f'event: notifications\ndata: {json.dumps(_unread_payload(user, version))}\n\n'
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_GET
+def notification_poll(request):
+    """Long-poll fallback for clients without EventSource.
+
+    With ?since=<version> from the previous reply the request waits up to
+    NOTIFICATION_POLL_TIMEOUT seconds for a change before answering.
+    """
+    version = broker.version(request.user.pk)
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'since must be an integer'}, status=400)
+        if since == version:
+            version = broker.wait(request.user.pk, since, getattr(settings, 'NOTIFICATION_POLL_TIMEOUT', 25))
+    return JsonResponse({'success': True, **_unread_payload(request.user, version)})
+
+
+@login_required
+@require_POST
+def mark_notification_read(request, notification_id):
+    """Mark one of the user's notifications read"""
+    updated = mark_notifications_read(request.user, [notification_id])
+    return JsonResponse({'success': True, 'updated': updated, 'unread_count': get_unread_count(request.user)})
+
+
+@login_required
+@require_POST
+def mark_all_notifications_read(request):
+    """Mark every unread notification of the user read with a single UPDATE.
+
+    Optional `ids` (repeated or comma separated) limits it to those notifications.
+    """
+    raw_ids = ','.join(request.POST.getlist('ids'))
+    try:
+        ids = [int(value) for value in raw_ids.split(',') if value.strip()] or None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'ids must be integers'}, status=400)
+    updated = mark_notifications_read(request.user, ids)
+    return JsonResponse({'success': True, 'updated': updated, 'unread_count': get_unread_count(request.user)})
@@ -8,10 +8,11 @@ from students.models import Student
 from users.decorators import parent_required
 from users.models import User, StudentParent
 from subjects.models import Subject, Enrollment
-from ranks.models import Grade
+from ranks.models import Grade, get_class_rank
 from django.db.utils import OperationalError
 from payments.models import Payment
-from notifications.models import Announcement
+from notifications.models import Announcement, ANNOUNCEMENT_PAGE_SIZE, visible_announcements
+from notifications.push import get_unread_count
 from django.utils import timezone
 from .models import ChildLinkRequest
 
@@ -173,7 +174,7 @@ def parent_dashboard(request):
     # Get unread notifications for the parent
     from notifications.models import Notification
     unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    unread_count = get_unread_count(request.user)
     
     context = {
         'children_data': children_data,
@@ -250,23 +251,11 @@ def child_ranks(request, student_id):
     from ranks.models import calculate_student_average, rank_students_for_subject
     avg = calculate_student_average(child)
 
-    # Compute class rank among students in same grade (if available)
+    # Class rank among students in same grade, from the materialized ClassRank table
     class_rank = None
     try:
-        if hasattr(child, 'studentprofile') and child.studentprofile.grade_level:
-            grade_level = child.studentprofile.grade_level
-            peers = User.objects.filter(role='student', studentprofile__grade_level=grade_level)
-            peer_averages = []
-            for peer in peers:
-                peer_avg = calculate_student_average(peer)
-                if peer_avg is not None:
-                    peer_averages.append((peer.id, peer_avg))
-            # sort descending
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            for idx, (peer_id, pa) in enumerate(peer_averages, start=1):
-                if peer_id == child.id:
-                    class_rank = idx
-                    break
+        rank_row = get_class_rank(child)
+        class_rank = rank_row.rank if rank_row else None
     except Exception:
         class_rank = None
 
@@ -333,36 +322,12 @@ def child_fees(request, student_id):
 @parent_required
 def school_announcements(request):
     """View school announcements relevant to parents"""
-    # FIXED: Replace contains lookup with database-agnostic approach
     try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter in Python instead of using contains lookup
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                # If it's stored as a string, try to parse it
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    # If parsing fails, treat as comma-separated
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets parents or is for everyone
-            # Empty list or no target_roles means show to all
-            if not target_roles or len(target_roles) == 0 or 'parent' in target_roles:
-                relevant_announcements.append(announcement)
-                
+        # Active announcements targeting parents (or everyone), filtered in the database
+        relevant_announcements = list(visible_announcements('parent')[:ANNOUNCEMENT_PAGE_SIZE])
     except Exception as e:
         # Fallback: get all active announcements if there's an error
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
+        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:ANNOUNCEMENT_PAGE_SIZE]
         print(f"Error filtering announcements: {e}")
     
     context = {
@@ -498,26 +463,8 @@ def parent_progress_overview(request):
             # Calculate class rank
             class_rank = None
             try:
-                if hasattr(child, 'studentprofile') and child.studentprofile.grade_level:
-                    grade_level = child.studentprofile.grade_level
-                    peers = User.objects.filter(
-                        role='student',
-                        studentprofile__grade_level=grade_level
-                    )
-                    peer_data = []
-                    for peer in peers:
-                        peer_enrollments = Enrollment.objects.filter(student=peer)
-                        _, _, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                        if peer_avg is not None:
-                            peer_data.append({
-                                'student_id': peer.id,
-                                'average': peer_avg
-                            })
-                    peer_data.sort(key=lambda x: x['average'], reverse=True)
-                    for idx, peer in enumerate(peer_data, start=1):
-                        if peer['student_id'] == child.id:
-                            class_rank = idx
-                            break
+                rank_row = get_class_rank(child)
+                class_rank = rank_row.rank if rank_row else None
             except Exception:
                 pass
             
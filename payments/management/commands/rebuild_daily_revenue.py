@@ -0,0 +1,11 @@
+# payments/management/commands/rebuild_daily_revenue.py
+from django.core.management.base import BaseCommand
+from payments.models import rebuild_daily_revenue
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily revenue rollup from payments (after bulk payment imports or updates)'
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_revenue()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily revenue: {rows} rows'))
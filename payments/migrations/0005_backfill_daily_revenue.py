@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def forwards(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    DailyRevenue = apps.get_model('payments', 'DailyRevenue')
+
+    totals = (
+        Payment.objects.annotate(day=TruncDate('payment_date'))
+        .values('day', 'fee_structure_id', 'status')
+        .annotate(payment_count=Count('id'), amount_total=Sum('amount_paid'))
+        .order_by()
+    )
+    DailyRevenue.objects.bulk_create(
+        [
+            DailyRevenue(date=row['day'], fee_structure_id=row['fee_structure_id'], status=row['status'],
+                         payment_count=row['payment_count'], amount_total=row['amount_total'] or 0)
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+def reverse(apps, schema_editor):
+    apps.get_model('payments', 'DailyRevenue').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_dailyrevenue'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, reverse),
+    ]
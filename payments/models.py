@@ -1,4 +1,11 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from users.models import User
 
 class FeeStructure(models.Model):
@@ -26,5 +33,163 @@ class Payment(models.Model):
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    class Meta:
+        indexes = [
+            # fee tracking pages and date-range reports walk payments newest first
+            models.Index(fields=['-payment_date', '-id'], name='payment_date_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.username} - ${self.amount_paid}"
+
+
+class DailyRevenue(models.Model):
+    """Number and sum of payments per (day, fee structure, status).
+
+    Kept in step with Payment by the receivers below, so finance reports sum
+    a few rows per day instead of scanning payments. Days are local dates,
+    the same as payment_date__date.
+    """
+    date = models.DateField()
+    fee_structure = models.ForeignKey(FeeStructure, on_delete=models.CASCADE, related_name='daily_revenue')
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    payment_count = models.PositiveIntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'fee_structure', 'status'], name='payment_daily_revenue_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'date'], name='payment_daily_rev_status_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.student.username} - ${self.amount_paid}"
\ No newline at end of file
+        return f"{self.date} {self.fee_structure_id} {self.status}: {self.payment_count} / ${self.amount_total}"
+
+
+def record_revenue_changes(changes):
+    """Apply ((date, fee_structure_id, status, amount), +1 or -1) changes to DailyRevenue.
+
+    One UPDATE per touched row; a row is created only when payments are
+    added to it, never for a removal (its fee structure may be being deleted).
+    """
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for (day, fee_structure_id, status, amount), sign in changes:
+        delta = deltas[(day, fee_structure_id, status)]
+        delta[0] += sign
+        delta[1] += sign * amount
+    for (day, fee_structure_id, status), (count, amount) in deltas.items():
+        if not count and not amount:
+            continue
+        row = DailyRevenue.objects.filter(date=day, fee_structure_id=fee_structure_id, status=status)
+        values = {'payment_count': F('payment_count') + count, 'amount_total': F('amount_total') + amount}
+        if not row.update(**values) and count > 0:
+            # insert an empty row (a concurrent writer may win), then add to it
+            DailyRevenue.objects.bulk_create(
+                [DailyRevenue(date=day, fee_structure_id=fee_structure_id, status=status)],
+                ignore_conflicts=True,
+            )
+            row.update(**values)
+
+
+def update_pending_payments(payments, status):
+    """Move the pending payments of a queryset to `status`; returns the ids that changed.
+
+    The status change is a single UPDATE ... WHERE status='pending' and the
+    daily revenue rollup is adjusted in the same transaction. Rows are
+    locked first, so a concurrent approval cannot change one in between.
+    """
+    with transaction.atomic():
+        rows = list(
+            payments.filter(status='pending').select_for_update()
+            .values_list('id', 'payment_date', 'fee_structure_id', 'amount_paid')
+        )
+        ids = [row[0] for row in rows]
+        if not ids:
+            return []
+        updated = Payment.objects.filter(id__in=ids, status='pending').update(status=status)
+        if updated != len(ids):
+            # only possible without row locks (SQLite serializes writers instead)
+            rebuild_daily_revenue()
+            return list(Payment.objects.filter(id__in=ids, status=status).values_list('id', flat=True))
+        changes = []
+        for _, payment_date, fee_structure_id, amount in rows:
+            day = _revenue_day(payment_date)
+            changes.append(((day, fee_structure_id, 'pending', amount), -1))
+            changes.append(((day, fee_structure_id, status, amount), 1))
+        record_revenue_changes(changes)
+    return ids
+
+
+def rebuild_daily_revenue():
+    """Recompute DailyRevenue from Payment; for repairs after bulk payment writes."""
+    totals = (
+        Payment.objects.annotate(day=TruncDate('payment_date'))
+        .values('day', 'fee_structure_id', 'status')
+        .annotate(payment_count=Count('id'), amount_total=Sum('amount_paid'))
+        .order_by()
+    )
+    with transaction.atomic():
+        DailyRevenue.objects.all().delete()
+        DailyRevenue.objects.bulk_create(
+            [
+                DailyRevenue(date=row['day'], fee_structure_id=row['fee_structure_id'], status=row['status'],
+                             payment_count=row['payment_count'], amount_total=row['amount_total'] or 0)
+                for row in totals
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+# Keep DailyRevenue in sync with single-payment writes (queryset.update() and
+# bulk_create skip these; use update_pending_payments or run
+# rebuild_daily_revenue afterwards).
+# The apps have no AppConfig.ready(), so receivers are registered here.
+
+def _revenue_day(payment_date):
+    return timezone.localdate(payment_date) if timezone.is_aware(payment_date) else payment_date.date()
+
+
+def _revenue_key(payment):
+    # read from __dict__ so deferred fields are never loaded just to be remembered
+    values = payment.__dict__
+    fields = ('payment_date', 'fee_structure_id', 'status', 'amount_paid')
+    if any(values.get(field) is None for field in fields):
+        return None
+    return (_revenue_day(values['payment_date']), values['fee_structure_id'], values['status'], Decimal(str(values['amount_paid'])))
+
+
+def _stored_revenue_key(payment):
+    """Key of the payment as saved in the database, for instances loaded with deferred fields."""
+    stored = Payment.objects.filter(pk=payment.pk).first()
+    return _revenue_key(stored) if stored else None
+
+
+@receiver(post_init, sender=Payment)
+def _remember_revenue_key(sender, instance, **kwargs):
+    instance._revenue_key = _revenue_key(instance)
+
+
+@receiver([pre_save, pre_delete], sender=Payment)
+def _complete_revenue_key(sender, instance, **kwargs):
+    if instance.pk and not instance._state.adding and instance._revenue_key is None:
+        instance._revenue_key = _stored_revenue_key(instance)
+
+
+@receiver(post_save, sender=Payment)
+def _update_revenue_on_payment_save(sender, instance, created=False, **kwargs):
+    old_key = None if created else instance._revenue_key
+    new_key = _revenue_key(instance)
+    if new_key is None and not created:
+        new_key = _stored_revenue_key(instance)
+    if old_key != new_key:
+        record_revenue_changes([(key, sign) for key, sign in ((old_key, -1), (new_key, 1)) if key])
+    instance._revenue_key = new_key
+
+
+@receiver(post_delete, sender=Payment)
+def _update_revenue_on_payment_delete(sender, instance, **kwargs):
+    if instance._revenue_key:
+        record_revenue_changes([(instance._revenue_key, -1)])
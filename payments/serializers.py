@@ -1,12 +1,13 @@
 from rest_framework import serializers
+from sims.api import FieldSelectionMixin
 from .models import FeeStructure, Payment
 
-class FeeStructureSerializer(serializers.ModelSerializer):
+class FeeStructureSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = FeeStructure
         fields = "__all__"
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = "__all__"
@@ -2,6 +2,7 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from sims.api import StudentFilterMixin
 from .models import FeeStructure, Payment
 from .serializers import FeeStructureSerializer, PaymentSerializer
 import uuid
@@ -11,7 +12,7 @@ class FeeStructureViewSet(viewsets.ModelViewSet):
     serializer_class = FeeStructureSerializer
     permission_classes = [IsAuthenticated]
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(StudentFilterMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
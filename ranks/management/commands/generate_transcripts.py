@@ -0,0 +1,45 @@
+# ranks/management/commands/generate_transcripts.py
+from django.core.management.base import BaseCommand, CommandError
+from ranks.models import ALL_TERMS
+from ranks.transcripts import build_transcript_batch
+
+
+class Command(BaseCommand):
+    help = 'Render the PDF transcripts of a whole grade level into one ZIP (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grade-level', type=int, required=True, help='Grade level to render')
+        parser.add_argument('--academic-year', default=ALL_TERMS, help='Academic year (e.g. 2024-2025); all terms by default')
+        parser.add_argument('--semester', default=ALL_TERMS, help='Semester; all terms by default')
+        parser.add_argument('--output-dir', help='Working directory for the PDFs, manifest and ZIP')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        last_reported = [-1]
+
+        def progress(done, total):
+            # report every 5% and at the end
+            step = max(1, total // 20)
+            if done == total or done - last_reported[0] >= step:
+                last_reported[0] = done
+                self.stdout.write(f'{done}/{total} transcripts rendered')
+
+        try:
+            manifest = build_transcript_batch(
+                options['grade_level'],
+                options['academic_year'],
+                options['semester'],
+                output_dir=options.get('output_dir'),
+                workers=options.get('workers'),
+                progress=progress,
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        failed = {key: entry for key, entry in manifest['students'].items() if entry['status'] == 'failed'}
+        for key, entry in failed.items():
+            self.stdout.write(self.style.WARNING(f"Student {key}: {entry.get('error')}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {manifest['total'] - len(failed)} transcripts to {manifest['zip']}"
+            + (f" ({len(failed)} failed)" if failed else '')
+        ))
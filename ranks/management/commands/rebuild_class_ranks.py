@@ -0,0 +1,37 @@
+# ranks/management/commands/rebuild_class_ranks.py
+from django.core.management.base import BaseCommand
+from subjects.models import Enrollment
+from users.models import StudentProfile
+from ranks.models import ALL_TERMS, refresh_class_ranks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized ClassRank table (cumulative and per-term ranks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grade-level', type=int, help='Only rebuild this grade level')
+        parser.add_argument('--academic-year', help='Only rebuild this academic year (e.g. 2024-2025)')
+        parser.add_argument('--semester', help='Only rebuild this semester (first/second)')
+
+    def handle(self, *args, **options):
+        grade_levels = StudentProfile.objects.order_by('grade_level').values_list('grade_level', flat=True).distinct()
+        if options.get('grade_level') is not None:
+            grade_levels = [options['grade_level']]
+
+        terms_qs = Enrollment.objects.order_by()
+        if options.get('academic_year'):
+            terms_qs = terms_qs.filter(academic_year=options['academic_year'])
+        if options.get('semester'):
+            terms_qs = terms_qs.filter(semester=options['semester'])
+        terms = set(terms_qs.values_list('academic_year', 'semester').distinct())
+        if not options.get('academic_year') and not options.get('semester'):
+            terms.add((ALL_TERMS, ALL_TERMS))
+
+        rebuilt = 0
+        for grade_level in grade_levels:
+            for academic_year, semester in sorted(terms):
+                rows = refresh_class_ranks(grade_level, academic_year, semester)
+                rebuilt += len(rows)
+                self.stdout.write(f'Grade {grade_level} {academic_year}/{semester}: {len(rows)} students ranked')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} class rank rows'))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 04:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ranks', '0003_grade_assignment_score_grade_final_exam_score_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade_level', models.IntegerField()),
+                ('academic_year', models.CharField(max_length=20)),
+                ('semester', models.CharField(max_length=20)),
+                ('total', models.FloatField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('average', models.FloatField(blank=True, null=True)),
+                ('rank', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(limit_choices_to={'role': 'student'}, on_delete=django.db.models.deletion.CASCADE, related_name='class_ranks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='classrank',
+            index=models.Index(fields=['student', 'academic_year', 'semester'], name='ranks_class_student_term_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='classrank',
+            unique_together={('grade_level', 'academic_year', 'semester', 'student')},
+        ),
+    ]
@@ -1,10 +1,24 @@
-from django.db import models
+import math
+import time
+from collections import defaultdict
+from django.db import models, transaction
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, StdDev, Sum, Window
+from django.db.models.functions import Cast, Rank
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db.utils import IntegrityError, OperationalError
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from subjects.models import Subject
+from subjects.models import Subject, Enrollment
+from users.models import StudentProfile
 
 User = get_user_model()
 
+# Sentinel stored in ClassRank.academic_year/semester for the cumulative
+# ranking across every term (the rank shown on transcripts).
+ALL_TERMS = 'all'
+
 class Grade(models.Model):
     """Numeric score model for primary students. Keeps compatibility by exposing
     a `grade` property (letter) and `get_grade_point()` helper used in views.
@@ -107,44 +121,630 @@ class Transcript(models.Model):
         return self.gpa
 
 
+def weighted_average_queryset(students=None):
+    """Per-student credit-weighted average score, computed in the database.
+
+    Returns a lazy values queryset of {'student': id, 'weighted_average': float,
+    'total_credits': int}; pass `students` (queryset or ids) to narrow it.
+    Ungraded subjects and subjects without credit hours are ignored, matching
+    `calculate_student_average`.
+    """
+    qs = Grade.objects.filter(score__isnull=False, subject__credit_hours__gt=0)
+    if students is not None:
+        qs = qs.filter(student__in=students)
+    return qs.values('student').annotate(
+        total_credits=Sum('subject__credit_hours'),
+        weighted_average=Cast(Sum(F('score') * F('subject__credit_hours')), FloatField())
+        / Cast(Sum('subject__credit_hours'), FloatField()),
+    ).order_by('student')
+
+
+def weighted_average_ranking(grade_level=None):
+    """Rank students by credit-weighted average within their grade level.
+
+    Lazy values queryset with 'student', 'grade_level', 'weighted_average' and
+    a competition 'rank' (ties share a rank) from `Window(Rank())`, ordered by
+    grade level then rank.
+    """
+    qs = Grade.objects.filter(score__isnull=False, subject__credit_hours__gt=0, student__studentprofile__isnull=False)
+    if grade_level is not None:
+        qs = qs.filter(student__studentprofile__grade_level=grade_level)
+    return qs.values('student', grade_level=F('student__studentprofile__grade_level')).annotate(
+        weighted_average=Cast(Sum(F('score') * F('subject__credit_hours')), FloatField())
+        / Cast(Sum('subject__credit_hours'), FloatField()),
+    ).annotate(
+        rank=Window(
+            Rank(),
+            partition_by=F('student__studentprofile__grade_level'),
+            order_by=F('weighted_average').desc(),
+        ),
+    ).order_by('grade_level', 'rank', 'student')
+
+
 def calculate_student_average(student, academic_year=None, semester=None):
     """Compute the weighted average numeric score for a student across subjects.
     If academic_year/semester provided, filter enrollments or grades accordingly (if such fields exist).
     """
-    qs = Grade.objects.filter(student=student)
-    # If filtering by academic_year/semester is desired and Grades store such info, add filters here.
-    total_points = 0.0
-    total_credits = 0
-    for g in qs.select_related('subject'):
-        if g.score is None:
-            continue
-        credits = getattr(g.subject, 'credit_hours', 0) or 0
-        total_points += g.score * credits
-        total_credits += credits
-    if total_credits == 0:
+    # Grades carry no term, so academic_year/semester are accepted but not applied.
+    row = weighted_average_queryset([student]).first()
+    if row is None:
         return None
     # Return average as numeric out of 100
-    return total_points / total_credits
+    return row['weighted_average']
+
+
+def subject_ranking_queryset(subject):
+    """Lazy Grade queryset for a subject annotated with a competition `rank`
+    (ties share a rank), ordered best score first."""
+    return Grade.objects.filter(subject=subject, score__isnull=False).select_related('student').annotate(
+        rank=Window(Rank(), order_by=F('score').desc()),
+    ).order_by('rank', 'student_id')
 
 
 def rank_students_for_subject(subject, academic_year=None, semester=None):
     """Return list of (student, score, rank) ordered by score desc for a given subject."""
-    qs = Grade.objects.filter(subject=subject).select_related('student')
-    # optionally filter by academic_year/semester
-    scored = [g for g in qs if g.score is not None]
-    scored.sort(key=lambda x: x.score, reverse=True)
-    results = []
-    last_score = None
-    last_rank = 0
-    idx = 0
-    for g in scored:
-        idx += 1
-        if g.score == last_score:
-            rank = last_rank
-        else:
-            rank = idx
-            last_rank = rank
-            last_score = g.score
-        results.append((g.student, g.score, rank))
-    return results
+    return [(g.student, g.score, g.rank) for g in subject_ranking_queryset(subject)]
+
+
+def subject_rank_for_score(subject, score):
+    """Competition rank a score holds in a subject, without loading the ranking."""
+    if score is None:
+        return None
+    return Grade.objects.filter(subject=subject, score__gt=score).count() + 1
+
+
+
+# Histogram buckets shared by the teacher charts and performance reports
+SCORE_BUCKETS = (
+    ('90-100', Q(score__gte=90)),
+    ('80-89', Q(score__gte=80, score__lt=90)),
+    ('70-79', Q(score__gte=70, score__lt=80)),
+    ('60-69', Q(score__gte=60, score__lt=70)),
+    ('0-59', Q(score__lt=60)),
+)
+SCORE_PERCENTILES = (25, 50, 75, 90)
+SUBJECT_STATISTICS_TIMEOUT = 60 * 60
+
+
+def _subject_statistics_version(subject_id):
+    return cache.get_or_set(f'ranks:subject_stats_version:{subject_id}', time.time_ns, None)
+
+
+def invalidate_subject_statistics(subject_id):
+    """Drop every cached statistics entry (all terms) of a subject."""
+    # bumping the version orphans all term keys at once; a timestamp never repeats
+    cache.set(f'ranks:subject_stats_version:{subject_id}', time.time_ns(), None)
+
+
+def _percentile(score_counts, total, percent):
+    """Linearly interpolated percentile from sorted [(score, count), ...]."""
+    position = (total - 1) * percent / 100
+    lower_index, upper_index = math.floor(position), math.ceil(position)
+    lower = upper = None
+    seen = 0
+    for score, count in score_counts:
+        seen += count
+        if lower is None and seen > lower_index:
+            lower = score
+        if seen > upper_index:
+            upper = score
+            break
+    return round(lower + (upper - lower) * (position - lower_index), 2)
+
+
+def subject_statistics(subject, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Score statistics of a subject for one term (or ALL_TERMS), cached.
+
+    Returns a dict with total/scored student counts, mean, min, max, standard
+    deviation, the SCORE_BUCKETS histogram and SCORE_PERCENTILES. A term
+    restricts grades to students with an approved/active enrollment in it.
+    Entries are invalidated whenever a Grade or Enrollment of the subject
+    changes.
+    """
+    subject_id = getattr(subject, 'pk', subject)
+    key = f'ranks:subject_stats:{subject_id}:{_subject_statistics_version(subject_id)}:{academic_year}:{semester}'
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    grades = Grade.objects.filter(subject_id=subject_id)
+    if academic_year != ALL_TERMS or semester != ALL_TERMS:
+        enrollments = Enrollment.objects.filter(subject_id=subject_id, status__in=['approved', 'active'])
+        if academic_year != ALL_TERMS:
+            enrollments = enrollments.filter(academic_year=academic_year)
+        if semester != ALL_TERMS:
+            enrollments = enrollments.filter(semester=semester)
+        grades = grades.filter(student_id__in=enrollments.values('student_id'))
+
+    summary = grades.aggregate(
+        total_students=Count('id'),
+        scored_students=Count('score'),
+        average_score=Avg('score'),
+        min_score=Min('score'),
+        max_score=Max('score'),
+        std_dev=StdDev('score'),
+        **{f'bucket_{label}': Count('id', filter=condition) for label, condition in SCORE_BUCKETS},
+    )
+    scored = summary['scored_students']
+    # scores are whole numbers 0-100, so percentiles come from at most 101 rows
+    score_counts = list(
+        grades.filter(score__isnull=False).values('score').annotate(count=Count('id')).order_by('score')
+        .values_list('score', 'count')
+    ) if scored else []
+
+    stats = {
+        'subject_id': subject_id,
+        'academic_year': academic_year,
+        'semester': semester,
+        'total_students': summary['total_students'],
+        'scored_students': scored,
+        'average_score': round(summary['average_score'] or 0, 2),
+        'min_score': summary['min_score'],
+        'max_score': summary['max_score'],
+        'std_dev': round(summary['std_dev'] or 0, 2),
+        'score_distribution': {label: summary[f'bucket_{label}'] for label, _ in SCORE_BUCKETS},
+        'percentiles': {
+            f'p{percent}': _percentile(score_counts, scored, percent) if scored else None
+            for percent in SCORE_PERCENTILES
+        },
+    }
+    cache.set(key, stats, SUBJECT_STATISTICS_TIMEOUT)
+    return stats
+
+
+
+LETTER_GRADE_TO_SCORE = {
+    'A+': 98,
+    'A': 95,
+    'A-': 92,
+    'B+': 88,
+    'B': 85,
+    'B-': 82,
+    'C+': 78,
+    'C': 75,
+    'C-': 72,
+    'D+': 68,
+    'D': 65,
+    'D-': 62,
+    'F': 55,
+}
+
+
+def letter_grade_to_numeric(letter):
+    """Map letter grades to an elementary-friendly 100 point scale."""
+    if not letter:
+        return None
+    return LETTER_GRADE_TO_SCORE.get(letter.strip().upper())
+
+
+def _score_enrollments(enrollments, rank_scores):
+    """
+    Score enrollments given a {subject_id: RankGrade score} map.
+    Returns (score_map, total, count, average) like `compute_numeric_scores`.
+    """
+    score_map = {}
+    total = 0.0
+    count = 0
+    for enrollment in enrollments:
+        score = rank_scores.get(enrollment.subject_id)
+        if score is None:
+            # First check enrollment.result field for numeric value
+            result_val = getattr(enrollment, 'result', None)
+            if result_val:
+                try:
+                    # Try to parse as numeric
+                    score = float(result_val)
+                except (ValueError, TypeError):
+                    # If not numeric, fall back to letter grade conversion
+                    score = letter_grade_to_numeric(getattr(enrollment, 'final_grade', None))
+            else:
+                # Fall back to letter grade conversion
+                score = letter_grade_to_numeric(getattr(enrollment, 'final_grade', None))
+        if score is not None:
+            score = float(score)
+            total += score
+            count += 1
+        score_map[enrollment.id] = score
+
+    average = round(total / count, 2) if count else None
+    return score_map, round(total, 2), count, average
+
+
+def compute_numeric_scores(student, enrollments):
+    """
+    Return a tuple of (score_map, total, count, average) for the given enrollments.
+    score_map maps enrollment.id -> numeric score (0-100) or None.
+    """
+    subject_ids = [en.subject_id for en in enrollments if getattr(en, 'subject_id', None)]
+    rank_scores = {}
+    if subject_ids:
+        try:
+            rank_scores = {
+                rg.subject_id: rg.score
+                for rg in Grade.objects.filter(student=student, subject_id__in=subject_ids)
+            }
+        except Exception:
+            rank_scores = {}
+
+    return _score_enrollments(enrollments, rank_scores)
+
+
+def compute_numeric_scores_bulk(students=None, grade_level=None, academic_year=ALL_TERMS,
+                                semester=ALL_TERMS, enrollments=None):
+    """
+    Set-based `compute_numeric_scores` for many students at once.
+
+    Pass `students` (a queryset or iterable of users/ids) or a `grade_level`;
+    `academic_year`/`semester` narrow the enrollments that are scored. Callers
+    that already hold the enrollments (e.g. prefetched) can pass them instead.
+    Uses one query for enrollments and one for ranks grades, whatever the
+    number of students.
+
+    Returns {student_id: (score_map, total, count, average)}; students without
+    enrollments map to ({}, 0.0, 0, None).
+    """
+    if students is None:
+        if grade_level is None:
+            raise ValueError('compute_numeric_scores_bulk needs students or a grade_level')
+        students = User.objects.filter(role='student', studentprofile__grade_level=grade_level)
+    if isinstance(students, models.QuerySet):
+        student_ids = list(students.values_list('pk', flat=True))
+    else:
+        student_ids = [getattr(student, 'pk', student) for student in students]
+
+    if enrollments is None:
+        enrollments = Enrollment.objects.filter(student_id__in=student_ids)
+        if academic_year != ALL_TERMS:
+            enrollments = enrollments.filter(academic_year=academic_year)
+        if semester != ALL_TERMS:
+            enrollments = enrollments.filter(semester=semester)
+    enrollments_by_student = defaultdict(list)
+    for enrollment in enrollments:
+        enrollments_by_student[enrollment.student_id].append(enrollment)
+
+    subject_ids = {
+        enrollment.subject_id
+        for student_enrollments in enrollments_by_student.values()
+        for enrollment in student_enrollments
+        if enrollment.subject_id
+    }
+    rank_scores = defaultdict(dict)
+    if subject_ids:
+        try:
+            grade_rows = Grade.objects.filter(
+                student_id__in=list(enrollments_by_student), subject_id__in=subject_ids
+            ).values_list('student_id', 'subject_id', 'score')
+            for student_id, subject_id, score in grade_rows:
+                rank_scores[student_id][subject_id] = score
+        except Exception:
+            rank_scores = defaultdict(dict)
+
+    return {
+        student_id: _score_enrollments(enrollments_by_student.get(student_id, []), rank_scores.get(student_id, {}))
+        for student_id in student_ids
+    }
+
+
+def build_rank_map(entries):
+    """
+    entries: iterable of {'student_id': id, 'grade_level': grade, 'average': value}
+    returns {student_id: rank}
+    """
+    grade_groups = defaultdict(list)
+    for entry in entries:
+        grade = entry.get('grade_level')
+        avg = entry.get('average')
+        student_id = entry.get('student_id')
+        if grade is None or avg is None or student_id is None:
+            continue
+        grade_groups[grade].append((student_id, avg))
+
+    rank_map = {}
+    for grade, students in grade_groups.items():
+        students.sort(key=lambda item: item[1], reverse=True)
+        rank = 0
+        previous = None
+        for idx, (student_id, avg) in enumerate(students, start=1):
+            if previous != avg:
+                rank = idx
+                previous = avg
+            rank_map[student_id] = rank
+    return rank_map
+
+
+class ClassRank(models.Model):
+    """Materialized class rank of a student among the peers of their grade.
+
+    One row per (grade_level, academic_year, semester, student), rebuilt per
+    cohort by `refresh_class_ranks` whenever a Grade or an Enrollment result
+    changes, so rank-displaying views only need one indexed lookup. Rows with
+    academic_year/semester set to `ALL_TERMS` hold the cumulative rank.
+    """
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='class_ranks', limit_choices_to={'role': 'student'})
+    grade_level = models.IntegerField()
+    academic_year = models.CharField(max_length=20)
+    semester = models.CharField(max_length=20)
+    total = models.FloatField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    average = models.FloatField(null=True, blank=True)
+    rank = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['grade_level', 'academic_year', 'semester', 'student']
+        indexes = [
+            models.Index(fields=['student', 'academic_year', 'semester'], name='ranks_class_student_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.username} - Grade {self.grade_level} {self.academic_year}/{self.semester}: #{self.rank}"
+
+
+def refresh_class_ranks(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Rebuild the ClassRank rows of one grade cohort for a term.
+
+    Averages follow `compute_numeric_scores` and ranks follow `build_rank_map`
+    (ties share a rank, students without scores are unranked).
+    Returns the list of rows written.
+    """
+    scores = compute_numeric_scores_bulk(grade_level=grade_level, academic_year=academic_year, semester=semester)
+
+    rows = []
+    for student_id, (_, total, graded_count, average) in scores.items():
+        rows.append(ClassRank(
+            student_id=student_id,
+            grade_level=grade_level,
+            academic_year=academic_year,
+            semester=semester,
+            total=total,
+            graded_count=graded_count,
+            average=average,
+        ))
+
+    rank_map = build_rank_map(
+        {'student_id': row.student_id, 'grade_level': grade_level, 'average': row.average}
+        for row in rows
+    )
+    for row in rows:
+        row.rank = rank_map.get(row.student_id)
+
+    with transaction.atomic():
+        ClassRank.objects.filter(grade_level=grade_level, academic_year=academic_year, semester=semester).delete()
+        ClassRank.objects.bulk_create(rows)
+    return rows
+
+
+def class_rank_cohorts_for_students(student_ids):
+    """Return the (grade_level, academic_year, semester) cohorts the given students affect.
+
+    Covers the cumulative ranking plus each term a student is enrolled in or
+    still has rows for, for the student's current grade and any grade they
+    still have rows in. Uses three queries however many students are passed.
+    """
+    student_ids = list(student_ids)
+    grade_levels = defaultdict(set)
+    terms = defaultdict(lambda: {(ALL_TERMS, ALL_TERMS)})
+    rank_rows = ClassRank.objects.filter(student_id__in=student_ids).order_by().values_list('student_id', 'grade_level', 'academic_year', 'semester').distinct()
+    for student_id, grade_level, academic_year, semester in rank_rows:
+        grade_levels[student_id].add(grade_level)
+        # the term's last enrollment may just have been deleted
+        terms[student_id].add((academic_year, semester))
+    for student_id, grade_level in StudentProfile.objects.filter(user_id__in=student_ids).values_list('user_id', 'grade_level'):
+        grade_levels[student_id].add(grade_level)
+    for student_id, academic_year, semester in Enrollment.objects.filter(student_id__in=student_ids).order_by().values_list('student_id', 'academic_year', 'semester').distinct():
+        terms[student_id].add((academic_year, semester))
+    return {
+        (grade_level, academic_year, semester)
+        for student_id, levels in grade_levels.items()
+        for grade_level in levels
+        for academic_year, semester in terms[student_id]
+    }
+
+
+def class_rank_cohorts_for_student(student_id):
+    """Return the (grade_level, academic_year, semester) cohorts a student affects."""
+    return class_rank_cohorts_for_students([student_id])
+
+
+def refresh_class_ranks_for_student(student_id):
+    """Rebuild every cohort the given student belongs to (or belonged to)."""
+    for cohort in class_rank_cohorts_for_student(student_id):
+        refresh_class_ranks(*cohort)
+
+
+def _cohort_materialized(grade_level, academic_year, semester):
+    return ClassRank.objects.filter(grade_level=grade_level, academic_year=academic_year, semester=semester).exists()
+
+
+def get_class_rank(student, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Return the ClassRank row for a student's current grade, or None.
+
+    A single indexed query on the hot path; a cohort that was never
+    materialized is built on first access. Students left out of a built
+    cohort (no profile row, or not a student account) get None without a
+    rebuild.
+    """
+    row = ClassRank.objects.filter(
+        student=student,
+        academic_year=academic_year,
+        semester=semester,
+        grade_level=F('student__studentprofile__grade_level'),
+    ).first()
+    if row is not None:
+        return row
+    grade_level = StudentProfile.objects.filter(user=student).values_list('grade_level', flat=True).first()
+    if grade_level is None or _cohort_materialized(grade_level, academic_year, semester):
+        return None
+    for row in refresh_class_ranks(grade_level, academic_year, semester):
+        if row.student_id == student.id:
+            return row
+    return None
+
+
+def get_class_rank_map(student_ids, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Return {student_id: rank} for many students with one indexed query.
+
+    Cohorts that were never materialized are built on first access; students
+    missing from a built cohort are left out of the map.
+    """
+    student_ids = list(student_ids)
+    rank_map = dict(ClassRank.objects.filter(
+        student_id__in=student_ids,
+        academic_year=academic_year,
+        semester=semester,
+        grade_level=F('student__studentprofile__grade_level'),
+    ).values_list('student_id', 'rank'))
+    missing = [sid for sid in student_ids if sid not in rank_map]
+    if missing:
+        grade_levels = set(StudentProfile.objects.filter(user_id__in=missing).values_list('grade_level', flat=True))
+        grade_levels -= set(
+            ClassRank.objects.filter(grade_level__in=grade_levels, academic_year=academic_year, semester=semester)
+            .order_by().values_list('grade_level', flat=True).distinct()
+        )
+        for grade_level in grade_levels:
+            for row in refresh_class_ranks(grade_level, academic_year, semester):
+                rank_map[row.student_id] = row.rank
+    return rank_map
+
+
+# Keep ClassRank in sync with the inputs of compute_numeric_scores.
+# The apps have no AppConfig.ready(), so receivers are registered here.
+# Changed students and cohorts are collected in one pending set per database
+# connection and rebuilt after the surrounding transaction commits, so many
+# saves in one transaction rebuild each cohort once, and a cascade delete of
+# a student never races with rows being re-inserted for them.
+
+def _flush_class_rank_refresh(pending):
+    connection = transaction.get_connection()
+    if getattr(connection, '_pending_class_rank_refresh', None) is pending:
+        connection._pending_class_rank_refresh = None
+    cohorts = set(pending['cohorts'])
+    try:
+        if pending['students']:
+            cohorts |= class_rank_cohorts_for_students(pending['students'])
+        for cohort in cohorts:
+            try:
+                refresh_class_ranks(*cohort)
+            except IntegrityError:
+                # a concurrent refresh rebuilt the cohort
+                pass
+    except OperationalError:
+        # table not migrated yet
+        pass
+
+
+def _schedule_class_rank_refresh(cohorts=(), student_ids=()):
+    connection = transaction.get_connection()
+    pending = getattr(connection, '_pending_class_rank_refresh', None)
+    # a rollback drops the flush callback together with the changes it was for
+    if pending is not None and any(func is pending['flush'] for _, func, _ in connection.run_on_commit):
+        pending['cohorts'].update(cohorts)
+        pending['students'].update(student_ids)
+        return
+    pending = {'cohorts': set(cohorts), 'students': set(student_ids)}
+    pending['flush'] = lambda: _flush_class_rank_refresh(pending)
+    connection._pending_class_rank_refresh = pending
+    # outside a transaction this runs right away
+    transaction.on_commit(pending['flush'])
+
+
+def _schedule_student_refresh(student_id):
+    _schedule_class_rank_refresh(student_ids=[student_id])
+
+
+_ENROLLMENT_RANK_FIELDS = ('student_id', 'subject_id', 'academic_year', 'semester', 'result', 'final_grade')
+
+
+def _rank_inputs(enrollment):
+    # read from __dict__ so deferred fields are never loaded just to be remembered
+    return tuple(enrollment.__dict__.get(field) for field in _ENROLLMENT_RANK_FIELDS)
+
+
+@receiver(post_init, sender=Enrollment)
+def _remember_enrollment_rank_inputs(sender, instance, **kwargs):
+    instance._rank_inputs = _rank_inputs(instance)
+
+
+@receiver(post_init, sender=StudentProfile)
+def _remember_profile_grade_level(sender, instance, **kwargs):
+    instance._rank_grade_level = instance.__dict__.get('grade_level')
+
+
+def notify_grades_changed(student_ids, subject_ids):
+    """Refresh ranks and statistics after bulk grade/enrollment writes.
+
+    bulk_create, bulk_update and queryset.update() skip model signals, so bulk
+    writers call this once with every student and subject they touched.
+    The work runs after the surrounding transaction commits.
+    """
+    student_ids, subject_ids = set(student_ids), set(subject_ids)
+    if student_ids:
+        _schedule_class_rank_refresh(student_ids=student_ids)
+        _schedule_transcript_invalidation(student_ids)
+    for subject_id in subject_ids:
+        _schedule_subject_statistics_invalidation(subject_id)
+
+
+def _schedule_transcript_invalidation(student_ids):
+    # cached PDFs are keyed by content, so this only frees disk space early;
+    # after commit, so a concurrent download cannot re-cache old results
+    def invalidate():
+        from .transcripts import invalidate_transcript_cache
+        invalidate_transcript_cache(student_ids)
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def _refresh_ranks_on_grade_change(sender, instance, **kwargs):
+    _schedule_student_refresh(instance.student_id)
+    _schedule_transcript_invalidation([instance.student_id])
+
+
+@receiver(post_save, sender=Enrollment)
+def _refresh_ranks_on_enrollment_save(sender, instance, created=False, **kwargs):
+    # status-only saves do not change any score, skip them
+    if not created and instance._rank_inputs == _rank_inputs(instance):
+        return
+    instance._rank_inputs = _rank_inputs(instance)
+    _schedule_student_refresh(instance.student_id)
+    _schedule_transcript_invalidation([instance.student_id])
+
+
+@receiver(post_delete, sender=Enrollment)
+def _refresh_ranks_on_enrollment_delete(sender, instance, **kwargs):
+    _schedule_student_refresh(instance.student_id)
+    _schedule_transcript_invalidation([instance.student_id])
+
+
+@receiver(post_save, sender=StudentProfile)
+def _refresh_ranks_on_grade_level_change(sender, instance, created=False, **kwargs):
+    if not created and instance._rank_grade_level == instance.grade_level:
+        return
+    instance._rank_grade_level = instance.grade_level
+    _schedule_student_refresh(instance.user_id)
+
+
+@receiver(post_delete, sender=StudentProfile)
+def _refresh_ranks_on_profile_delete(sender, instance, **kwargs):
+    cohorts = {(instance.grade_level, ALL_TERMS, ALL_TERMS)}
+    try:
+        cohorts.update(ClassRank.objects.filter(grade_level=instance.grade_level).values_list('grade_level', 'academic_year', 'semester').distinct())
+    except OperationalError:
+        pass
+    _schedule_class_rank_refresh(cohorts)
+
+
+def _schedule_subject_statistics_invalidation(subject_id):
+    # after commit, so a concurrent reader cannot re-cache pre-commit numbers
+    transaction.on_commit(lambda: invalidate_subject_statistics(subject_id))
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def _invalidate_subject_statistics_on_grade_change(sender, instance, **kwargs):
+    _schedule_subject_statistics_invalidation(instance.subject_id)
+
 
+@receiver([post_save, post_delete], sender=Enrollment)
+def _invalidate_subject_statistics_on_enrollment_change(sender, instance, **kwargs):
+    # term statistics depend on enrollment status, so any change counts
+    _schedule_subject_statistics_invalidation(instance.subject_id)
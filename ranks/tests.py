@@ -0,0 +1,316 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ranks.transcript_pdf import render_transcript_pdf
+from ranks.transcripts import (
+    BATCH_LOCK_NAME, BatchInProgress, build_transcript_batch, collect_transcripts, transcript_cache_directory, transcript_data,
+)
+from users.models import User, StudentProfile, StudentParent
+from students.models import Student as StudentRecord
+from subjects.models import Subject, Enrollment
+from ranks.models import (
+    Grade, ClassRank, ALL_TERMS, get_class_rank, get_class_rank_map, refresh_class_ranks, compute_numeric_scores, compute_numeric_scores_bulk,
+    calculate_student_average, rank_students_for_subject, weighted_average_ranking, subject_statistics,
+)
+
+
+class ClassRankTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.math = Subject.objects.create(name='Mathematics', code='MATH301', grade_level=3)
+        self.english = Subject.objects.create(name='English', code='ENG301', grade_level=3)
+        self.students = []
+        # committed like any fixture, so the tests only capture their own refreshes
+        with self.captureOnCommitCallbacks(execute=True):
+            for idx in range(3):
+                user = User.objects.create_user(username=f'stu{idx}', password='pass', role='student')
+                StudentProfile.objects.create(user=user, student_id=f'STU{idx}', grade_level=3, academic_year='2024-2025')
+                for subject in (self.math, self.english):
+                    Enrollment.objects.create(student=user, subject=subject, academic_year='2024-2025', semester='first')
+                self.students.append(user)
+
+    def _grade(self, student, subject, score):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Grade.objects.create(student=student, subject=subject, score=score)
+
+    def test_grade_changes_refresh_materialized_ranks(self):
+        first, second, third = self.students
+        self._grade(first, self.math, 70)
+        self._grade(second, self.math, 90)
+        self._grade(third, self.math, 90)
+
+        ranks = dict(ClassRank.objects.filter(academic_year=ALL_TERMS, semester=ALL_TERMS).values_list('student_id', 'rank'))
+        self.assertEqual(ranks, {first.id: 3, second.id: 1, third.id: 1})
+        term_row = ClassRank.objects.get(student=first, academic_year='2024-2025', semester='first')
+        self.assertEqual(term_row.rank, 3)
+
+        with self.assertNumQueries(1):
+            row = get_class_rank(second)
+        self.assertEqual(row.average, 90.0)
+
+    def test_saves_in_one_transaction_rebuild_each_cohort_once(self):
+        first, second, third = self.students
+        with mock.patch('ranks.models.refresh_class_ranks', wraps=refresh_class_ranks) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                for student in self.students:
+                    Grade.objects.create(student=student, subject=self.math, score=80)
+                    Grade.objects.create(student=student, subject=self.english, score=70)
+        self.assertCountEqual([call.args for call in refresh.call_args_list], [(3, ALL_TERMS, ALL_TERMS), (3, '2024-2025', 'first')])
+        self.assertEqual(get_class_rank(third).rank, 1)
+
+    def test_unranked_profile_does_not_rebuild_a_built_cohort(self):
+        self._grade(self.students[0], self.math, 70)
+        staff = User.objects.create_user(username='staff3', password='pass', role='teacher')
+        StudentProfile.objects.create(user=staff, student_id='STAFF3', grade_level=3)
+        rank_row_ids = set(ClassRank.objects.values_list('id', flat=True))
+
+        with self.assertNumQueries(3):
+            self.assertIsNone(get_class_rank(staff))
+        self.assertEqual(get_class_rank_map([staff.id, self.students[0].id]), {self.students[0].id: 1})
+        self.assertEqual(set(ClassRank.objects.values_list('id', flat=True)), rank_row_ids)
+
+    def test_enrollment_result_change_refreshes_and_status_change_does_not(self):
+        first, second, _ = self.students
+        self._grade(first, self.math, 80)
+        enrollment = Enrollment.objects.get(student=second, subject=self.english)
+
+        rank_row_ids = set(ClassRank.objects.values_list('id', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.status = 'approved'
+            enrollment.save()
+        self.assertEqual(set(ClassRank.objects.values_list('id', flat=True)), rank_row_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.result = '95'
+            enrollment.save()
+        self.assertEqual(get_class_rank(second).rank, 1)
+        self.assertEqual(get_class_rank(first).rank, 2)
+
+    def test_deleting_ranked_student_keeps_peers_consistent(self):
+        first, second, _ = self.students
+        self._grade(first, self.math, 60)
+        self._grade(second, self.math, 99)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+
+        self.assertFalse(ClassRank.objects.filter(student_id=second.id).exists())
+        self.assertEqual(get_class_rank(first).rank, 1)
+
+    def test_bulk_scores_match_per_student_scores_in_fixed_queries(self):
+        first, second, third = self.students
+        self._grade(first, self.math, 88)
+        Enrollment.objects.filter(student=second, subject=self.math).update(result='72.5')
+        Enrollment.objects.filter(student=second, subject=self.english).update(result='n/a', final_grade='B')
+        Enrollment.objects.filter(student=third, subject=self.english).update(final_grade='A+')
+
+        with self.assertNumQueries(3):
+            bulk = compute_numeric_scores_bulk(grade_level=3)
+
+        for student in self.students:
+            enrollments = list(Enrollment.objects.filter(student=student))
+            self.assertEqual(bulk[student.id], compute_numeric_scores(student, enrollments))
+        self.assertEqual(bulk[second.id][1:], (157.5, 2, 78.75))
+
+    def test_weighted_average_and_ranks_are_computed_in_sql(self):
+        first, second, third = self.students
+        Subject.objects.filter(pk=self.english.pk).update(credit_hours=1)
+        for student, math, english in ((first, 90, 60), (second, 70, 100), (third, 80, 90)):
+            self._grade(student, self.math, math)
+            self._grade(student, self.english, english)
+
+        # (90*3 + 60*1) / 4 = 82.5, (70*3 + 100) / 4 = 77.5, (80*3 + 90) / 4 = 82.5
+        self.assertAlmostEqual(calculate_student_average(second), 77.5)
+        with self.assertNumQueries(1):
+            ranking = [(row['student'], row['weighted_average'], row['rank']) for row in weighted_average_ranking(3)]
+        self.assertEqual(ranking, [(first.id, 82.5, 1), (third.id, 82.5, 1), (second.id, 77.5, 3)])
+
+        with self.assertNumQueries(1):
+            subject_ranks = [(student.id, score, rank) for student, score, rank in rank_students_for_subject(self.english)]
+        self.assertEqual(subject_ranks, [(second.id, 100, 1), (third.id, 90, 2), (first.id, 60, 3)])
+
+    def test_subject_statistics_are_cached_until_a_grade_changes(self):
+        first, second, third = self.students
+        for student, score in ((first, 95), (second, 72), (third, 58)):
+            self._grade(student, self.math, score)
+
+        stats = subject_statistics(self.math)
+        self.assertEqual(stats['scored_students'], 3)
+        self.assertEqual((stats['min_score'], stats['max_score'], stats['average_score']), (58, 95, 75.0))
+        self.assertEqual(stats['score_distribution'], {'90-100': 1, '80-89': 0, '70-79': 1, '60-69': 0, '0-59': 1})
+        self.assertEqual(stats['percentiles']['p50'], 72)
+        self.assertEqual(stats['percentiles']['p25'], 65)
+        self.assertEqual(subject_statistics(self.math, '2023-2024', 'first')['total_students'], 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(subject_statistics(self.math), stats)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.filter(student=third, subject=self.math).first().delete()
+        self.assertEqual(subject_statistics(self.math)['scored_students'], 2)
+
+
+class TranscriptBatchTests(TestCase):
+    def setUp(self):
+        self.subjects = [Subject.objects.create(name=f'Subject {idx}', code=f'SUB70{idx}', grade_level=7) for idx in range(2)]
+        self.students = []
+        for idx in range(4):
+            user = User.objects.create_user(username=f'grade7_{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'G7{idx}', grade_level=7)
+            for subject in self.subjects:
+                Enrollment.objects.create(student=user, subject=subject, academic_year='2024-2025', semester='first')
+                Grade.objects.create(student=user, subject=subject, score=60 + idx * 10)
+            self.students.append(user)
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+
+    def test_collect_is_set_based(self):
+        get_class_rank(self.students[0], '2024-2025', 'first')  # materialize the cohort
+        with self.assertNumQueries(4):
+            transcripts = collect_transcripts(7, '2024-2025', 'first')
+        self.assertEqual([t['rank'] for t in transcripts], [4, 3, 2, 1])
+        self.assertEqual(transcripts[3]['rows'], [('Subject 0', 90.0), ('Subject 1', 90.0)])
+        self.assertEqual(transcripts[3]['term'], '2024-2025, first')
+
+    def test_batch_zip_and_resume_only_rerenders_changed_students(self):
+        manifest = build_transcript_batch(7, '2024-2025', 'first', output_dir=self.output_dir, workers=2)
+        with zipfile.ZipFile(manifest['zip']) as archive:
+            names = archive.namelist()
+            self.assertTrue(archive.read(names[0]).startswith(b'%PDF'))
+        self.assertEqual(names, [f'{student.id}_{student.username}.pdf' for student in self.students])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'manifest.json')))
+
+        grade = Grade.objects.get(student=self.students[0], subject=self.subjects[0])
+        grade.score = 65  # still last, so no other rank changes
+        with self.captureOnCommitCallbacks(execute=True):
+            grade.save()
+        calls = []
+        build_transcript_batch(7, '2024-2025', 'first', output_dir=self.output_dir, workers=1,
+                               progress=lambda done, total: calls.append((done, total)))
+        # three transcripts were reused, only the changed student was rendered again
+        self.assertEqual(calls, [(3, 4), (4, 4)])
+
+    def test_batch_directory_is_claimed_by_one_run(self):
+        lock = os.path.join(self.output_dir, BATCH_LOCK_NAME)
+        with open(lock, 'w') as handle:
+            handle.write('another run')
+        with self.assertRaises(BatchInProgress):
+            build_transcript_batch(7, '2024-2025', 'first', output_dir=self.output_dir, workers=1)
+        # a claim its run stopped refreshing is taken over, and released afterwards
+        os.utime(lock, (0, 0))
+        manifest = build_transcript_batch(7, '2024-2025', 'first', output_dir=self.output_dir, workers=1)
+        self.assertEqual(len(manifest['students']), 4)
+        self.assertFalse(os.path.exists(lock))
+
+    def test_registrar_batch_runs_in_the_background_and_is_polled(self):
+        registrar = User.objects.create_user(username='batch_registrar', password='pass', role='registrar', is_approved=True)
+        self.client.force_login(registrar)
+        filters = {'grade_level': 7, 'academic_year': '2024-2025', 'semester': 'first'}
+        with override_settings(MEDIA_ROOT=self.output_dir, TRANSCRIPT_BATCH_ASYNC=False, TRANSCRIPT_BATCH_WORKERS=1):
+            response = self.client.get(reverse('generate_transcripts'), {**filters, 'format': 'zip'})
+            self.assertEqual(response.status_code, 302)
+            status = self.client.get(reverse('transcript_batch_status'), filters).json()
+            self.assertEqual((status['state'], status['done'], status['total'], status['zip']), ('completed', 4, 4, True))
+            self.assertContains(self.client.get(reverse('generate_transcripts'), filters), 'ready (4 transcripts)')
+            response = self.client.get(reverse('download_transcript_batch'), filters)
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+    def test_detailed_transcript_uses_shared_template(self):
+        from ranks.transcript_pdf import _template
+        columns = ('Academic Year', 'Semester', 'Subject Code', 'Subject Name', 'Result (out of 100)', 'Teacher')
+        rows = [('2024-2025', 'First', 'SUB700', 'Subject 0', 90, 'TBA'), ('2024-2025', 'First', 'SUB701', 'Subject 1', None, 'TBA')]
+        transcript = transcript_data(self.students[3], rows, 1, columns=columns, academic_year='2024-2025')
+        self.assertEqual((transcript['total'], transcript['average']), (90.0, 90.0))
+        self.assertTrue(render_transcript_pdf(transcript).startswith(b'%PDF'))
+        self.assertIs(_template(), _template())
+
+
+class TranscriptCacheTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.subject = Subject.objects.create(name='Chemistry', code='CHE901', grade_level=9)
+        self.student = User.objects.create_user(username='cached', password='pass', role='student', is_approved=True)
+        StudentProfile.objects.create(user=self.student, student_id='C1', grade_level=9)
+        Enrollment.objects.create(student=self.student, subject=self.subject, academic_year='2024-2025', semester='first')
+        self.grade = Grade.objects.create(student=self.student, subject=self.subject, score=70)
+        self.client.force_login(self.student)
+        self.url = reverse('download_transcript_pdf')
+
+    def test_pdf_is_cached_revalidated_and_invalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        etag = response['ETag']
+        directory = transcript_cache_directory(self.student.id)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+        with mock.patch('ranks.transcripts.write_transcript_pdf') as write:
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            response = self.client.get(self.url)
+            response.close()
+            self.assertEqual(response['ETag'], etag)
+            write.assert_not_called()
+
+        self.grade.score = 85
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grade.save()
+        self.assertFalse(os.path.exists(directory))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        response.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class GradeApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='api_user', password='pass', role='registrar', is_approved=True)
+        self.students = [User.objects.create_user(username=f'api_student_{idx}', password='pass', role='student') for idx in range(2)]
+        subjects = [Subject.objects.create(name=f'API {idx}', code=f'API{idx}', grade_level=8) for idx in range(3)]
+        self.grades = [Grade.objects.create(student=student, subject=subject, score=70) for student in self.students for subject in subjects]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_grades_are_keyset_paginated_with_field_selection(self):
+        seen = []
+        url = '/api/grades/?page_size=4&fields=id,score'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 4)
+            self.assertTrue(all(set(row) == {'id', 'score'} for row in data['results']))
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, sorted((grade.id for grade in self.grades), reverse=True))
+
+    def test_student_filter_takes_the_profile_id_and_respects_parent_links(self):
+        # profile ids deliberately differ from the user ids the rows point at
+        profiles = [StudentRecord.objects.create(id=900 + idx, user=student, student_id=f'API-S{idx}') for idx, student in enumerate(self.students)]
+        self.assertNotEqual(profiles[0].id, self.students[0].id)
+
+        data = self.client.get('/api/grades/', {'student': profiles[0].id}).json()
+        self.assertEqual({row['student'] for row in data['results']}, {self.students[0].id})
+        self.assertEqual(len(data['results']), 3)
+
+        parent = User.objects.create_user(username='api_parent', password='pass', role='parent', is_approved=True)
+        StudentParent.objects.create(parent=parent, student=self.students[1])
+        self.client.force_authenticate(parent)
+        data = self.client.get('/api/grades/', {'student': profiles[1].id}).json()
+        self.assertEqual({row['student'] for row in data['results']}, {self.students[1].id})
+        # not their child, and not a profile id at all
+        self.assertEqual(self.client.get('/api/grades/', {'student': profiles[0].id}).json()['results'], [])
+        self.assertEqual(self.client.get('/api/grades/', {'student': self.students[1].id}).json()['results'], [])
+
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(len(self.client.get('/api/grades/', {'student': profiles[0].id}).json()['results']), 3)
+        self.assertEqual(self.client.get('/api/grades/', {'student': profiles[1].id}).json()['results'], [])
@@ -0,0 +1,209 @@
+"""PDF rendering of transcripts from plain data.
+
+Nothing here touches Django, so batch jobs can render in worker processes
+that never set up the ORM. A transcript is a dict:
+
+    {
+        'name': 'Abebe Kebede', 'student_code': 'STU001', 'grade_level': 9,
+        'term': '2024-2025, First Semester' or None,
+        'academic_year': '2024-2025' or None,
+        'generated': '2025-01-31',
+        'columns': ['Course', 'Result (out of 100)'],   # optional, this is the default
+        'rows': [('Mathematics', 87.0), ('Physics', None), ...],
+        'total': 87.0, 'average': 87.0, 'rank': 3,
+    }
+
+Row cells that are not strings are scores and print as whole numbers or N/A.
+
+Styles, table styles and the page header are built once per process
+(_template()); each document draws the static header from one PDF form
+object and the student details without Paragraph markup parsing. Most of
+what remains is ReportLab's number formatting, which the optional rl_accel
+package (`pip install rl_accel`) speeds up when installed.
+"""
+import functools
+import io
+import os
+import uuid
+
+# ReportLab is optional; callers check REPORTLAB_AVAILABLE before rendering.
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import Flowable, SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab import rl_config
+    REPORTLAB_AVAILABLE = True
+except Exception:
+    REPORTLAB_AVAILABLE = False
+
+if REPORTLAB_AVAILABLE:
+    # ASCII85 only keeps PDFs 7-bit clean for mail transports; files and HTTP
+    # responses do not need it and it costs ~15% of the render in pure Python.
+    # Process-wide, but this module is the app's only ReportLab user.
+    rl_config.useA85 = 0
+
+TITLE = 'ACADEMIC TRANSCRIPT'
+DEFAULT_COLUMNS = ('Course', 'Result (out of 100)')
+INFO_FONT_SIZE = 10
+INFO_LINE_HEIGHT = 14
+HEADER_FORM = 'transcriptHeader'
+
+
+class _Template:
+    """Everything about a transcript page that does not depend on the student."""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.normal = styles['Normal']
+        self.page_width, self.page_height = letter
+        self.margin = inch
+        # header: centred title and a rule, above the top margin
+        self.title_y = self.page_height - 0.75 * inch
+        self.rule_y = self.title_y - 12
+        self.top_margin = self.page_height - self.rule_y + 18
+        self.info_labels = ('Student Name:', 'Student ID:', 'Grade Level:', 'Term:', 'Academic Year:', 'Generated Date:')
+        self.info_label_width = max(stringWidth(label, 'Helvetica-Bold', INFO_FONT_SIZE) for label in self.info_labels) + 6
+        header_commands = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]
+        self.grades_style = TableStyle(header_commands + [('FONTSIZE', (0, 0), (-1, 0), 12)])
+        # wider tables (year, semester, code, ...) use smaller type
+        self.detailed_grades_style = TableStyle(header_commands + [
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ])
+        self.summary_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey, colors.white])
+        ])
+        self.summary_col_widths = [1.6 * inch, 1.6 * inch]
+
+    def draw_header(self, canvas):
+        canvas.setFont('Helvetica-Bold', 18)
+        canvas.drawCentredString(self.page_width / 2, self.title_y, TITLE)
+        canvas.setLineWidth(0.5)
+        canvas.line(self.margin, self.rule_y, self.page_width - self.margin, self.rule_y)
+
+
+@functools.lru_cache(maxsize=None)
+def _template():
+    return _Template()
+
+
+class _InfoBlock(Flowable):
+    """Student details as label/value lines drawn straight onto the canvas."""
+
+    def __init__(self, lines, label_width):
+        super().__init__()
+        self.lines = lines
+        self.label_width = label_width
+
+    def wrap(self, available_width, available_height):
+        return available_width, len(self.lines) * INFO_LINE_HEIGHT
+
+    def draw(self):
+        canvas = self.canv
+        y = (len(self.lines) - 1) * INFO_LINE_HEIGHT + 3
+        for label, value in self.lines:
+            canvas.setFont('Helvetica-Bold', INFO_FONT_SIZE)
+            canvas.drawString(0, y, label)
+            canvas.setFont('Helvetica', INFO_FONT_SIZE)
+            canvas.drawString(self.label_width, y, str(value))
+            y -= INFO_LINE_HEIGHT
+
+
+def _draw_page(canvas, doc):
+    template = _template()
+    canvas.saveState()
+    # the header is identical on every page: define it once per document, then reuse it
+    if not getattr(doc, '_header_defined', False):
+        canvas.beginForm(HEADER_FORM)
+        template.draw_header(canvas)
+        canvas.endForm()
+        doc._header_defined = True
+    canvas.doForm(HEADER_FORM)
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(template.margin, 0.5 * inch, f"Generated {doc.transcript_generated}")
+    canvas.drawRightString(template.page_width - template.margin, 0.5 * inch, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def _format_cell(cell):
+    if isinstance(cell, str):
+        return cell
+    return str(int(cell)) if cell is not None else 'N/A'
+
+
+def render_transcript_pdf(transcript):
+    """Render one transcript dict to PDF bytes."""
+    template = _template()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=template.top_margin)
+    doc.transcript_generated = transcript['generated']
+
+    info = [
+        ('Student Name:', transcript['name']),
+        ('Student ID:', transcript['student_code']),
+        ('Grade Level:', f"Grade {transcript['grade_level']}"),
+    ]
+    if transcript.get('term'):
+        info.append(('Term:', transcript['term']))
+    if transcript.get('academic_year'):
+        info.append(('Academic Year:', transcript['academic_year']))
+    info.append(('Generated Date:', transcript['generated']))
+    story = [_InfoBlock(info, template.info_label_width), Spacer(1, 20)]
+
+    if transcript['rows']:
+        columns = list(transcript.get('columns') or DEFAULT_COLUMNS)
+        data = [columns]
+        data.extend([_format_cell(cell) for cell in row] for row in transcript['rows'])
+        table = Table(data, repeatRows=1)
+        table.setStyle(template.grades_style if len(columns) <= 2 else template.detailed_grades_style)
+        story.append(table)
+        story.append(Spacer(1, 20))
+
+        total = transcript['total']
+        average = transcript['average']
+        rank = transcript['rank']
+        summary_data = [
+            ['Total Result', str(int(total)) if total else 'N/A'],
+            ['Average Result', f"{average:.1f} / 100" if average else 'N/A'],
+            ['Class Rank', f"#{rank}" if rank else 'N/A']
+        ]
+        summary_table = Table(summary_data, colWidths=template.summary_col_widths)
+        summary_table.setStyle(template.summary_style)
+        story.append(summary_table)
+    else:
+        story.append(Paragraph("No grades available.", template.normal))
+
+    doc.build(story, onFirstPage=_draw_page, onLaterPages=_draw_page)
+    return buffer.getvalue()
+
+
+def write_transcript_pdf(transcript, path):
+    """Render a transcript into `path` atomically; returns (path, size).
+
+    Used as the process-pool task of batch jobs: a crash never leaves a
+    truncated PDF behind under the final name.
+    """
+    pdf = render_transcript_pdf(transcript)
+    # unique per call: concurrent writers of the same file never share a temp file
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        handle.write(pdf)
+    os.replace(tmp_path, path)
+    return path, len(pdf)
@@ -0,0 +1,438 @@
+"""Transcript data for single students and whole-grade batch jobs.
+
+collect_transcripts() gathers every transcript of a grade level for a term
+in a fixed number of queries (students, enrollments, grades, ranks).
+build_transcript_batch() renders them across a process pool into one ZIP.
+Finished PDFs are recorded in a manifest, so an interrupted run resumes
+where it stopped and a re-run only re-renders students whose data changed.
+A run holds a claim file in its batch directory, so two runs never write
+the same files; the web page starts runs in the background with
+start_transcript_batch() and polls transcript_batch_status().
+
+Single downloads go through transcript_response(), which keeps rendered
+PDFs on disk under the transcript's fingerprint and serves them as files
+with an ETag. Grade and enrollment signals in ranks.models clear a
+student's cached files when their results change.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.text import get_valid_filename, slugify
+from subjects.models import Enrollment
+from users.models import User
+from .models import ALL_TERMS, compute_numeric_scores_bulk, get_class_rank_map
+from .transcript_pdf import REPORTLAB_AVAILABLE, render_transcript_pdf, write_transcript_pdf
+
+# Manifest is flushed to disk after this many rendered transcripts
+MANIFEST_SAVE_EVERY = 20
+# Claim file of the run currently writing a batch directory
+BATCH_LOCK_NAME = 'batch.lock'
+
+
+class BatchInProgress(RuntimeError):
+    """Another run is already building this batch directory."""
+
+
+def transcript_data(student, rows, rank, term=None, columns=None, academic_year=None):
+    """Transcript dict (see ranks.transcript_pdf) from table rows.
+
+    Rows default to (subject name, score); with `columns` they can carry more
+    cells, and every cell that is not a string is taken as a score.
+    """
+    profile = getattr(student, 'studentprofile', None)
+    rows = [
+        tuple(cell if cell is None or isinstance(cell, str) else float(cell) for cell in row)
+        for row in rows
+    ]
+    scores = [cell for row in rows for cell in row if cell is not None and not isinstance(cell, str)]
+    total = sum(scores)
+    return {
+        'student_id': student.id,
+        'username': student.username,
+        'name': student.get_full_name() or student.username,
+        'student_code': getattr(profile, 'student_id', None) or 'N/A',
+        'grade_level': getattr(profile, 'grade_level', None) or 'N/A',
+        'term': term,
+        'academic_year': academic_year,
+        'generated': timezone.now().strftime('%Y-%m-%d'),
+        'columns': list(columns) if columns else None,
+        'rows': rows,
+        'total': total,
+        'average': total / len(scores) if scores else None,
+        'rank': rank,
+    }
+
+
+def _term_label(academic_year, semester):
+    parts = [value for value in (academic_year, semester) if value and value != ALL_TERMS]
+    return ', '.join(parts) or None
+
+
+def collect_transcripts(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Transcript dicts for the approved students of a grade level, ordered by username.
+
+    Subjects and scores come from the students' enrollments in the term
+    (every term for ALL_TERMS) and ranks from the materialized ClassRank
+    table, so the query count does not depend on the number of students.
+    For a specific term, students without enrollments in it are left out.
+    """
+    students = list(
+        User.objects.filter(role='student', is_approved=True, studentprofile__grade_level=grade_level)
+        .select_related('studentprofile')
+        .order_by('username')
+    )
+    student_ids = [student.id for student in students]
+    enrollments = Enrollment.objects.filter(student_id__in=student_ids).select_related('subject').order_by('subject__name', 'id')
+    if academic_year != ALL_TERMS:
+        enrollments = enrollments.filter(academic_year=academic_year)
+    if semester != ALL_TERMS:
+        enrollments = enrollments.filter(semester=semester)
+    enrollments = list(enrollments)
+
+    scores = compute_numeric_scores_bulk(students=student_ids, enrollments=enrollments)
+    ranks = get_class_rank_map(student_ids, academic_year, semester)
+    enrollments_by_student = defaultdict(list)
+    for enrollment in enrollments:
+        enrollments_by_student[enrollment.student_id].append(enrollment)
+
+    term = _term_label(academic_year, semester)
+    transcripts = []
+    for student in students:
+        student_enrollments = enrollments_by_student.get(student.id, [])
+        if term and not student_enrollments:
+            continue
+        score_map = scores[student.id][0]
+        rows = [(enrollment.subject.name, score_map.get(enrollment.id)) for enrollment in student_enrollments]
+        transcripts.append(transcript_data(student, rows, ranks.get(student.id), term))
+    return transcripts
+
+
+def transcript_fingerprint(transcript):
+    """Hash of everything printed on a transcript except the generation date."""
+    content = {key: value for key, value in transcript.items() if key != 'generated'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def batch_directory(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Default working directory of a batch under MEDIA_ROOT/transcripts/batches/."""
+    name = slugify(f'grade-{grade_level}-{academic_year}-{semester}')
+    return os.path.join(settings.MEDIA_ROOT, 'transcripts', 'batches', name)
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _claim_batch(output_dir):
+    """Create the directory's claim file or raise BatchInProgress.
+
+    A claim whose run stopped touching it for TRANSCRIPT_BATCH_LOCK_TIMEOUT
+    seconds (the process died) is taken over.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, BATCH_LOCK_NAME)
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if _claim_is_live(path):
+                raise BatchInProgress(f'Transcripts in {output_dir} are already being generated.')
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as handle:
+            handle.write(f'{os.getpid()} {timezone.now().isoformat()}')
+        return path
+    raise BatchInProgress(f'Transcripts in {output_dir} are already being generated.')
+
+
+def _claim_is_live(lock_path):
+    try:
+        idle = time.time() - os.path.getmtime(lock_path)
+    except OSError:
+        return False
+    return idle < getattr(settings, 'TRANSCRIPT_BATCH_LOCK_TIMEOUT', 600)
+
+
+def _release_batch(lock_path):
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+
+def _touch_batch(lock_path):
+    # heartbeat: a live run never looks stale to _claim_batch()
+    try:
+        os.utime(lock_path)
+    except OSError:
+        pass
+
+
+def build_transcript_batch(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS,
+                           output_dir=None, workers=None, progress=None):
+    """Render a grade's transcripts for a term into one ZIP and return the manifest.
+
+    PDFs are written to `output_dir`/parts/ (by default batch_directory())
+    by `workers` processes (default: CPU count, 1 renders inline), then
+    streamed into `output_dir`/transcripts.zip. manifest.json records each
+    student's file, status and fingerprint; students whose PDF exists with
+    an unchanged fingerprint are not rendered again. `progress(done, total)`
+    is called as transcripts finish. Failed renders are recorded in the
+    manifest and left out of the ZIP. Raises BatchInProgress when another
+    run holds the directory.
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise RuntimeError('PDF generation requires ReportLab. Install with `pip install reportlab`.')
+    output_dir = output_dir or batch_directory(grade_level, academic_year, semester)
+    lock_path = _claim_batch(output_dir)
+    try:
+        return _build_batch(lock_path, output_dir, grade_level, academic_year, semester, workers, progress)
+    finally:
+        _release_batch(lock_path)
+
+
+def _build_batch(lock_path, output_dir, grade_level, academic_year, semester, workers, progress):
+    parts_dir = os.path.join(output_dir, 'parts')
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    previous = _load_manifest(manifest_path).get('students', {})
+
+    transcripts = collect_transcripts(grade_level, academic_year, semester)
+    entries = {}
+    manifest = {
+        'grade_level': grade_level,
+        'academic_year': academic_year,
+        'semester': semester,
+        'total': len(transcripts),
+        'started_at': timezone.now().isoformat(),
+        'completed_at': None,
+        'zip': None,
+        'error': None,
+        'students': entries,
+    }
+
+    pending = []
+    for transcript in transcripts:
+        key = str(transcript['student_id'])
+        fingerprint = transcript_fingerprint(transcript)
+        filename = f"{transcript['student_id']}_{get_valid_filename(transcript['username'])}.pdf"
+        entry = previous.get(key)
+        if (entry and entry.get('status') == 'done' and entry.get('fingerprint') == fingerprint
+                and os.path.exists(os.path.join(parts_dir, entry['file']))):
+            entries[key] = entry
+        else:
+            pending.append((key, fingerprint, filename, transcript))
+
+    done = len(transcripts) - len(pending)
+    if progress:
+        progress(done, len(transcripts))
+    _save_manifest(manifest_path, manifest)
+
+    def record(key, fingerprint, filename, error=None):
+        nonlocal done
+        entries[key] = {'file': filename, 'fingerprint': fingerprint, 'status': 'failed' if error else 'done'}
+        if error:
+            entries[key]['error'] = error
+        done += 1
+        _touch_batch(lock_path)
+        if progress:
+            progress(done, len(transcripts))
+        if done % MANIFEST_SAVE_EVERY == 0:
+            _save_manifest(manifest_path, manifest)
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(pending) <= 1:
+        for key, fingerprint, filename, transcript in pending:
+            try:
+                write_transcript_pdf(transcript, os.path.join(parts_dir, filename))
+                record(key, fingerprint, filename)
+            except Exception as exc:
+                record(key, fingerprint, filename, f'{type(exc).__name__}: {exc}')
+    elif pending:
+        # spawn: workers only import ranks.transcript_pdf and never inherit
+        # the parent's database connections or threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                pool.submit(write_transcript_pdf, transcript, os.path.join(parts_dir, filename)): (key, fingerprint, filename)
+                for key, fingerprint, filename, transcript in pending
+            }
+            for future in as_completed(futures):
+                key, fingerprint, filename = futures[future]
+                try:
+                    future.result()
+                    record(key, fingerprint, filename)
+                except Exception as exc:
+                    record(key, fingerprint, filename, f'{type(exc).__name__}: {exc}')
+
+    zip_path = os.path.join(output_dir, 'transcripts.zip')
+    tmp_path = f'{zip_path}.{uuid.uuid4().hex}.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for transcript in transcripts:
+            entry = entries[str(transcript['student_id'])]
+            if entry['status'] == 'done':
+                # streamed from disk in chunks; the batch is never held in memory
+                archive.write(os.path.join(parts_dir, entry['file']), arcname=entry['file'])
+    os.replace(tmp_path, zip_path)
+
+    manifest['zip'] = zip_path
+    manifest['completed_at'] = timezone.now().isoformat()
+    _save_manifest(manifest_path, manifest)
+    return manifest
+
+
+def start_transcript_batch(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS, workers=None):
+    """Claim a grade's batch directory and build it in a background thread.
+
+    Returns as soon as the run is claimed (raises BatchInProgress if one is
+    already running); poll transcript_batch_status() for progress. With
+    TRANSCRIPT_BATCH_ASYNC off the batch is built before returning.
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise RuntimeError('PDF generation requires ReportLab. Install with `pip install reportlab`.')
+    output_dir = batch_directory(grade_level, academic_year, semester)
+    # claimed here, not in the thread, so a status poll right after sees it running
+    lock_path = _claim_batch(output_dir)
+
+    def run():
+        try:
+            _build_batch(lock_path, output_dir, grade_level, academic_year, semester, workers, None)
+        except Exception as exc:
+            traceback.print_exc()
+            manifest_path = os.path.join(output_dir, 'manifest.json')
+            manifest = _load_manifest(manifest_path)
+            manifest.update(error=f'{type(exc).__name__}: {exc}', completed_at=None)
+            _save_manifest(manifest_path, manifest)
+        finally:
+            _release_batch(lock_path)
+
+    if not getattr(settings, 'TRANSCRIPT_BATCH_ASYNC', True):
+        run()
+        return
+
+    def run_in_thread():
+        try:
+            run()
+        finally:
+            # the thread has its own DB connection; do not leak it
+            close_old_connections()
+
+    threading.Thread(target=run_in_thread, name=f'transcript-batch-{grade_level}', daemon=True).start()
+
+
+def transcript_batch_status(grade_level, academic_year=ALL_TERMS, semester=ALL_TERMS):
+    """Progress of a grade's batch from its claim file and manifest.
+
+    'state' is 'running', 'completed', 'failed' or 'none'; 'zip' is the path
+    of the last finished ZIP (kept while a new run builds the next one).
+    """
+    output_dir = batch_directory(grade_level, academic_year, semester)
+    manifest = _load_manifest(os.path.join(output_dir, 'manifest.json'))
+    entries = manifest.get('students', {})
+    zip_path = os.path.join(output_dir, 'transcripts.zip')
+    if _claim_is_live(os.path.join(output_dir, BATCH_LOCK_NAME)):
+        state = 'running'
+    elif manifest.get('error'):
+        state = 'failed'
+    elif manifest.get('completed_at'):
+        state = 'completed'
+    else:
+        state = 'none'
+    return {
+        'state': state,
+        'total': manifest.get('total', 0),
+        'done': len(entries),
+        'failed': sum(1 for entry in entries.values() if entry.get('status') == 'failed'),
+        'error': manifest.get('error'),
+        'completed_at': manifest.get('completed_at'),
+        'zip': zip_path if os.path.exists(zip_path) else None,
+    }
+
+
+def transcript_cache_directory(student_id):
+    """Cached PDFs of one student under MEDIA_ROOT/transcripts/cache/."""
+    return os.path.join(settings.MEDIA_ROOT, 'transcripts', 'cache', str(student_id))
+
+
+def _cache_name(transcript):
+    # layouts (the registrar's and the student's) are cached side by side
+    columns = transcript.get('columns')
+    layout = hashlib.sha256(json.dumps(columns).encode('utf-8')).hexdigest()[:8] if columns else 'default'
+    return layout, f'{layout}-{transcript_fingerprint(transcript)}'
+
+
+def cached_transcript_pdf(transcript):
+    """Path of the transcript's PDF, rendering it only if no identical one is cached.
+
+    Files are named after the content fingerprint, so a cached PDF always
+    matches the data it was looked up with; its Generated date is the day
+    that content was first rendered. Writing a new PDF drops the student's
+    older ones of the same layout.
+    """
+    directory = transcript_cache_directory(transcript['student_id'])
+    layout, name = _cache_name(transcript)
+    path = os.path.join(directory, f'{name}.pdf')
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    write_transcript_pdf(transcript, path)
+    for entry in os.scandir(directory):
+        if entry.name.startswith(f'{layout}-') and entry.name != f'{name}.pdf':
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return path
+
+
+def invalidate_transcript_cache(student_ids):
+    """Remove every cached PDF of the given students."""
+    for student_id in student_ids:
+        shutil.rmtree(transcript_cache_directory(student_id), ignore_errors=True)
+
+
+def transcript_response(request, transcript, filename):
+    """Serve a transcript PDF from the cache, answering If-None-Match with 304."""
+    etag = f'"{_cache_name(transcript)[1]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            # FileResponse hands the open file to the server (wsgi.file_wrapper / sendfile)
+            response = FileResponse(open(cached_transcript_pdf(transcript), 'rb'), as_attachment=True,
+                                    filename=filename, content_type='application/pdf')
+        except OSError as e:
+            # the cache directory was cleared under us or is not writable
+            print(f"Transcript cache unavailable: {e}")
+            response = HttpResponse(render_transcript_pdf(transcript), content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag
+    # browsers keep the file but must revalidate, so grade changes show up
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
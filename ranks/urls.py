@@ -3,8 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import GradeViewSet, TranscriptViewSet
 
 router = DefaultRouter()
-router.register(r"", GradeViewSet)
+# transcripts first: the grade detail route at the root would swallow "transcripts/"
 router.register(r"transcripts", TranscriptViewSet)
+router.register(r"", GradeViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
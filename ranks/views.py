@@ -1,25 +1,26 @@
 from rest_framework import viewsets
 from .models import Grade, Transcript
 from rest_framework import serializers
+from sims.api import FieldSelectionMixin, StudentFilterMixin
 
 
-class GradeSerializer(serializers.ModelSerializer):
+class GradeSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Grade
         fields = '__all__'
 
 
-class TranscriptSerializer(serializers.ModelSerializer):
+class TranscriptSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Transcript
         fields = '__all__'
 
 
-class GradeViewSet(viewsets.ModelViewSet):
+class GradeViewSet(StudentFilterMixin, viewsets.ModelViewSet):
     queryset = Grade.objects.all()
     serializer_class = GradeSerializer
 
 
-class TranscriptViewSet(viewsets.ModelViewSet):
+class TranscriptViewSet(StudentFilterMixin, viewsets.ModelViewSet):
     queryset = Transcript.objects.all()
     serializer_class = TranscriptSerializer
@@ -8,4 +8,6 @@ urlpatterns = [
     path('academic-records/', views.manage_academic_records, name='manage_academic_records'),
     path('waitlist/<int:subject_id>/', views.handle_waitlist, name='handle_waitlist'),
     path('generate-transcripts/', views.generate_transcripts, name='generate_transcripts'),
+    path('generate-transcripts/batch/status/', views.transcript_batch_status_view, name='transcript_batch_status'),
+    path('generate-transcripts/batch/download/', views.download_transcript_batch, name='download_transcript_batch'),
 ]
\ No newline at end of file
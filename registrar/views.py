@@ -1,29 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.urls import reverse
+from urllib.parse import urlencode
+from django.utils.text import slugify
 from users.decorators import registrar_required
 from users.models import User, StudentProfile
 from subjects.models import Subject, Enrollment
-from ranks.models import Grade, calculate_student_average
+from subjects.registration import approve_enrollments, approve_waitlisted, promote_waitlist, seat_counts, waitlist_keys
+from ranks.models import ALL_TERMS, Grade, get_class_rank
 from teachers.views import enroll_students_for_subject
 from django.db.utils import OperationalError
 from notifications.models import Notification
+from notifications.push import get_unread_count
 from django.core.mail import send_mail
 import csv
-import io
-# ReportLab is an optional dependency used to generate PDF transcripts.
-# Import it lazily; if it's missing, set a flag so the rest of the app
-# (and migrations) can continue to run without ReportLab installed.
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False
+# ReportLab is an optional dependency used to generate PDF transcripts;
+# ranks.transcript_pdf imports it and reports whether it is installed.
+from ranks.transcript_pdf import REPORTLAB_AVAILABLE
+from ranks.transcripts import (
+    BatchInProgress, start_transcript_batch, transcript_batch_status, transcript_data, transcript_response,
+)
 
 @registrar_required
 def registrar_dashboard(request):
@@ -34,7 +33,7 @@ def registrar_dashboard(request):
     # Get unread notifications for the registrar
     from notifications.models import Notification
     unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    unread_count = get_unread_count(request.user)
     
     context = {
         'pending_enrollments': pending_enrollments,
@@ -50,12 +49,14 @@ def approve_registrations(request):
     pending_enrollments = list(Enrollment.objects.filter(status='pending').select_related('student', 'subject'))
     waitlisted_enrollments = list(Enrollment.objects.filter(status='waitlisted').select_related('student', 'subject'))
 
-    # Precompute current enrollment counts for template use (templates can't call methods with args)
+    # Precompute current enrollment counts for template use (templates can't call methods with args);
+    # one grouped query for every (subject, term) on the page
+    try:
+        counts = seat_counts((e.subject_id, e.academic_year, e.semester) for e in pending_enrollments + waitlisted_enrollments)
+    except Exception:
+        counts = {}
     for enrollment in pending_enrollments + waitlisted_enrollments:
-        try:
-            enrollment.current_count = enrollment.subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-        except Exception:
-            enrollment.current_count = 0
+        enrollment.current_count = counts.get((enrollment.subject_id, enrollment.academic_year, enrollment.semester), 0)
     
     if request.method == 'POST':
         enrollment_id = request.POST.get('enrollment_id')
@@ -63,23 +64,25 @@ def approve_registrations(request):
         enrollment = get_object_or_404(Enrollment, id=enrollment_id)
         
         if action == 'approve':
-            # Check if subject has capacity
-            subject = enrollment.subject
-            current_count = subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-            if current_count < subject.max_capacity:
-                enrollment.status = 'approved'
+            # Approved if the subject has capacity, otherwise waitlisted
+            result = approve_enrollments([enrollment.id], status='approved')
+            if result['approved']:
                 messages.success(request, f'Enrollment approved for {enrollment.student.username}.')
-            else:
-                enrollment.status = 'waitlisted'
+            elif result['waitlisted']:
                 messages.warning(request, 'Subject is full. Student added to waitlist.')
+            else:
+                messages.info(request, 'This enrollment is no longer pending.')
+            return redirect('approve_registrations')
         elif action == 'reject':
             enrollment.status = 'rejected'
             messages.success(request, f'Enrollment rejected for {enrollment.student.username}.')
         elif action == 'approve_waitlist':
-            # Manually approve waitlisted student
-            enrollment.status = 'approved'
-            # nothing to add to course/student lists here; enrollment.save will persist the status
-            messages.success(request, f'Waitlisted enrollment approved for {enrollment.student.username}.')
+            # Manually approve waitlisted student, only into a free seat
+            if approve_waitlisted(enrollment):
+                messages.success(request, f'Waitlisted enrollment approved for {enrollment.student.username}.')
+            else:
+                messages.error(request, 'Subject is at full capacity.')
+            return redirect('approve_registrations')
         
         enrollment.save()
         return redirect('approve_registrations')
@@ -120,21 +123,31 @@ def manage_academic_records(request):
 @registrar_required
 def handle_waitlist(request, subject_id):
     subject = get_object_or_404(Subject, id=subject_id)
-    waitlisted_enrollments = Enrollment.objects.filter(subject=subject, status='waitlisted')
+    # queue order: promotion goes by request date within each term
+    waitlisted_enrollments = (
+        Enrollment.objects.filter(subject=subject, status='waitlisted')
+        .select_related('student')
+        .order_by('academic_year', 'semester', 'enrolled_date', 'id')
+    )
     
     if request.method == 'POST':
         enrollment_id = request.POST.get('enrollment_id')
         action = request.POST.get('action')
         
         if action == 'approve':
-            enrollment = get_object_or_404(Enrollment, id=enrollment_id)
-            current_count = subject.current_enrollment_count(enrollment.academic_year, enrollment.semester)
-            if current_count < subject.max_capacity:
-                enrollment.status = 'approved'
-                enrollment.save()
+            # approving one row lets that student skip ahead of the queue
+            enrollment = get_object_or_404(Enrollment, id=enrollment_id, subject=subject, status='waitlisted')
+            if approve_waitlisted(enrollment):
                 messages.success(request, 'Student approved from waitlist.')
             else:
                 messages.error(request, 'Subject is at full capacity.')
+        elif action == 'promote':
+            # seats normally fill themselves as they free up; this catches up older data
+            promoted = promote_waitlist(waitlist_keys([subject.id]))
+            if promoted:
+                messages.success(request, f'{len(promoted)} student(s) promoted from the waitlist.')
+            else:
+                messages.info(request, 'No free seats for waitlisted students.')
         
         return redirect('handle_waitlist', subject_id=subject_id)
     
@@ -194,36 +207,10 @@ def generate_transcripts(request):
             else:
                 numeric_average = None
             
-            # Calculate student rank among peers in same grade level
+            # Student rank among peers in same grade level (materialized ClassRank)
             try:
-                if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-                    peers = User.objects.filter(
-                        role='student', 
-                        is_approved=True,
-                        studentprofile__grade_level=student.studentprofile.grade_level
-                    )
-                    peer_averages = []
-                    for peer in peers:
-                        try:
-                            avg = calculate_student_average(peer) or 0
-                            peer_averages.append((peer.id, avg))
-                        except Exception:
-                            pass
-                    
-                    peer_averages.sort(key=lambda x: x[1], reverse=True)
-                    rank = 0
-                    last_score = None
-                    idx = 0
-                    for pid, avg in peer_averages:
-                        idx += 1
-                        if avg == last_score:
-                            pass  # same rank
-                        else:
-                            rank = idx
-                            last_score = avg
-                        if pid == student.id:
-                            student_rank = rank
-                            break
+                rank_row = get_class_rank(student)
+                student_rank = rank_row.rank if rank_row else None
             except Exception:
                 student_rank = None
                 
@@ -233,9 +220,14 @@ def generate_transcripts(request):
             grades = []
         
         if request.GET.get('format') == 'pdf':
-            return generate_pdf_transcript(student, grades)
+            return generate_pdf_transcript(request, student, grades)
         elif request.GET.get('format') == 'csv':
             return generate_csv_transcript(student, grades)
+    elif request.GET.get('format') == 'zip':
+        if not grade_level:
+            messages.error(request, 'Choose a grade level to download all transcripts.')
+            return redirect('generate_transcripts')
+        return generate_transcript_batch(request, grade_level, academic_year, semester)
     
     context = {
         'students': students,
@@ -252,6 +244,9 @@ def generate_transcripts(request):
             'semester': semester,
         },
     }
+    batch_args = _transcript_batch_args(request.GET)
+    if batch_args:
+        context['transcript_batch'] = transcript_batch_status(*batch_args)
     return render(request, 'registrar/generate_transcripts.html', context)
 
 
@@ -399,34 +394,8 @@ def generate_csv_transcript(student, grades):
     # Calculate student rank
     student_rank = None
     try:
-        if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-            peers = User.objects.filter(
-                role='student', 
-                is_approved=True,
-                studentprofile__grade_level=student.studentprofile.grade_level
-            )
-            peer_averages = []
-            for peer in peers:
-                try:
-                    avg = calculate_student_average(peer) or 0
-                    peer_averages.append((peer.id, avg))
-                except Exception:
-                    pass
-            
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            rank = 0
-            last_score = None
-            idx = 0
-            for pid, avg in peer_averages:
-                idx += 1
-                if avg == last_score:
-                    pass
-                else:
-                    rank = idx
-                    last_score = avg
-                if pid == student.id:
-                    student_rank = rank
-                    break
+        rank_row = get_class_rank(student)
+        student_rank = rank_row.rank if rank_row else None
     except Exception:
         pass
     
@@ -434,132 +403,78 @@ def generate_csv_transcript(student, grades):
     
     return response
 
-def generate_pdf_transcript(student, grades):
-    """Generate PDF transcript using ReportLab"""
+def generate_pdf_transcript(request, student, grades):
+    """Generate PDF transcript using ReportLab (served from the transcript cache)"""
     if not REPORTLAB_AVAILABLE:
         return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        alignment=1,  # Center alignment
-        spaceAfter=30
-    )
-    story.append(Paragraph("ACADEMIC TRANSCRIPT", title_style))
-    
-    # Student Information
-    student_info = f"""
-    <b>Student Name:</b> {student.get_full_name() or student.username}<br/>
-    <b>Student ID:</b> {getattr(student.studentprofile, 'student_id', 'N/A')}<br/>
-    <b>Grade Level:</b> Grade {getattr(student.studentprofile, 'grade_level', 'N/A')}<br/>
-    <b>Generated Date:</b> {timezone.now().strftime('%Y-%m-%d')}
-    """
-    story.append(Paragraph(student_info, styles["Normal"]))
-    story.append(Spacer(1, 20))
-    
-    # Grades Table
-    if grades:
-        data = [['Course', 'Result (out of 100)']]
-        total_result = 0.0
-        graded_count = 0
-        
-        for grade in grades:
-            score = grade.score if grade.score is not None else None
-            if score is not None:
-                total_result += score
-                graded_count += 1
-            
-            data.append([
-                grade.subject.name,
-                str(int(score)) if score is not None else 'N/A'
-            ])
-        
-        # Create table
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(table)
-        story.append(Spacer(1, 20))
-        
-        # Calculate average
-        numeric_average = total_result / graded_count if graded_count > 0 else None
-        
-        # Calculate student rank
-        student_rank = None
-        try:
-            if hasattr(student, 'studentprofile') and student.studentprofile.grade_level:
-                peers = User.objects.filter(
-                    role='student', 
-                    is_approved=True,
-                    studentprofile__grade_level=student.studentprofile.grade_level
-                )
-                peer_averages = []
-                for peer in peers:
-                    try:
-                        avg = calculate_student_average(peer) or 0
-                        peer_averages.append((peer.id, avg))
-                    except Exception:
-                        pass
-                
-                peer_averages.sort(key=lambda x: x[1], reverse=True)
-                rank = 0
-                last_score = None
-                idx = 0
-                for pid, avg in peer_averages:
-                    idx += 1
-                    if avg == last_score:
-                        pass
-                    else:
-                        rank = idx
-                        last_score = avg
-                    if pid == student.id:
-                        student_rank = rank
-                        break
-        except Exception:
-            pass
-        
-        # Summary Section
-        summary_data = [
-            ['Total Result', str(int(total_result)) if total_result > 0 else 'N/A'],
-            ['Average Result', f"{numeric_average:.1f} / 100" if numeric_average else 'N/A'],
-            ['Class Rank', f"#{student_rank}" if student_rank else 'N/A']
-        ]
-        
-        summary_table = Table(summary_data)
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey, colors.white])
-        ]))
-        story.append(summary_table)
-    else:
-        story.append(Paragraph("No grades available.", styles["Normal"]))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{student.username}_transcript.pdf"'
-    return response
+    # Calculate student rank
+    student_rank = None
+    try:
+        rank_row = get_class_rank(student)
+        student_rank = rank_row.rank if rank_row else None
+    except Exception:
+        pass
+
+    transcript = transcript_data(student, [(grade.subject.name, grade.score) for grade in grades], student_rank)
+    return transcript_response(request, transcript, f"{student.username}_transcript.pdf")
+
+
+def _transcript_batch_args(params):
+    """(grade level, academic year, semester) of a batch from the transcript filters, or None."""
+    grade_level = params.get('grade_level', '')
+    if not grade_level.isdigit():
+        return None
+    return int(grade_level), params.get('academic_year') or ALL_TERMS, params.get('semester') or ALL_TERMS
+
+
+def generate_transcript_batch(request, grade_level, academic_year, semester):
+    """Start building the ZIP of every transcript of a grade level for a term in the background"""
+    filters = {'grade_level': grade_level, 'academic_year': academic_year or '', 'semester': semester or ''}
+    back = redirect(f"{reverse('generate_transcripts')}?{urlencode(filters)}")
+    if not REPORTLAB_AVAILABLE:
+        return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
+    try:
+        start_transcript_batch(
+            int(grade_level),
+            academic_year or ALL_TERMS,
+            semester or ALL_TERMS,
+            workers=getattr(settings, 'TRANSCRIPT_BATCH_WORKERS', None),
+        )
+    except BatchInProgress:
+        messages.info(request, f'Transcripts for Grade {grade_level} are already being generated.')
+        return back
+    except Exception as e:
+        print(f"Transcript batch failed to start: {e}")
+        messages.error(request, f'Could not generate transcripts: {e}')
+        return back
+    messages.success(request, f'Generating transcripts for Grade {grade_level}. The download link appears here when they are ready.')
+    return back
+
+
+@registrar_required
+def transcript_batch_status_view(request):
+    """JSON progress of the batch ZIP selected by the transcript filters"""
+    args = _transcript_batch_args(request.GET)
+    if args is None:
+        return JsonResponse({'error': 'grade_level is required'}, status=400)
+    status = transcript_batch_status(*args)
+    status['zip'] = bool(status['zip'])
+    return JsonResponse(status)
+
+
+@registrar_required
+def download_transcript_batch(request):
+    """The last finished batch ZIP of a grade level for a term"""
+    args = _transcript_batch_args(request.GET)
+    status = transcript_batch_status(*args) if args else None
+    if not status or not status['zip'] or not status['completed_at']:
+        messages.error(request, 'These transcripts have not been generated yet.')
+        return redirect('generate_transcripts')
+    if status['failed']:
+        print(f"Transcript batch: {status['failed']} of {status['total']} transcripts failed to render")
+    filename = slugify(f"transcripts-grade-{args[0]}-{request.GET.get('academic_year') or 'all'}-{request.GET.get('semester') or 'all'}") + '.zip'
+    return FileResponse(open(status['zip'], 'rb'), as_attachment=True, filename=filename, content_type='application/zip')
 
 def get_grade_point(grade):
     """Convert letter grade to grade point"""
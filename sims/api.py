@@ -0,0 +1,87 @@
+"""Shared REST framework pieces for the app APIs.
+
+KeysetPagination is the project-wide default (REST_FRAMEWORK in settings),
+FieldSelectionMixin lets serializers answer `?fields=` and StudentFilterMixin
+gives viewsets the `?student=` filter the portal scripts send, limited to
+records the requester may see.
+"""
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import SAFE_METHODS
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor (keyset) pagination, newest rows first.
+
+    Each page is `WHERE id < <cursor> ORDER BY id DESC LIMIT n`, so deep
+    pages cost the same as the first one and no COUNT(*) is run. Clients
+    follow the opaque `next`/`previous` links; `?page_size=` goes up to
+    max_page_size. Views can set `keyset_ordering` to page in another order
+    (ending in a unique field).
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+
+class FieldSelectionMixin:
+    """Serializer mixin: `?fields=id,name` on a read returns only those fields.
+
+    Unknown names are ignored; writes always use every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        wanted = {name.strip() for name in requested.split(',') if name.strip()}
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
+
+
+class StudentFilterMixin:
+    """Viewset mixin: `?student=<students.Student id>` limits the queryset to one student's rows.
+
+    The id is the profile id the portal scripts get from /api/students/; it is
+    resolved to the student's user, which the models point at. Students may
+    only ask for themselves and parents for their linked children; staff
+    roles for anyone. Anything else returns no rows.
+    """
+    student_lookup = 'student'
+    staff_roles = ('admin', 'teacher', 'registrar', 'finance')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        student = self.request.query_params.get('student')
+        if student:
+            user_id = self._student_user_id(student) if student.isdigit() else None
+            if user_id is None:
+                return queryset.none()
+            queryset = queryset.filter(**{self.student_lookup: user_id})
+        return queryset
+
+    def _student_user_id(self, profile_id):
+        # imported here: this module is loaded from settings-driven DRF config
+        from django.db.models import Q
+        from students.models import Student
+
+        user = self.request.user
+        role = getattr(user, 'role', None)
+        profiles = Student.objects.filter(pk=int(profile_id))
+        if role == 'student':
+            profiles = profiles.filter(user=user)
+        elif role == 'parent':
+            # linked either on the profile or through a parent-child link
+            profiles = profiles.filter(Q(parent=user) | Q(user__student_relationships__parent=user))
+        elif not (role in self.staff_roles or getattr(user, 'is_superuser', False)):
+            return None
+        return profiles.values_list('user_id', flat=True).first()
@@ -210,6 +210,35 @@ try:
             EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 except Exception:
     pass
+# Announcement fan-out (notifications/delivery.py)
+# Deliver in a background thread so posting returns immediately; False runs inline after commit
+ANNOUNCEMENT_DELIVERY_ASYNC = True
+# Notifications inserted per bulk_create / emails sent per SMTP send_messages() batch
+ANNOUNCEMENT_NOTIFICATION_CHUNK_SIZE = 500
+ANNOUNCEMENT_EMAIL_BATCH_SIZE = 50
+# Upper bound on emails per second (0 disables the limit); Gmail SMTP starts throttling quickly
+ANNOUNCEMENT_EMAILS_PER_SECOND = 10
+# Failed batches are retried on a fresh connection, waiting RETRY_DELAY, then twice as long, ...
+ANNOUNCEMENT_EMAIL_RETRIES = 3
+ANNOUNCEMENT_EMAIL_RETRY_DELAY = 2
+# A running delivery that has not reported progress for this many seconds is taken to be dead
+# (its worker was recycled) and re-queued by `manage.py resume_announcement_deliveries`
+ANNOUNCEMENT_DELIVERY_STALE_AFTER = 30 * 60
+# Notification push (notifications/push.py): SSE stream and long-poll timeouts, in seconds
+NOTIFICATION_STREAM_MAX_SECONDS = 55
+NOTIFICATION_STREAM_HEARTBEAT = 15
+NOTIFICATION_POLL_TIMEOUT = 25
+# Processes rendering batch transcript PDFs (ranks/transcripts.py); None uses every CPU
+TRANSCRIPT_BATCH_WORKERS = None
+# Build the registrar's batch ZIPs in a background thread (False builds them within the request)
+TRANSCRIPT_BATCH_ASYNC = True
+# A batch claim not refreshed for this many seconds belongs to a dead run and is taken over
+TRANSCRIPT_BATCH_LOCK_TIMEOUT = 600
+# Finance (finance/views.py): fee tracking rows per page, rows fetched per query by streamed CSV exports
+FINANCE_PAGE_SIZE = 50
+FINANCE_EXPORT_CHUNK_SIZE = 2000
+# Term rollover (subjects/rollover.py): enrollments inserted per bulk_create
+ENROLLMENT_ROLLOVER_CHUNK_SIZE = 1000
 # Toggle automatic approval of child-link requests when the submitted identifier matches a student
 PARENT_CHILD_LINK_AUTO_APPROVE = True
 # For production, configure real email settings
@@ -219,6 +248,9 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # Every list endpoint is keyset-paginated (sims/api.py); ?page_size= up to 200
+    'DEFAULT_PAGINATION_CLASS': 'sims.api.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 # JWT Settings
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from sims.api import FieldSelectionMixin
 from .models import Student, Attendance
 
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source="user.get_full_name", read_only=True)
     
     class Meta:
@@ -8,9 +8,12 @@ from users.models import User
 from subjects.models import Subject, Enrollment
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from ranks.models import Grade
+from ranks.models import Grade, get_class_rank
+from ranks.transcript_pdf import REPORTLAB_AVAILABLE
+from ranks.transcripts import transcript_data, transcript_response
 from payments.models import Payment, FeeStructure
-from notifications.models import Announcement
+from notifications.models import Announcement, ANNOUNCEMENT_PAGE_SIZE, visible_announcements
+from notifications.push import get_unread_count
 from ai_advisor.models import AIConversation, AIMessage
 import json
 from rest_framework import viewsets, status
@@ -73,24 +76,11 @@ def student_dashboard(request):
     # Get unread notifications for the student
     from notifications.models import Notification
     unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    unread_count = get_unread_count(request.user)
     
     # Get recent announcements for the student
     try:
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:5]
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            if isinstance(target_roles, str):
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append(announcement)
+        relevant_announcements = list(visible_announcements('student')[:5])
     except Exception as e:
         relevant_announcements = []
         print(f"Error loading announcements: {e}")
@@ -373,32 +363,9 @@ def view_transcripts(request):
         class_rank = None
         if grade_level:
             try:
-                # Get all students in same grade level
-                from users.views import compute_numeric_scores
-                peers = User.objects.filter(
-                    role='student',
-                    studentprofile__grade_level=grade_level
-                ).prefetch_related('subject_enrollments', 'subject_enrollments__subject', 'studentprofile')
-                
-                # Calculate ranks
-                peer_data = []
-                for peer in peers:
-                    peer_enrollments = Enrollment.objects.filter(student=peer)
-                    _, peer_total, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                    if peer_avg is not None:
-                        peer_data.append({
-                            'student_id': peer.id,
-                            'average': peer_avg
-                        })
-                
-                # Sort by average descending
-                peer_data.sort(key=lambda x: x['average'], reverse=True)
-                
-                # Find rank
-                for idx, peer in enumerate(peer_data, start=1):
-                    if peer['student_id'] == student.id:
-                        class_rank = idx
-                        break
+                # Read the materialized class rank (one indexed query)
+                rank_row = get_class_rank(student)
+                class_rank = rank_row.rank if rank_row else None
             except Exception as e:
                 print(f"Error calculating class rank: {e}")
                 class_rank = None
@@ -421,26 +388,18 @@ def view_transcripts(request):
         messages.error(request, f"Error loading transcript: {str(e)}")
         return redirect('student_dashboard')
 
+TRANSCRIPT_COLUMNS = ('Academic Year', 'Semester', 'Subject Code', 'Subject Name', 'Result (out of 100)', 'Teacher')
+
 @student_required
 def download_transcript_pdf(request):
     """Download student transcript as PDF"""
     try:
-        # Check if ReportLab is available
-        try:
-            import io
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-            from reportlab.lib import colors
-            REPORTLAB_AVAILABLE = True
-        except ImportError:
-            from django.http import HttpResponse
+        from django.http import HttpResponse
+        if not REPORTLAB_AVAILABLE:
             return HttpResponse("PDF generation requires ReportLab. Install with `pip install reportlab`.", status=503)
         
         # Get student profile
         if not hasattr(request.user, 'studentprofile'):
-            from django.http import HttpResponse
             return HttpResponse("Student profile not found.", status=404)
         
         student_profile = request.user.studentprofile
@@ -455,34 +414,8 @@ def download_transcript_pdf(request):
         from users.views import compute_numeric_scores
         score_map, total_result, graded_count, average_result = compute_numeric_scores(student, enrollments)
         
-        # Build PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            alignment=1,  # Center alignment
-            spaceAfter=30
-        )
-        story.append(Paragraph("ACADEMIC TRANSCRIPT", title_style))
-        
-        # Student Information
-        student_info = f"""
-        <b>Student Name:</b> {student.get_full_name() or student.username}<br/>
-        <b>Student ID:</b> {getattr(student_profile, 'student_id', 'N/A')}<br/>
-        <b>Grade Level:</b> Grade {getattr(student_profile, 'grade_level', 'N/A')}<br/>
-        <b>Academic Year:</b> {getattr(student_profile, 'academic_year', 'N/A')}<br/>
-        <b>Generated Date:</b> {timezone.now().strftime('%Y-%m-%d')}
-        """
-        story.append(Paragraph(student_info, styles["Normal"]))
-        story.append(Spacer(1, 20))
-        
-        # Build transcript data
-        transcript_data = []
+        # Build transcript rows; only graded subjects are listed
+        rows = []
         for enrollment in enrollments:
             numeric_score = score_map.get(enrollment.id)
             if numeric_score is not None:
@@ -490,101 +423,30 @@ def download_transcript_pdf(request):
                 teacher_name = "TBA"
                 if subject.instructor and subject.instructor.user:
                     teacher_name = subject.instructor.user.get_full_name() or subject.instructor.user.username
-                
-                transcript_data.append({
-                    'academic_year': str(getattr(enrollment, 'academic_year', 'N/A')),
-                    'semester': str(getattr(enrollment, 'get_semester_display', lambda: 'N/A')()),
-                    'subject_code': getattr(subject, 'code', 'N/A'),
-                    'subject_name': subject.name,
-                    'score': round(float(numeric_score), 2),
-                    'teacher': teacher_name,
-                })
+                rows.append((
+                    str(getattr(enrollment, 'academic_year', 'N/A')),
+                    str(getattr(enrollment, 'get_semester_display', lambda: 'N/A')()),
+                    getattr(subject, 'code', 'N/A'),
+                    subject.name,
+                    round(float(numeric_score), 2),
+                    teacher_name,
+                ))
         
-        # Grades Table
-        if transcript_data:
-            data = [['Academic Year', 'Semester', 'Subject Code', 'Subject Name', 'Result (out of 100)', 'Teacher']]
-            
-            for item in transcript_data:
-                data.append([
-                    item['academic_year'],
-                    item['semester'],
-                    item['subject_code'],
-                    item['subject_name'],
-                    str(int(item['score'])),
-                    item['teacher']
-                ])
-            
-            # Create table
-            table = Table(data)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ]))
-            story.append(table)
-            story.append(Spacer(1, 20))
-            
-            # Calculate class rank
-            class_rank = None
-            grade_level = getattr(student_profile, 'grade_level', None)
-            if grade_level:
-                try:
-                    peers = User.objects.filter(
-                        role='student',
-                        studentprofile__grade_level=grade_level
-                    )
-                    peer_data = []
-                    for peer in peers:
-                        peer_enrollments = Enrollment.objects.filter(student=peer)
-                        _, _, _, peer_avg = compute_numeric_scores(peer, peer_enrollments)
-                        if peer_avg is not None:
-                            peer_data.append({
-                                'student_id': peer.id,
-                                'average': peer_avg
-                            })
-                    peer_data.sort(key=lambda x: x['average'], reverse=True)
-                    for idx, peer in enumerate(peer_data, start=1):
-                        if peer['student_id'] == student.id:
-                            class_rank = idx
-                            break
-                except Exception:
-                    pass
-            
-            # Summary Section
-            summary_data = [
-                ['Total Result', str(int(total_result)) if total_result > 0 else 'N/A'],
-                ['Average Result', f"{average_result:.1f} / 100" if average_result else 'N/A'],
-                ['Class Rank', f"#{class_rank}" if class_rank else 'N/A']
-            ]
-            
-            summary_table = Table(summary_data)
-            summary_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 11),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey, colors.white])
-            ]))
-            story.append(summary_table)
-        else:
-            story.append(Paragraph("No transcript data available.", styles["Normal"]))
-        
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
+        # Calculate class rank
+        class_rank = None
+        if rows and getattr(student_profile, 'grade_level', None):
+            try:
+                rank_row = get_class_rank(student)
+                class_rank = rank_row.rank if rank_row else None
+            except Exception:
+                pass
         
-        from django.http import HttpResponse
-        response = HttpResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{student.username}_transcript.pdf"'
-        return response
+        transcript = transcript_data(
+            student, rows, class_rank,
+            columns=TRANSCRIPT_COLUMNS,
+            academic_year=getattr(student_profile, 'academic_year', None) or 'N/A',
+        )
+        return transcript_response(request, transcript, f"{student.username}_transcript.pdf")
         
     except Exception as e:
         import traceback
@@ -642,34 +504,11 @@ def pay_fees(request):
 def view_announcements(request):
     """View school announcements relevant to students"""
     try:
-        # Get all active announcements first
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Filter in Python instead of using contains lookup (works better with JSONField)
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            
-            # Handle different data types for target_roles
-            if isinstance(target_roles, str):
-                # If it's stored as a string, try to parse it
-                try:
-                    import json
-                    target_roles = json.loads(target_roles)
-                except:
-                    # If parsing fails, treat as comma-separated
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            
-            # Check if announcement targets students or is for everyone
-            # Empty list or no target_roles means show to all
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append(announcement)
-                
+        # Active announcements targeting students (or everyone), filtered in the database
+        relevant_announcements = list(visible_announcements('student')[:ANNOUNCEMENT_PAGE_SIZE])
     except Exception as e:
         # Fallback: get all active announcements if there's an error
-        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
+        relevant_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:ANNOUNCEMENT_PAGE_SIZE]
         print(f"Error filtering announcements: {e}")
     
     context = {
@@ -844,7 +683,7 @@ class StudentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Return only the student profile for the current user
-        return Student.objects.filter(user=self.request.user)
+        return Student.objects.filter(user=self.request.user).select_related('user')
     
     @action(detail=False, methods=['get'])
     def subject_registration(self, request):
@@ -900,7 +739,7 @@ def get_notifications_ajax(request):
             'success': True,
             'notifications': notifications_data,
             'count': len(notifications_data),
-            'unread_count': Notification.objects.filter(user=request.user, is_read=False).count()
+            'unread_count': get_unread_count(request.user)
         })
     except Exception as e:
         return JsonResponse({
@@ -912,24 +751,15 @@ def get_notifications_ajax(request):
 def get_announcements_ajax(request):
     """AJAX endpoint to fetch announcements for refresh"""
     try:
-        all_announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')[:10]
-        relevant_announcements = []
-        for announcement in all_announcements:
-            target_roles = getattr(announcement, 'target_roles', [])
-            if isinstance(target_roles, str):
-                try:
-                    target_roles = json.loads(target_roles)
-                except:
-                    target_roles = [role.strip() for role in target_roles.split(',') if role.strip()]
-            elif not isinstance(target_roles, list):
-                target_roles = []
-            if not target_roles or len(target_roles) == 0 or 'student' in target_roles:
-                relevant_announcements.append({
-                    'id': announcement.id,
-                    'title': announcement.title,
-                    'content': announcement.content,
-                    'created_at': announcement.created_at.strftime('%B %d, %Y at %I:%M %p'),
-                })
+        relevant_announcements = [
+            {
+                'id': announcement.id,
+                'title': announcement.title,
+                'content': announcement.content,
+                'created_at': announcement.created_at.strftime('%B %d, %Y at %I:%M %p'),
+            }
+            for announcement in visible_announcements('student')[:10]
+        ]
         return JsonResponse({
             'success': True,
             'announcements': relevant_announcements,
@@ -0,0 +1,35 @@
+# subjects/management/commands/check_timetable.py
+from django.core.management.base import BaseCommand, CommandError
+from subjects.models import Subject
+from subjects.scheduling import check_timetable
+
+
+class Command(BaseCommand):
+    help = 'Report every schedule clash of the active timetable by grade level, instructor and room'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grade-level', type=int, action='append', dest='grade_levels',
+                            help='Only subjects of this grade level (repeat for several)')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when clashes are found')
+
+    def handle(self, *args, **options):
+        subjects = Subject.objects.filter(is_active=True).select_related('instructor__user')
+        if options.get('grade_levels'):
+            subjects = subjects.filter(grade_level__in=options['grade_levels'])
+        clashes = check_timetable(subjects)
+
+        labels = {'grade': 'Grade', 'instructor': 'Instructor', 'room': 'Room'}
+        for clash in clashes:
+            resource = clash['resource']
+            if clash['kind'] == 'instructor':
+                resource = resource.user.get_full_name() or resource.user.username
+            self.stdout.write(self.style.WARNING(
+                f"{labels[clash['kind']]} {resource}, {clash['day']}: "
+                f"{clash['subject1'].code} ({clash['time1']}) overlaps {clash['subject2'].code} ({clash['time2']})"
+            ))
+        if not clashes:
+            self.stdout.write(self.style.SUCCESS('No schedule clashes found'))
+        elif options['fail']:
+            raise CommandError(f'{len(clashes)} schedule clashes found')
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(clashes)} schedule clashes found'))
@@ -0,0 +1,11 @@
+# subjects/management/commands/reset_seat_counters.py
+from django.core.management.base import BaseCommand
+from subjects.models import SubjectSeats
+
+
+class Command(BaseCommand):
+    help = 'Drop the per-term seat counters (after bulk enrollment imports or updates); they are recounted on next use'
+
+    def handle(self, *args, **options):
+        deleted, _ = SubjectSeats.objects.all().delete()
+        self.stdout.write(self.style.SUCCESS(f'Reset seat counters: {deleted} rows'))
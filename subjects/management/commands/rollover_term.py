@@ -0,0 +1,45 @@
+# subjects/management/commands/rollover_term.py
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from subjects.models import Enrollment
+from subjects.rollover import auto_enroll
+from users.views import get_current_academic_year, get_current_semester
+
+
+class Command(BaseCommand):
+    help = 'Enroll every approved student into the default subjects of their grade for a term (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--academic-year', help='Academic year (e.g. 2025-2026); the current one by default')
+        parser.add_argument('--semester', choices=[value for value, _ in Enrollment.SEMESTER_CHOICES],
+                            help='Semester; the current one by default')
+        parser.add_argument('--grade-level', type=int, action='append', dest='grade_levels',
+                            help='Only this grade level (repeat for several)')
+        parser.add_argument('--subject-type', action='append', dest='subject_types',
+                            help='Subject types to enroll (repeatable; default: AUTO_ENROLL_SUBJECT_TYPES)')
+        parser.add_argument('--status', default='pending', choices=[value for value, _ in Enrollment.STATUS_CHOICES],
+                            help='Status of the new enrollments')
+        parser.add_argument('--chunk-size', type=int, help='Enrollments inserted per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many enrollments would be created')
+
+    def handle(self, *args, **options):
+        academic_year = options.get('academic_year') or get_current_academic_year()
+        semester = options.get('semester') or get_current_semester()
+        try:
+            result = auto_enroll(
+                academic_year,
+                semester,
+                grade_levels=options.get('grade_levels'),
+                subject_types=options.get('subject_types'),
+                status=options['status'],
+                chunk_size=options.get('chunk_size'),
+                dry_run=options['dry_run'],
+            )
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['created']} enrollments for {academic_year} ({semester}): "
+            f"{result['students']} students, {result['subjects']} subjects, {result['existing']} already enrolled"
+        ))
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 05:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0004_add_assigned_by_registrar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectSeats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=9)),
+                ('semester', models.CharField(max_length=10)),
+                ('seats_available', models.IntegerField()),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_counters', to='subjects.subject')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='subjectseats',
+            constraint=models.UniqueConstraint(fields=('subject', 'academic_year', 'semester'), name='subject_seats_unique_term'),
+        ),
+    ]
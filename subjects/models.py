@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -6,6 +9,9 @@ import datetime
 
 User = get_user_model()
 
+# Enrollment statuses that occupy a seat in a subject for a term
+SEAT_STATUSES = ('approved', 'active')
+
 # ADD: Teacher Model
 class Teacher(models.Model):
     DAYS_OF_WEEK = [
@@ -114,29 +120,24 @@ class Subject(models.Model):
             )
         
         # NEW: Validate time conflicts for teacher
-        if self.day_of_week and self.start_time and self.end_time and self.instructor:
-            conflicting_subjects = Subject.objects.filter(
-                instructor=self.instructor,
-                day_of_week=self.day_of_week,
-                is_active=True
-            ).exclude(pk=self.pk)
-            
-            for subject in conflicting_subjects:
-                if (self.start_time < subject.end_time and self.end_time > subject.start_time):
-                    raise ValidationError(
-                        f"Time conflict with {subject.code} - {subject.schedule_display}"
-                    )
+        # the overlap test runs in the query, which returns at most one subject
+        from .scheduling import instructor_conflict
+        subject = instructor_conflict(self)
+        if subject:
+            raise ValidationError(
+                f"Time conflict with {subject.code} - {subject.schedule_display}"
+            )
         
         # NEW: Validate end time is after start time
         if self.start_time and self.end_time and self.end_time <= self.start_time:
             raise ValidationError("End time must be after start time")
     
     def current_enrollment_count(self, academic_year, semester):
-        """Get current enrollment count for this subject"""
+        """Get current enrollment count for this subject (approved and active students)"""
         return self.enrollments.filter(
             academic_year=academic_year,
             semester=semester,
-            status='active'
+            status__in=SEAT_STATUSES
         ).count()
 
     def is_available(self, academic_year, semester):
@@ -246,6 +247,29 @@ class Enrollment(models.Model):
         """Get human-readable semester name"""
         return dict(self.SEMESTER_CHOICES).get(self.semester, self.semester)
 
+class SubjectSeats(models.Model):
+    """Free seats of a subject in one term.
+
+    Registration takes a seat with one conditional UPDATE (see
+    subjects.registration.reserve_seat), so concurrent registrations can
+    never oversubscribe a subject. Rows are created on first use from the
+    current enrollments and kept in step by the receivers at the end of this
+    module; deleting them is always safe, they are counted again.
+    """
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='seat_counters')
+    academic_year = models.CharField(max_length=9)
+    semester = models.CharField(max_length=10)
+    # below zero only when enrollments were forced past capacity
+    seats_available = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'academic_year', 'semester'], name='subject_seats_unique_term'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject_id} {self.academic_year} {self.semester}: {self.seats_available} free"
+
 class Assignment(models.Model):
     subject = models.ForeignKey(
         Subject, 
@@ -330,4 +354,103 @@ class Attendance(models.Model):
     
     def __str__(self):
         return f"{self.enrollment.student.username} - {self.date} - {self.status}"
-    
\ No newline at end of file
+    
+
+
+# Keep SubjectSeats in step with single-row writes. bulk_update and
+# queryset.update() skip these, so bulk writers adjust the counters
+# themselves (subjects.registration). The apps have no AppConfig.ready(),
+# so receivers are registered here.
+
+def adjust_seat_counters(deltas):
+    """Add {(subject_id, academic_year, semester): change in free seats} to existing counters.
+
+    Missing counters are left alone: they are counted from the enrollments,
+    which already include the change, when first needed. Terms that get
+    seats back promote their waitlist straight away.
+    """
+    released = set()
+    for key, delta in deltas.items():
+        subject_id, academic_year, semester = key
+        if delta:
+            SubjectSeats.objects.filter(subject_id=subject_id, academic_year=academic_year, semester=semester).update(
+                seats_available=F('seats_available') + delta
+            )
+        if delta > 0:
+            released.add(key)
+    _promote_waitlists(released)
+
+
+def _promote_waitlists(keys):
+    if keys:
+        # subjects.registration imports this module
+        from .registration import promote_waitlist
+        promote_waitlist(keys)
+
+
+def _seat_key(enrollment):
+    # read from __dict__ so deferred fields are never loaded just to be remembered
+    values = enrollment.__dict__
+    if values.get('status') not in SEAT_STATUSES:
+        return None
+    return (values.get('subject_id'), values.get('academic_year'), values.get('semester'))
+
+
+def _seat_fields_loaded(enrollment):
+    return all(field in enrollment.__dict__ for field in ('status', 'subject_id', 'academic_year', 'semester'))
+
+
+@receiver(post_init, sender=Enrollment)
+def _remember_seat_key(sender, instance, **kwargs):
+    instance._seat_key = _seat_key(instance)
+    instance._seat_key_known = _seat_fields_loaded(instance)
+
+
+@receiver([pre_save, pre_delete], sender=Enrollment)
+def _load_seat_key(sender, instance, **kwargs):
+    if instance.pk and not instance._state.adding and not instance._seat_key_known:
+        stored = Enrollment.objects.filter(pk=instance.pk).only('status', 'subject_id', 'academic_year', 'semester').first()
+        instance._seat_key = _seat_key(stored) if stored else None
+        instance._seat_key_known = True
+
+
+@receiver(post_save, sender=Enrollment)
+def _update_seats_on_enrollment_save(sender, instance, created=False, **kwargs):
+    old_key = None if created else instance._seat_key
+    new_key = _seat_key(instance)
+    if old_key != new_key:
+        deltas = {}
+        if old_key:
+            deltas[old_key] = deltas.get(old_key, 0) + 1
+        # a seat taken with reserve_seat() is already counted
+        if new_key and not getattr(instance, '_seat_reserved', False):
+            deltas[new_key] = deltas.get(new_key, 0) - 1
+        adjust_seat_counters(deltas)
+    instance._seat_reserved = False
+    instance._seat_key = new_key
+    instance._seat_key_known = True
+
+
+@receiver(post_delete, sender=Enrollment)
+def _update_seats_on_enrollment_delete(sender, instance, **kwargs):
+    if instance._seat_key:
+        adjust_seat_counters({instance._seat_key: 1})
+
+
+@receiver(post_init, sender=Subject)
+def _remember_capacity(sender, instance, **kwargs):
+    instance._seat_capacity = instance.__dict__.get('max_capacity')
+
+
+@receiver(post_save, sender=Subject)
+def _update_seats_on_capacity_change(sender, instance, created=False, **kwargs):
+    capacity = instance.__dict__.get('max_capacity')
+    previous = instance._seat_capacity
+    instance._seat_capacity = capacity
+    if not created and capacity is not None and previous is not None and capacity != previous:
+        SubjectSeats.objects.filter(subject=instance).update(
+            seats_available=F('seats_available') + (capacity - previous)
+        )
+        if capacity > previous:
+            from .registration import waitlist_keys
+            _promote_waitlists(waitlist_keys([instance.pk]))
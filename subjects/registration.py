@@ -0,0 +1,263 @@
+"""Seat accounting and registration approval.
+
+Free seats per (subject, academic year, semester) live in SubjectSeats
+counters. reserve_seat() takes one with a single conditional UPDATE
+(`seats_available = seats_available - 1 WHERE seats_available > 0`), so
+concurrent registrations cannot oversubscribe a subject.
+
+approve_enrollments() settles any number of pending enrollments at once:
+they are grouped by term, the oldest requests (by enrolled_date) take the
+free seats of their group and the rest are waitlisted. Everything is
+written with bulk_update in one transaction.
+
+promote_waitlist() is the other direction: whenever seats are given back
+(a drop, a delete, a capacity increase; see the seat signals in
+subjects.models) the waitlist of that term, ordered by enrolled_date, is
+promoted into them in the same transaction and the students are notified.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from django.urls import reverse
+from notifications.models import Notification
+from notifications.push import notifications_changed
+from ranks.models import notify_grades_changed
+from .models import Enrollment, Subject, SubjectSeats, SEAT_STATUSES
+
+
+def seat_counts(keys):
+    """Seats taken per (subject_id, academic_year, semester) key, with one grouped query."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    counts = {key: 0 for key in keys}
+    rows = (
+        Enrollment.objects.filter(
+            status__in=SEAT_STATUSES,
+            subject_id__in={key[0] for key in keys},
+            academic_year__in={key[1] for key in keys},
+            semester__in={key[2] for key in keys},
+        )
+        .values_list('subject_id', 'academic_year', 'semester')
+        .annotate(taken=Count('id'))
+        .order_by()
+    )
+    for subject_id, academic_year, semester, taken in rows:
+        key = (subject_id, academic_year, semester)
+        if key in counts:
+            counts[key] = taken
+    return counts
+
+
+def _seat_counter(key):
+    subject_id, academic_year, semester = key
+    return SubjectSeats.objects.filter(subject_id=subject_id, academic_year=academic_year, semester=semester)
+
+
+def ensure_seat_counters(keys):
+    """Create the missing counters of (subject_id, academic_year, semester) keys from current enrollments."""
+    keys = set(keys)
+    existing = set()
+    if keys:
+        existing = set(
+            SubjectSeats.objects.filter(subject_id__in={key[0] for key in keys})
+            .values_list('subject_id', 'academic_year', 'semester')
+        )
+    missing = keys - existing
+    if missing:
+        capacity = dict(Subject.objects.filter(id__in={key[0] for key in missing}).values_list('id', 'max_capacity'))
+        taken = seat_counts(missing)
+        SubjectSeats.objects.bulk_create(
+            [
+                SubjectSeats(subject_id=key[0], academic_year=key[1], semester=key[2],
+                             seats_available=capacity.get(key[0], 0) - taken[key])
+                for key in missing if key[0] in capacity
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def reserve_seat(subject, academic_year, semester):
+    """Take one free seat; returns False when the subject is full.
+
+    Mark the enrollment saved afterwards with `_seat_reserved = True` so the
+    seat is not counted twice, and do both in one transaction so a failed
+    save gives the seat back.
+    """
+    counter = _seat_counter((getattr(subject, 'pk', subject), academic_year, semester))
+    if counter.filter(seats_available__gt=0).update(seats_available=F('seats_available') - 1):
+        return True
+    if counter.exists():
+        return False
+    ensure_seat_counters([(getattr(subject, 'pk', subject), academic_year, semester)])
+    return bool(counter.filter(seats_available__gt=0).update(seats_available=F('seats_available') - 1))
+
+
+def free_seats(subject_ids, academic_year, semester):
+    """Free seats per subject id in a term, read from the counters (created as needed)."""
+    subject_ids = list(subject_ids)
+    ensure_seat_counters((subject_id, academic_year, semester) for subject_id in subject_ids)
+    return dict(
+        SubjectSeats.objects.filter(subject_id__in=subject_ids, academic_year=academic_year, semester=semester)
+        .values_list('subject_id', 'seats_available')
+    )
+
+
+def _take_seats(key, wanted, free):
+    """Take up to `wanted` seats from a counter last seen with `free` seats; returns how many."""
+    counter = _seat_counter(key)
+    while wanted > 0:
+        take = min(free, wanted)
+        if take <= 0:
+            return 0
+        if counter.filter(seats_available__gte=take).update(seats_available=F('seats_available') - take):
+            return take
+        # someone else took seats in between (no row locks, e.g. SQLite): look again
+        free = counter.values_list('seats_available', flat=True).first() or 0
+    return 0
+
+
+def approve_enrollments(enrollment_ids, status='active', waitlist=True):
+    """Approve pending enrollments up to each subject's capacity, first come first served.
+
+    Returns {'approved': [...], 'waitlisted': [...], 'skipped': [...]} lists
+    of enrollment ids; skipped ids were not pending (or do not exist). With
+    waitlist=False requests that do not fit stay pending.
+    """
+    requested = {int(enrollment_id) for enrollment_id in enrollment_ids}
+    result = {'approved': [], 'waitlisted': [], 'skipped': []}
+    if not requested:
+        return result
+
+    with transaction.atomic():
+        pending = list(
+            Enrollment.objects.select_for_update()
+            .filter(id__in=requested, status='pending')
+            .only('id', 'subject_id', 'academic_year', 'semester', 'status', 'enrolled_date')
+            .order_by('enrolled_date', 'id')
+        )
+        groups = defaultdict(list)
+        for enrollment in pending:
+            groups[(enrollment.subject_id, enrollment.academic_year, enrollment.semester)].append(enrollment)
+
+        ensure_seat_counters(groups)
+        free = {
+            (row.subject_id, row.academic_year, row.semester): row.seats_available
+            for row in SubjectSeats.objects.select_for_update().filter(subject_id__in={key[0] for key in groups})
+        }
+
+        changed = []
+        for key, enrollments in groups.items():
+            remaining = _take_seats(key, len(enrollments), free.get(key, 0))
+            for enrollment in enrollments:
+                if remaining:
+                    enrollment.status = status
+                    remaining -= 1
+                    result['approved'].append(enrollment.id)
+                elif waitlist:
+                    enrollment.status = 'waitlisted'
+                    result['waitlisted'].append(enrollment.id)
+                else:
+                    continue
+                changed.append(enrollment)
+        # seats were taken from the counters above; bulk_update sends no signals
+        Enrollment.objects.bulk_update(changed, ['status'], batch_size=500)
+
+        if changed:
+            # bulk_update skips model signals; term statistics depend on status
+            notify_grades_changed((), {key[0] for key in groups})
+
+    result['skipped'] = sorted(requested - {enrollment.id for enrollment in pending})
+    return result
+
+
+def waitlist_keys(subject_ids):
+    """(subject_id, academic_year, semester) keys that have waitlisted enrollments."""
+    return set(
+        Enrollment.objects.filter(subject_id__in=list(subject_ids), status='waitlisted')
+        .values_list('subject_id', 'academic_year', 'semester')
+        .distinct()
+        .order_by()
+    )
+
+
+def notify_promoted(enrollments):
+    """Tell students their waitlisted enrollments were approved, with one bulk_create."""
+    enrollments = list(enrollments)
+    if not enrollments:
+        return
+    names = dict(Subject.objects.filter(id__in={e.subject_id for e in enrollments}).values_list('id', 'name'))
+    link = reverse('subject_registration')
+    Notification.objects.bulk_create([
+        Notification(
+            user_id=enrollment.student_id,
+            title='Waitlist Promotion',
+            message=f'A seat opened up in {names.get(enrollment.subject_id, "a subject")} for '
+                    f'{enrollment.academic_year} ({enrollment.semester}). Your enrollment is now approved.',
+            link=link,
+        )
+        for enrollment in enrollments
+    ])
+    # bulk_create sends no post_save, so the unread counters are bumped here
+    deltas = defaultdict(int)
+    for enrollment in enrollments:
+        deltas[enrollment.student_id] += 1
+    notifications_changed(deltas)
+
+
+def approve_waitlisted(enrollment):
+    """Approve one waitlisted enrollment out of queue order, if its term has a free seat.
+
+    Returns False (and changes nothing) when the subject is full or the
+    enrollment is no longer waitlisted. The student is notified.
+    """
+    with transaction.atomic():
+        enrollment = Enrollment.objects.select_for_update().filter(pk=enrollment.pk, status='waitlisted').first()
+        if enrollment is None or not reserve_seat(enrollment.subject_id, enrollment.academic_year, enrollment.semester):
+            return False
+        enrollment.status = 'approved'
+        enrollment._seat_reserved = True
+        enrollment.save()
+        notify_promoted([enrollment])
+    return True
+
+
+def promote_waitlist(keys):
+    """Fill the free seats of (subject_id, academic_year, semester) keys from their waitlists.
+
+    The oldest waitlisted requests of each term (by enrolled_date) are
+    approved, as many as it has free seats, all in one transaction, and each
+    promoted student is notified. Returns the promoted enrollment ids.
+    """
+    keys = set(keys)
+    promoted = []
+    if not keys:
+        return promoted
+
+    with transaction.atomic():
+        ensure_seat_counters(keys)
+        free = {
+            (row.subject_id, row.academic_year, row.semester): row.seats_available
+            for row in SubjectSeats.objects.select_for_update().filter(subject_id__in={key[0] for key in keys})
+        }
+        for key in sorted(keys):
+            if free.get(key, 0) <= 0:
+                continue
+            subject_id, academic_year, semester = key
+            queue = list(
+                Enrollment.objects.select_for_update()
+                .filter(subject_id=subject_id, academic_year=academic_year, semester=semester, status='waitlisted')
+                .only('id', 'student_id', 'subject_id', 'academic_year', 'semester', 'status', 'enrolled_date')
+                .order_by('enrolled_date', 'id')[:free[key]]
+            )
+            taken = _take_seats(key, len(queue), free[key])
+            for enrollment in queue[:taken]:
+                enrollment.status = 'approved'
+                promoted.append(enrollment)
+
+        if promoted:
+            # seats were taken from the counters above; bulk_update sends no signals
+            Enrollment.objects.bulk_update(promoted, ['status'], batch_size=500)
+            notify_promoted(promoted)
+            notify_grades_changed((), {enrollment.subject_id for enrollment in promoted})
+    return [enrollment.id for enrollment in promoted]
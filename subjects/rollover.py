@@ -0,0 +1,103 @@
+"""Term rollover: enroll whole grades into their default subjects at once.
+
+auto_enroll() builds the (student x subject) matrix of every grade level,
+reads the term's existing enrollments for those subjects in one query,
+bulk-inserts only the missing pairs, in chunks, and counts the term's rows
+around the insert to report how many it actually created. Students and subjects are
+matched on grade level up front, so the per-row Enrollment.clean() lookups
+are not needed, and re-running a rollover creates nothing new.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from ranks.models import notify_grades_changed
+from users.models import User
+from .models import Enrollment, Subject, SubjectSeats, SEAT_STATUSES
+
+
+def _check_academic_year(academic_year):
+    # same rule as Enrollment.clean(), checked once instead of per row
+    try:
+        valid = len(academic_year) == 9 and academic_year[4] == '-' and int(academic_year[5:]) == int(academic_year[:4]) + 1
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValidationError("Academic year should be in format YYYY-YYYY (e.g., 2024-2025)")
+
+
+def auto_enroll(academic_year, semester, grade_levels=None, subject_types=None, status='pending',
+                students=None, subjects=None, chunk_size=None, dry_run=False):
+    """Enroll students into the active subjects of their grade for a term.
+
+    `students` (default: approved, active student accounts) and `subjects`
+    (default: active subjects of AUTO_ENROLL_SUBJECT_TYPES) are querysets
+    that narrow the matrix, as does `grade_levels`. Existing enrollments of
+    a pair are left untouched whatever their status, including ones a
+    concurrent registration inserts while this runs. Returns counts:
+    {'created', 'existing', 'students', 'subjects'}; with dry_run nothing is
+    written and 'created' is what would be.
+    """
+    _check_academic_year(academic_year)
+    if subjects is None:
+        subject_types = subject_types or getattr(settings, 'AUTO_ENROLL_SUBJECT_TYPES', ['core'])
+        subjects = Subject.objects.filter(is_active=True, subject_type__in=subject_types)
+    if students is None:
+        students = User.objects.filter(role='student', is_approved=True, is_active=True)
+    if grade_levels is not None:
+        subjects = subjects.filter(grade_level__in=list(grade_levels))
+        students = students.filter(studentprofile__grade_level__in=list(grade_levels))
+
+    subjects_by_grade = defaultdict(list)
+    for subject_id, grade_level in subjects.values_list('id', 'grade_level').order_by('grade_level', 'code'):
+        subjects_by_grade[grade_level].append(subject_id)
+    subject_ids = [subject_id for ids in subjects_by_grade.values() for subject_id in ids]
+    student_rows = list(
+        students.filter(studentprofile__grade_level__in=list(subjects_by_grade))
+        .values_list('id', 'studentprofile__grade_level')
+        .order_by('id')
+    )
+    result = {'created': 0, 'existing': 0, 'students': len(student_rows), 'subjects': len(subject_ids)}
+    if not student_rows:
+        return result
+
+    existing = set(
+        Enrollment.objects.filter(academic_year=academic_year, semester=semester, subject_id__in=subject_ids)
+        .values_list('student_id', 'subject_id')
+        .order_by()
+    )
+    missing = [
+        (student_id, subject_id)
+        for student_id, grade_level in student_rows
+        for subject_id in subjects_by_grade[grade_level]
+        if (student_id, subject_id) not in existing
+    ]
+    matrix_size = sum(len(subjects_by_grade[grade_level]) for _, grade_level in student_rows)
+    result['existing'] = matrix_size - len(missing)
+    result['created'] = len(missing)
+    if dry_run or not missing:
+        return result
+
+    chunk_size = chunk_size or getattr(settings, 'ENROLLMENT_ROLLOVER_CHUNK_SIZE', 1000)
+    term_enrollments = Enrollment.objects.filter(academic_year=academic_year, semester=semester, subject_id__in=subject_ids)
+    with transaction.atomic():
+        # a registration racing the rollover may have added a pair since the diff;
+        # ignore_conflicts skips it silently, so the rows are counted around the insert
+        before = term_enrollments.count()
+        for start in range(0, len(missing), chunk_size):
+            Enrollment.objects.bulk_create(
+                [
+                    Enrollment(student_id=student_id, subject_id=subject_id, academic_year=academic_year,
+                               semester=semester, status=status, is_auto_assigned=True)
+                    for student_id, subject_id in missing[start:start + chunk_size]
+                ],
+                ignore_conflicts=True,
+            )
+        result['created'] = max(0, min(term_enrollments.count() - before, len(missing)))
+        result['existing'] = matrix_size - result['created']
+        touched_subjects = {subject_id for _, subject_id in missing}
+        if status in SEAT_STATUSES:
+            # bulk_create skips the seat signals; the counters are recounted on next use
+            SubjectSeats.objects.filter(subject_id__in=touched_subjects, academic_year=academic_year, semester=semester).delete()
+        notify_grades_changed({student_id for student_id, _ in missing}, touched_subjects)
+    return result
@@ -0,0 +1,111 @@
+"""Schedule clashes between subjects.
+
+Subjects meet once a week in one slot (day_of_week, start_time, end_time).
+find_overlaps() sorts each day's slots by start time and sweeps them with a
+heap of the slots still running, so a day of n subjects costs O(n log n)
+plus the clashes found instead of comparing every pair. It serves a
+student's selection (users.views.check_schedule_conflicts) and, grouped by
+grade, instructor and room, the whole timetable (check_timetable()).
+"""
+import heapq
+from collections import defaultdict
+from .models import Subject, Teacher
+
+DAY_ORDER = {day: index for index, (day, _) in enumerate(Teacher.DAYS_OF_WEEK)}
+
+
+def is_scheduled(subject):
+    return bool(subject.day_of_week and subject.start_time and subject.end_time)
+
+
+def find_overlaps(subjects):
+    """(earlier, later) pairs of subjects whose slots overlap on the same day.
+
+    Slots that only touch (one ends when the other starts) do not clash;
+    unscheduled subjects are ignored. Pairs come day by day, in start order.
+    """
+    days = defaultdict(list)
+    for subject in subjects:
+        if is_scheduled(subject):
+            days[subject.day_of_week].append(subject)
+
+    pairs = []
+    for day in sorted(days, key=lambda day: DAY_ORDER.get(day, len(DAY_ORDER))):
+        slots = sorted(days[day], key=lambda s: (s.start_time, s.end_time, s.pk or 0))
+        running = []  # heap of (end_time, index into slots)
+        for index, subject in enumerate(slots):
+            while running and running[0][0] <= subject.start_time:
+                heapq.heappop(running)
+            pairs.extend((slots[other], subject) for other in sorted(other for _, other in running))
+            heapq.heappush(running, (subject.end_time, index))
+    return pairs
+
+
+def describe_overlap(subject1, subject2):
+    """Template/JSON-friendly description of a clash between two subjects."""
+    return {
+        'subject1': subject1,
+        'subject2': subject2,
+        'day': subject1.get_day_of_week_display(),
+        'time1': f"{subject1.start_time.strftime('%H:%M')} - {subject1.end_time.strftime('%H:%M')}",
+        'time2': f"{subject2.start_time.strftime('%H:%M')} - {subject2.end_time.strftime('%H:%M')}",
+    }
+
+
+def instructor_conflict(subject):
+    """First active subject of the same instructor meeting at an overlapping time, or None."""
+    if not (is_scheduled(subject) and subject.instructor_id):
+        return None
+    return (
+        Subject.objects.filter(
+            instructor_id=subject.instructor_id,
+            day_of_week=subject.day_of_week,
+            is_active=True,
+            start_time__lt=subject.end_time,
+            end_time__gt=subject.start_time,
+        )
+        .exclude(pk=subject.pk)
+        .order_by('start_time')
+        .first()
+    )
+
+
+def check_timetable(subjects=None):
+    """Every clash of a timetable (default: all active subjects) in one pass.
+
+    Subjects are loaded once and grouped by grade level, instructor and room;
+    each group is swept with find_overlaps(). Returns describe_overlap()
+    dicts with two more keys: 'kind' ('grade', 'instructor' or 'room') and
+    'resource' (the grade level, the Teacher or the room name).
+    """
+    if subjects is None:
+        subjects = Subject.objects.filter(is_active=True).select_related('instructor__user')
+    groups = defaultdict(list)
+    instructors = {}
+    for subject in subjects:
+        if not is_scheduled(subject):
+            continue
+        groups[('grade', subject.grade_level)].append(subject)
+        if subject.instructor_id:
+            instructors[subject.instructor_id] = subject.instructor
+            groups[('instructor', subject.instructor_id)].append(subject)
+        room = subject.room.strip()
+        if room:
+            # 'Lab 1' and 'lab 1 ' are the same room
+            groups[('room', room.casefold())].append(subject)
+
+    clashes = []
+    for (kind, key), members in groups.items():
+        if len(members) < 2:
+            continue
+        if kind == 'instructor':
+            resource = instructors[key]
+        elif kind == 'room':
+            resource = members[0].room.strip()
+        else:
+            resource = key
+        for subject1, subject2 in find_overlaps(members):
+            clash = describe_overlap(subject1, subject2)
+            clash.update(kind=kind, resource=resource)
+            clashes.append(clash)
+    return clashes
@@ -1,14 +1,15 @@
 from rest_framework import serializers
+from sims.api import FieldSelectionMixin
 from .models import Subject, Enrollment  # Changed from Course to Subject
 
-class SubjectSerializer(serializers.ModelSerializer):
-    teacher_name = serializers.CharField(source="teacher.get_full_name", read_only=True)
+class SubjectSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    teacher_name = serializers.CharField(source="instructor.user.get_full_name", read_only=True)
     
     class Meta:
         model = Subject  # Changed from Course to Subject
         fields = "__all__"
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Enrollment
         fields = "__all__"
\ No newline at end of file
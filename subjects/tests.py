@@ -0,0 +1,190 @@
+import datetime
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.test import TestCase
+from users.models import User, StudentProfile
+from subjects.models import Subject, SubjectSeats, Enrollment, Teacher
+from subjects.registration import approve_enrollments, reserve_seat
+from subjects.rollover import auto_enroll
+from subjects.scheduling import check_timetable, find_overlaps
+from notifications.models import Notification
+from notifications.push import get_unread_count
+
+
+class RegistrationApprovalTests(TestCase):
+    def setUp(self):
+        self.subjects = [Subject.objects.create(name=f'Biology {idx}', code=f'BIO60{idx}', grade_level=6, max_capacity=2) for idx in range(2)]
+        self.students = []
+        for idx in range(4):
+            user = User.objects.create_user(username=f'reg_{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'R{idx}', grade_level=6)
+            self.students.append(user)
+
+    def enroll(self, student, subject, status='pending', days_ago=0):
+        return Enrollment.objects.create(
+            student=student, subject=subject, academic_year='2024-2025', semester='first', status=status,
+            enrolled_date=datetime.date(2024, 9, 1) - datetime.timedelta(days=days_ago),
+        )
+
+    def test_bulk_approval_fills_capacity_fifo_and_waitlists_the_rest(self):
+        self.enroll(self.students[0], self.subjects[0], status='active')
+        # oldest request first, whatever order the ids come in
+        newest = self.enroll(self.students[1], self.subjects[0], days_ago=0)
+        oldest = self.enroll(self.students[2], self.subjects[0], days_ago=5)
+        other = [self.enroll(student, self.subjects[1]) for student in self.students[1:]]
+
+        # savepoint, pending rows, counters (created here on first use: 4), one UPDATE per subject, bulk_update
+        with self.assertNumQueries(11):
+            result = approve_enrollments([newest.id, oldest.id] + [e.id for e in other] + [newest.id + 1000])
+
+        self.assertEqual(sorted(result['approved']), sorted([oldest.id, other[0].id, other[1].id]))
+        self.assertEqual(sorted(result['waitlisted']), sorted([newest.id, other[2].id]))
+        self.assertEqual(result['skipped'], [newest.id + 1000])
+        self.assertEqual(self.subjects[0].current_enrollment_count('2024-2025', 'first'), 2)
+        self.assertEqual(Enrollment.objects.get(id=newest.id).status, 'waitlisted')
+
+    def test_seat_counter_is_taken_conditionally_and_follows_status_changes(self):
+        subject = self.subjects[0]
+        counter = lambda: SubjectSeats.objects.get(subject=subject, academic_year='2024-2025', semester='first').seats_available
+        first = self.enroll(self.students[0], subject, status='active')
+        self.assertTrue(reserve_seat(subject, '2024-2025', 'first'))  # creates the counter: 2 - 1 taken - 1
+        self.assertEqual(counter(), 0)
+        with self.assertNumQueries(2):  # the conditional UPDATE, then telling "full" from "no counter yet"
+            self.assertFalse(reserve_seat(subject, '2024-2025', 'first'))
+
+        first.status = 'dropped'
+        first.save()
+        self.assertEqual(counter(), 1)
+        subject.max_capacity = 3
+        subject.save()
+        self.assertEqual(counter(), 2)
+
+        pending = [self.enroll(student, subject) for student in self.students[1:]]
+        result = approve_enrollments([e.id for e in pending])
+        self.assertEqual((len(result['approved']), len(result['waitlisted'])), (2, 1))
+        self.assertEqual(counter(), 0)
+
+    def test_freed_seats_promote_the_waitlist_in_request_order(self):
+        subject = self.subjects[0]
+        dropping = self.enroll(self.students[0], subject, status='active')
+        self.enroll(self.students[1], subject, status='active')
+        later = self.enroll(self.students[2], subject, status='waitlisted', days_ago=1)
+        earlier = self.enroll(self.students[3], subject, status='waitlisted', days_ago=3)
+
+        dropping.status = 'dropped'
+        dropping.save()
+        self.assertEqual(Enrollment.objects.get(id=earlier.id).status, 'approved')
+        self.assertEqual(Enrollment.objects.get(id=later.id).status, 'waitlisted')
+        self.assertEqual(get_unread_count(self.students[3]), 1)
+        self.assertEqual(Notification.objects.get(user=self.students[3]).title, 'Waitlist Promotion')
+
+        subject.max_capacity = 4
+        subject.save()
+        self.assertEqual(Enrollment.objects.get(id=later.id).status, 'approved')
+        self.assertEqual(SubjectSeats.objects.get(subject=subject).seats_available, 1)
+        self.assertFalse(Notification.objects.filter(user=self.students[1]).exists())
+
+
+class TermRolloverTests(TestCase):
+    def test_rollover_inserts_only_missing_pairs_in_fixed_queries(self):
+        core = [Subject.objects.create(name=f'Core {grade}', code=f'CORE{grade}', grade_level=grade, max_capacity=30) for grade in (6, 7)]
+        Subject.objects.create(name='Art 6', code='ART6', grade_level=6, subject_type='elective', max_capacity=30)
+        students = []
+        for idx, grade in enumerate((6, 6, 7, 7, 7)):
+            user = User.objects.create_user(username=f'roll_{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'RO{idx}', grade_level=grade)
+            students.append(user)
+        Enrollment.objects.create(student=students[0], subject=core[0], academic_year='2025-2026', semester='first', status='dropped')
+
+        # subjects, students, existing enrollments, then a count, one insert and a recount in a savepoint;
+        # ranks refresh after commit
+        with self.assertNumQueries(8):
+            result = auto_enroll('2025-2026', 'first', chunk_size=100)
+        self.assertEqual(result, {'created': 4, 'existing': 1, 'students': 5, 'subjects': 2})
+        self.assertEqual(Enrollment.objects.filter(academic_year='2025-2026', is_auto_assigned=True, status='pending').count(), 4)
+        self.assertEqual(Enrollment.objects.get(student=students[0], subject=core[0]).status, 'dropped')
+        self.assertEqual(auto_enroll('2025-2026', 'first')['created'], 0)
+
+
+    def test_rows_inserted_concurrently_are_not_counted_as_created(self):
+        subject = Subject.objects.create(name='Core 8', code='CORE8', grade_level=8, max_capacity=30)
+        students = []
+        for idx in range(3):
+            user = User.objects.create_user(username=f'race_{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'RA{idx}', grade_level=8)
+            students.append(user)
+        real_atomic = transaction.atomic
+
+        def registration_wins(*args, **kwargs):
+            # a registration commits one of the pairs between the diff and the insert
+            patcher.stop()
+            Enrollment.objects.create(student=students[1], subject=subject, academic_year='2025-2026', semester='first')
+            return real_atomic(*args, **kwargs)
+
+        patcher = mock.patch.object(transaction, 'atomic', registration_wins)
+        patcher.start()
+        result = auto_enroll('2025-2026', 'first')
+        self.assertEqual((result['created'], result['existing']), (2, 1))
+        self.assertEqual(Enrollment.objects.filter(subject=subject).count(), 3)
+
+class ScheduleConflictTests(TestCase):
+    def subject(self, code, start, end, day='mon', grade=6, instructor=None, room=''):
+        return Subject.objects.create(
+            name=code, code=code, grade_level=grade, day_of_week=day, room=room, instructor=instructor,
+            start_time=datetime.time(start), end_time=datetime.time(end),
+        )
+
+    def test_sweep_finds_nested_and_chained_overlaps_but_not_touching_slots(self):
+        long = self.subject('LONG', 8, 12)
+        first = self.subject('FIRST', 9, 10)
+        second = self.subject('SECOND', 10, 11)
+        after = self.subject('AFTER', 12, 13)
+        tuesday = self.subject('TUE', 9, 10, day='tue')
+        pairs = find_overlaps([after, second, tuesday, first, long])
+        self.assertEqual([(a.code, b.code) for a, b in pairs], [('LONG', 'FIRST'), ('LONG', 'SECOND')])
+
+    def test_timetable_check_reports_grade_instructor_and_room_clashes(self):
+        user = User.objects.create_user(username='sched_teacher', password='pass', role='teacher')
+        teacher = Teacher.objects.create(user=user, teacher_id='T-S1')
+        self.subject('G6A', 9, 11, instructor=teacher, room='Lab 1')
+        self.subject('G7A', 10, 12, grade=7, instructor=teacher, room='lab 1 ')
+        self.subject('G7B', 11, 12, grade=7)
+
+        with self.assertNumQueries(1):
+            clashes = check_timetable()
+        found = sorted((c['kind'], c['subject1'].code, c['subject2'].code) for c in clashes)
+        self.assertEqual(found, [('grade', 'G7A', 'G7B'), ('instructor', 'G6A', 'G7A'), ('room', 'G6A', 'G7A')])
+
+        clash = self.subject('G6B', 10, 11)
+        clash.instructor = teacher
+        with self.assertRaises(ValidationError):
+            clash.clean()
+
+
+class WaitlistApprovalViewTests(TestCase):
+    def test_registrar_cannot_approve_a_waitlisted_student_into_a_full_subject(self):
+        subject = Subject.objects.create(name='Chemistry 6', code='CHE601', grade_level=6, max_capacity=1)
+        students = []
+        for idx in range(2):
+            user = User.objects.create_user(username=f'wait_{idx}', password='pass', role='student', is_approved=True)
+            StudentProfile.objects.create(user=user, student_id=f'W{idx}', grade_level=6)
+            students.append(user)
+        seated = Enrollment.objects.create(student=students[0], subject=subject, academic_year='2024-2025', semester='first', status='active')
+        waiting = Enrollment.objects.create(student=students[1], subject=subject, academic_year='2024-2025', semester='first', status='waitlisted')
+        registrar = User.objects.create_user(username='wait_registrar', password='pass', role='registrar', is_approved=True)
+        self.client.force_login(registrar)
+        # the users app registers a view under the same name, so reverse() does not reach this one
+        url = '/registrar/approve-registrations/'
+
+        self.client.post(url, {'enrollment_id': waiting.id, 'action': 'approve_waitlist'})
+        self.assertEqual(Enrollment.objects.get(id=waiting.id).status, 'waitlisted')
+        self.assertEqual(SubjectSeats.objects.get(subject=subject).seats_available, 0)
+
+        # a free seat is taken by the manual approval rather than the queue
+        SubjectSeats.objects.filter(subject=subject).update(seats_available=1)
+        self.client.post(url, {'enrollment_id': waiting.id, 'action': 'approve_waitlist'})
+        self.assertEqual(Enrollment.objects.get(id=waiting.id).status, 'approved')
+        self.assertEqual(SubjectSeats.objects.get(subject=subject).seats_available, 0)
+        self.assertEqual(get_unread_count(students[1]), 1)
+        self.assertEqual(Enrollment.objects.get(id=seated.id).status, 'active')
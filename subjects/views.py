@@ -1,12 +1,15 @@
 # subjects/views.py
 from rest_framework import viewsets
+from sims.api import StudentFilterMixin
 from .models import Subject, Enrollment  # Make sure these models exist
 from .serializers import SubjectSerializer, EnrollmentSerializer  # And these serializers
 
 class SubjectViewSet(viewsets.ModelViewSet):
-    queryset = Subject.objects.all()
+    # teacher_name reads instructor.user
+    queryset = Subject.objects.select_related('instructor__user')
     serializer_class = SubjectSerializer
 
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(StudentFilterMixin, viewsets.ModelViewSet):
+    # only foreign key ids are serialized, so no joins are needed
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
\ No newline at end of file
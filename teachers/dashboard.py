@@ -0,0 +1,142 @@
+"""Per-teacher, per-term dashboard snapshot built from grouped queries and cached.
+
+The snapshot holds what the dashboard used to compute student by student:
+per-student term averages across the teacher's subjects, per-subject averages
+and pending-score counts. Score writes made through the teacher views patch
+the cached snapshots in place; everything else is picked up when the
+snapshot expires.
+"""
+from django.core.cache import cache
+from django.db.models import Avg, Count, Exists, OuterRef
+from users.models import User
+from subjects.models import Enrollment
+from ranks.models import Grade, build_rank_map
+
+DASHBOARD_SNAPSHOT_TIMEOUT = 5 * 60
+ACTIVE_ENROLLMENT_STATUSES = ['approved', 'active']
+
+
+def term_student_averages(subject_ids, academic_year, semester, student_ids=None):
+    """Return {student_id: average score} across `subject_ids` for a term.
+
+    Only grades of subjects the student is approved/active in for the term
+    count, matching the per-student loops this replaces. One grouped query;
+    students without a score are absent from the result.
+    """
+    enrolled = Enrollment.objects.filter(
+        student_id=OuterRef('student_id'),
+        subject_id=OuterRef('subject_id'),
+        academic_year=academic_year,
+        semester=semester,
+        status__in=ACTIVE_ENROLLMENT_STATUSES,
+    )
+    grades = Grade.objects.filter(subject_id__in=subject_ids, score__isnull=False).filter(Exists(enrolled))
+    if student_ids is not None:
+        grades = grades.filter(student_id__in=student_ids)
+    return {
+        row['student']: round(row['avg'], 2)
+        for row in grades.values('student').annotate(avg=Avg('score')).order_by()
+    }
+
+
+def average_rank_map(averages):
+    """Tie-aware ranks (ties share a rank) for {student_id: average}; None averages are unranked."""
+    return build_rank_map(
+        {'student_id': student_id, 'grade_level': 0, 'average': average}
+        for student_id, average in averages.items()
+    )
+
+
+def _subject_averages(subject_ids):
+    return {
+        row['subject']: round(row['avg'], 2) if row['avg'] is not None else None
+        for row in Grade.objects.filter(subject_id__in=subject_ids).values('subject').annotate(avg=Avg('score')).order_by()
+    }
+
+
+def _pending_counts(**filters):
+    return {
+        row['subject']: row['count']
+        for row in Grade.objects.filter(score__isnull=True, **filters).values('subject').annotate(count=Count('id')).order_by()
+    }
+
+
+def _registry_key(teacher_id):
+    return f'teachers:dashboard_snapshots:{teacher_id}'
+
+
+def get_dashboard_snapshot(teacher, subject_ids, academic_year, semester):
+    """Return the cached dashboard snapshot for a teacher's subjects in a term.
+
+    `subject_ids` are the subjects shown on the dashboard; they are part of
+    the cache key, so assigning or filtering subjects gives a fresh snapshot.
+    A cold snapshot costs five grouped queries regardless of class sizes.
+    """
+    subject_ids = sorted(subject_ids)
+    key = f'teachers:dashboard:{teacher.id}:{academic_year}:{semester}:{",".join(map(str, subject_ids))}'
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    student_ids = set(Enrollment.objects.filter(
+        subject_id__in=subject_ids,
+        status__in=ACTIVE_ENROLLMENT_STATUSES,
+        academic_year=academic_year,
+        semester=semester,
+    ).order_by().values_list('student_id', flat=True).distinct())
+    snapshot = {
+        'key': key,
+        'academic_year': academic_year,
+        'semester': semester,
+        'subject_ids': subject_ids,
+        'students': User.objects.in_bulk(student_ids),
+        'averages': term_student_averages(subject_ids, academic_year, semester),
+        'subject_averages': _subject_averages(subject_ids),
+        # pending scores cover every subject of the teacher, as the dashboard always showed
+        'pending': _pending_counts(subject__instructor__user=teacher),
+    }
+    cache.set(key, snapshot, DASHBOARD_SNAPSHOT_TIMEOUT)
+    registry = cache.get(_registry_key(teacher.id)) or []
+    if key not in registry:
+        cache.set(_registry_key(teacher.id), registry + [key], DASHBOARD_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def snapshot_ranking(snapshot):
+    """Students of a snapshot ordered by average (best first) with their tie-aware rank."""
+    averages = snapshot['averages']
+    ranks = average_rank_map(averages)
+    ranked = [
+        {'id': student_id, 'avg': averages.get(student_id), 'student': student, 'rank': ranks.get(student_id)}
+        for student_id, student in snapshot['students'].items()
+    ]
+    ranked.sort(key=lambda x: (-(x['avg'] or -1), x['student'].get_full_name()))
+    return ranked
+
+
+def refresh_dashboard_snapshots(teacher_id, subject_id, student_ids=None):
+    """Patch a teacher's cached snapshots after scores of one subject changed.
+
+    Recomputes only the affected students' term averages (all of them when
+    `student_ids` is None), the subject average and its pending count.
+    """
+    registry = cache.get(_registry_key(teacher_id)) or []
+    live = []
+    for key in registry:
+        snapshot = cache.get(key)
+        if snapshot is None:
+            continue
+        live.append(key)
+        if subject_id in snapshot['subject_ids']:
+            affected = set(snapshot['students']) if student_ids is None else set(student_ids) & set(snapshot['students'])
+            if affected:
+                for student_id in affected:
+                    snapshot['averages'].pop(student_id, None)
+                snapshot['averages'].update(term_student_averages(
+                    snapshot['subject_ids'], snapshot['academic_year'], snapshot['semester'], affected,
+                ))
+            snapshot['subject_averages'].update(_subject_averages([subject_id]))
+        snapshot['pending'][subject_id] = _pending_counts(subject_id=subject_id).get(subject_id, 0)
+        cache.set(key, snapshot, DASHBOARD_SNAPSHOT_TIMEOUT)
+    if live != registry:
+        cache.set(_registry_key(teacher_id), live, DASHBOARD_SNAPSHOT_TIMEOUT)
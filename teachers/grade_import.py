@@ -0,0 +1,224 @@
+"""Score parsing shared by the grade entry form and the bulk CSV/XLSX import."""
+import csv
+import io
+import math
+from itertools import islice
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from users.models import StudentProfile
+from subjects.models import Enrollment
+from ranks.models import Grade, letter_grade_to_numeric, notify_grades_changed
+
+try:
+    from openpyxl import load_workbook
+    OPENPYXL_AVAILABLE = True
+except Exception:
+    OPENPYXL_AVAILABLE = False
+
+GRADE_COMPONENT_FIELDS = ('quiz_score', 'mid_score', 'assignment_score', 'final_exam_score')
+IMPORT_CHUNK_SIZE = 500
+# Errors kept for the downloadable report; the summary still counts all of them
+MAX_REPORTED_ERRORS = 1000
+
+# Accepted spreadsheet headers -> import field
+IMPORT_COLUMNS = {
+    'student_id': 'student_id',
+    'quiz': 'quiz', 'quiz_score': 'quiz',
+    'mid': 'mid', 'mid_score': 'mid', 'midterm': 'mid',
+    'assignment': 'assignment', 'assign': 'assignment', 'assignment_score': 'assignment',
+    'final': 'final', 'final_exam': 'final', 'final_exam_score': 'final',
+    'total': 'total', 'score': 'total', 'grade': 'total',
+    'result': 'result', 'remarks': 'result',
+}
+
+
+def clean_grade_values(quiz=None, mid=None, assignment=None, final=None, total=None, result=None):
+    """Turn raw score inputs into the values stored on a ranks Grade.
+
+    With any component given, the total is their clamped sum unless `total`
+    overrides it (the teacher edited the average); otherwise `total` is the
+    score itself. Returns (values, error): values is None for a blank row,
+    error is a message when an input is not a finite number.
+    """
+    raw = {'quiz': quiz, 'mid': mid, 'assignment': assignment, 'final': final, 'total': total}
+    if not any(value not in (None, '') for value in raw.values()):
+        return None, None
+
+    parsed = {}
+    for label, value in raw.items():
+        if value is None or value == '':
+            parsed[label] = None
+            continue
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            return None, f'{label} "{value}" is not a number'
+        # 'inf', 'nan' and '1e999' parse as floats but are no score (int() would raise)
+        if not math.isfinite(number):
+            return None, f'{label} "{value}" is not a number'
+        parsed[label] = int(number)
+
+    quiz, mid, assignment, final = parsed['quiz'], parsed['mid'], parsed['assignment'], parsed['final']
+    if quiz is None and mid is None and assignment is None and final is None:
+        # legacy path: use single score field
+        score = parsed['total']
+    elif parsed['total'] is not None:
+        # override average provided, use it as the total
+        score = parsed['total']
+    else:
+        # clamp components to their max values and treat None as 0
+        quiz = 0 if quiz is None else max(0, min(5, quiz))
+        mid = 0 if mid is None else max(0, min(25, mid))
+        assignment = 0 if assignment is None else max(0, min(20, assignment))
+        final = 0 if final is None else max(0, min(50, final))
+        score = quiz + mid + assignment + final
+
+    return {
+        # Clamp total 0-100
+        'score': max(0, min(100, score)),
+        'quiz_score': quiz,
+        'mid_score': mid,
+        'assignment_score': assignment,
+        'final_exam_score': final,
+        'result': result,
+    }, None
+
+
+def build_grade(student_id, subject, values, existing=None):
+    """Unsaved Grade for an upsert; blank components keep the stored value."""
+    grade = Grade(student_id=student_id, subject=subject, score=values['score'])
+    for field in GRADE_COMPONENT_FIELDS:
+        value = values[field]
+        if value is None and existing is not None:
+            value = getattr(existing, field)
+        setattr(grade, field, value)
+    grade.remarks = existing.remarks if existing is not None else ''
+    if values['result'] is not None:
+        grade.remarks = values['result']
+    return grade
+
+
+def upsert_grades(grades):
+    """Insert or update Grade rows on (student, subject) with one query."""
+    return Grade.objects.bulk_create(
+        grades,
+        update_conflicts=True,
+        unique_fields=['student', 'subject'],
+        update_fields=['score', *GRADE_COMPONENT_FIELDS, 'remarks'],
+    )
+
+
+def iter_upload_rows(upload):
+    """Yield (line_number, row) pairs from an uploaded CSV or XLSX file.
+
+    Rows are dicts keyed by the normalized header. The file is streamed, never
+    loaded whole into memory.
+    """
+    if upload.name.lower().endswith('.xlsx'):
+        if not OPENPYXL_AVAILABLE:
+            raise ValueError('XLSX import requires openpyxl. Install with `pip install openpyxl` or upload a CSV.')
+        sheet = load_workbook(upload, read_only=True, data_only=True).active
+        rows = (['' if cell is None else str(cell) for cell in row] for row in sheet.iter_rows(values_only=True))
+    else:
+        rows = csv.reader(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+
+    header = next(rows, None)
+    if not header:
+        raise ValueError('The file is empty.')
+    columns = [IMPORT_COLUMNS.get(name.strip().lower()) for name in header]
+    if 'student_id' not in columns:
+        raise ValueError('The file needs a student_id column.')
+    if not any(column and column not in ('student_id', 'result') for column in columns):
+        raise ValueError('The file needs a total or quiz/mid/assignment/final column.')
+
+    for line_number, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield line_number, {
+            column: cell.strip()
+            for column, cell in zip(columns, row)
+            if column
+        }
+
+
+def import_grades(upload, subject, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import scores for one subject from an uploaded CSV/XLSX file.
+
+    Each chunk costs three queries: resolve its student_ids, load their
+    existing grades, and one upsert. Rows that fail validation are skipped
+    and reported. Returns (imported_count, skipped_count, errors) with
+    errors as (line, student_id, message) tuples, capped at
+    MAX_REPORTED_ERRORS plus one summary row for the rest; skipped_count is
+    the number of rejected rows.
+    """
+    rows = iter_upload_rows(upload)
+    imported = 0
+    error_count = 0
+    errors = []
+    touched_students = set()
+
+    def report(line_number, student_id, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line_number, student_id, message))
+
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            codes = {row.get('student_id') for _, row in chunk if row.get('student_id')}
+            profiles = {
+                profile.student_id: profile
+                for profile in StudentProfile.objects.filter(student_id__in=codes, user__role='student').annotate(
+                    enrolled=Exists(Enrollment.objects.filter(
+                        student_id=OuterRef('user_id'), subject=subject, status__in=['approved', 'active'],
+                    )),
+                )
+            }
+            existing = {
+                grade.student_id: grade
+                for grade in Grade.objects.filter(subject=subject, student_id__in=[p.user_id for p in profiles.values()])
+            }
+
+            # last row wins when a student appears twice
+            chunk_grades = {}
+            for line_number, row in chunk:
+                code = row.get('student_id', '')
+                profile = profiles.get(code)
+                if not code:
+                    report(line_number, code, 'missing student_id')
+                    continue
+                if profile is None:
+                    report(line_number, code, 'unknown student_id')
+                    continue
+                if not profile.enrolled:
+                    report(line_number, code, f'student is not enrolled in {subject.code}')
+                    continue
+                total = row.get('total')
+                # older uploads carried letter grades (student_id,grade)
+                total = letter_grade_to_numeric(total) or total
+                values, error = clean_grade_values(
+                    row.get('quiz'), row.get('mid'), row.get('assignment'), row.get('final'),
+                    total, row.get('result') or None,
+                )
+                if error:
+                    report(line_number, code, error)
+                    continue
+                if values is None:
+                    report(line_number, code, 'no score columns filled in')
+                    continue
+                chunk_grades[profile.user_id] = build_grade(profile.user_id, subject, values, existing.get(profile.user_id))
+
+            if chunk_grades:
+                upsert_grades(list(chunk_grades.values()))
+                imported += len(chunk_grades)
+                touched_students.update(chunk_grades)
+
+        # bulk writes skip the Grade signals
+        notify_grades_changed(touched_students, [subject.id])
+
+    if error_count > len(errors):
+        errors.append(('', '', f'{error_count - len(errors)} more errors not listed'))
+    return imported, error_count, errors
@@ -0,0 +1,192 @@
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from users.models import User, StudentProfile
+from subjects.models import Subject, Enrollment, Teacher
+from ranks.models import Grade, ClassRank
+from notifications.push import get_unread_count
+from teachers.views import _get_current_academic_year, _get_current_semester
+
+
+class EnterGradesBulkSaveTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher1', password='pass', role='teacher')
+        instructor = Teacher.objects.create(user=self.teacher, teacher_id='T1', department='Science')
+        self.subject = Subject.objects.create(name='Science', code='SCI401', grade_level=4, instructor=instructor)
+        self.students = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for idx in range(3):
+                user = User.objects.create_user(username=f'pupil{idx}', password='pass', role='student')
+                StudentProfile.objects.create(user=user, student_id=f'PUP{idx}', grade_level=4)
+                Enrollment.objects.create(
+                    student=user, subject=self.subject, status='approved',
+                    academic_year=_get_current_academic_year(), semester=_get_current_semester(),
+                )
+                self.students.append(user)
+        self.client = Client()
+        self.client.login(username='teacher1', password='pass')
+        self.url = reverse('enter_grades') + f'?subject_id={self.subject.id}'
+
+    def test_post_upserts_grades_and_reports_bad_rows(self):
+        first, second, third = self.students
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(student=second, subject=self.subject, score=10, quiz_score=4, remarks='old')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(self.url, {
+                f'quiz_{first.id}': '9', f'mid_{first.id}': '20', f'assign_{first.id}': '15', f'final_{first.id}': '40',
+                f'mid_{second.id}': '25', f'avg_{second.id}': '70', f'result_{second.id}': '88',
+                f'final_{third.id}': 'forty',
+            })
+        self.assertEqual(resp.status_code, 302)
+
+        first_grade = Grade.objects.get(student=first, subject=self.subject)
+        # quiz is clamped to its maximum of 5
+        self.assertEqual((first_grade.score, first_grade.quiz_score), (80, 5))
+        second_grade = Grade.objects.get(student=second, subject=self.subject)
+        # an overridden average keeps stored components the teacher left blank
+        self.assertEqual((second_grade.score, second_grade.quiz_score, second_grade.mid_score, second_grade.remarks), (70, 4, 25, '88'))
+        self.assertEqual(Enrollment.objects.get(student=second).result, '88')
+        self.assertFalse(Grade.objects.filter(student=third).exists())
+        # bulk writes still refresh the materialized ranks
+        self.assertEqual(ClassRank.objects.get(student=first, academic_year='all').rank, 1)
+        self.assertEqual(ClassRank.objects.get(student=second, academic_year='all').rank, 2)
+
+    def test_post_skips_students_with_non_finite_scores(self):
+        first, second, third = self.students
+        resp = self.client.post(self.url, {
+            f'quiz_{first.id}': 'inf', f'mid_{first.id}': '20',
+            f'grade_{second.id}': '1e999',
+            f'grade_{third.id}': '75',
+        }, follow=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Grade.objects.get(student=third, subject=self.subject).score, 75)
+        self.assertFalse(Grade.objects.filter(student__in=[first, second]).exists())
+        warnings = [str(m) for m in resp.context['messages'] if str(m).startswith('Skipped')]
+        self.assertEqual(warnings, ['Skipped pupil0: quiz "inf" is not a number', 'Skipped pupil1: total "1e999" is not a number'])
+
+    def test_bulk_upload_imports_csv_and_keeps_error_report(self):
+        first, second, third = self.students
+        outsider = User.objects.create_user(username='outsider', password='pass', role='student')
+        StudentProfile.objects.create(user=outsider, student_id='OUT1', grade_level=4)
+        upload = SimpleUploadedFile('scores.csv', (
+            'student_id,quiz,mid,assignment,final,total,result\n'
+            'PUP0,5,20,15,40,,"Good, steady"\n'
+            'PUP1,,,,,B,\n'
+            'PUP2,abc,,,,,\n'
+            'OUT1,,,,,70,\n'
+            'NOPE,,,,,70,\n'
+        ).encode('utf-8'), content_type='text/csv')
+        url = reverse('bulk_grade_upload', args=[self.subject.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(url, {'grade_file': upload})
+        self.assertEqual(resp.status_code, 302)
+
+        first_grade = Grade.objects.get(student=first, subject=self.subject)
+        self.assertEqual((first_grade.score, first_grade.remarks), (80, 'Good, steady'))
+        self.assertEqual(Grade.objects.get(student=second, subject=self.subject).score, 85)
+        self.assertFalse(Grade.objects.filter(student__in=[third, outsider]).exists())
+
+        report = self.client.get(reverse('bulk_grade_upload_errors', args=[self.subject.id]))
+        lines = report.content.decode().strip().splitlines()
+        self.assertEqual(lines[0], 'line,student_id,error')
+        self.assertEqual([line.split(',')[:2] for line in lines[1:]], [['4', 'PUP2'], ['5', 'OUT1'], ['6', 'NOPE']])
+
+    def test_bulk_upload_reports_non_finite_scores_per_row(self):
+        first, second, third = self.students
+        upload = SimpleUploadedFile('scores.csv', (
+            'student_id,quiz,total\n'
+            'PUP0,inf,\n'
+            'PUP1,,1e999\n'
+            'PUP2,,70\n'
+        ).encode('utf-8'), content_type='text/csv')
+        url = reverse('bulk_grade_upload', args=[self.subject.id])
+
+        resp = self.client.post(url, {'grade_file': upload})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Grade.objects.get(student=third, subject=self.subject).score, 70)
+        self.assertFalse(Grade.objects.filter(student__in=[first, second]).exists())
+
+        report = self.client.get(reverse('bulk_grade_upload_errors', args=[self.subject.id]))
+        lines = report.content.decode().strip().splitlines()
+        self.assertEqual([line.split(',')[:2] for line in lines[1:]], [['2', 'PUP0'], ['3', 'PUP1']])
+
+    def test_bulk_upload_counts_skipped_rows_not_report_lines(self):
+        upload = SimpleUploadedFile('scores.csv', (
+            'student_id,total\n' + ''.join(f'NOPE{idx},70\n' for idx in range(3))
+        ).encode('utf-8'), content_type='text/csv')
+        url = reverse('bulk_grade_upload', args=[self.subject.id])
+        # two listed errors plus a "1 more errors not listed" line
+        with mock.patch('teachers.grade_import.MAX_REPORTED_ERRORS', 2):
+            resp = self.client.post(url, {'grade_file': upload}, follow=True)
+        self.assertIn('3 row(s) were skipped. Download the error report for details.', [str(m) for m in resp.context['messages']])
+        self.assertEqual(resp.context['error_count'], 3)
+        report = self.client.get(reverse('bulk_grade_upload_errors', args=[self.subject.id]))
+        self.assertEqual(len(report.content.decode().strip().splitlines()), 4)
+
+    def test_get_attaches_grouped_averages_and_tie_aware_ranks(self):
+        first, second, third = self.students
+        for student, score in ((first, 70), (second, 90), (third, 90)):
+            Grade.objects.create(student=student, subject=self.subject, score=score)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.url)
+        ranks = {en.student_id: (en.average, en.rank) for en in resp.context['enrollments']}
+        self.assertEqual(ranks, {first.id: (70.0, 3), second.id: (90.0, 1), third.id: (90.0, 1)})
+        # one grouped average query for the whole roster
+        self.assertEqual(len([q for q in queries.captured_queries if 'AVG(' in q['sql']]), 1)
+
+
+class TeacherDashboardSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher2', password='pass', role='teacher')
+        instructor = Teacher.objects.create(user=self.teacher, teacher_id='T2', department='Maths')
+        self.subjects = [
+            Subject.objects.create(name=f'Maths {idx}', code=f'MTH50{idx}', grade_level=5, instructor=instructor)
+            for idx in range(2)
+        ]
+        # the unread counter row is created on first read
+        get_unread_count(self.teacher)
+        self.client = Client()
+        self.client.login(username='teacher2', password='pass')
+
+    def _add_students(self, count, start=0):
+        students = []
+        for idx in range(start, start + count):
+            user = User.objects.create_user(username=f'kid{idx}', password='pass', role='student', first_name=f'Kid{idx}')
+            for subject in self.subjects:
+                Enrollment.objects.create(
+                    student=user, subject=subject, status='approved',
+                    academic_year=_get_current_academic_year(), semester=_get_current_semester(),
+                )
+                Grade.objects.create(student=user, subject=subject, score=60 + idx)
+            students.append(user)
+        return students
+
+    def _dashboard_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('teacher_dashboard'))
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_students(self):
+        self._add_students(2)
+        small = self._dashboard_queries()
+        self._add_students(8, start=2)
+        self.assertEqual(self._dashboard_queries(), small)
+
+    def test_score_save_patches_cached_ranking(self):
+        first, second = self._add_students(2)
+        ranking = self.client.get(reverse('teacher_dashboard')).context['student_ranking']
+        self.assertEqual([(item['id'], item['avg'], item['rank']) for item in ranking], [(second.id, 61.0, 1), (first.id, 60.0, 2)])
+
+        self.client.post(reverse('save_student_score'), {'student_id': first.id, 'subject_id': self.subjects[0].id, 'score': '100'})
+        ranking = self.client.get(reverse('teacher_dashboard')).context['student_ranking']
+        self.assertEqual([(item['id'], item['avg'], item['rank']) for item in ranking], [(first.id, 80.0, 1), (second.id, 61.0, 2)])
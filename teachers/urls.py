@@ -10,6 +10,7 @@ urlpatterns = [
     # Registrar/teacher helper to enter numeric score for a student-subject
     path('enter-score/<int:student_id>/<int:subject_id>/', user_views.enter_numeric_score, name='enter_numeric_score'),
     path('bulk-score-upload/<int:subject_id>/', views.bulk_grade_upload, name='bulk_grade_upload'),
+    path('bulk-score-upload/<int:subject_id>/errors/', views.bulk_grade_upload_errors, name='bulk_grade_upload_errors'),
     path('subject-statistics/<int:subject_id>/', views.get_subject_statistics, name='get_subject_statistics'),
     
     path('save-score/', views.save_student_score, name='save_student_score'),
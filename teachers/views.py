@@ -1,3 +1,4 @@
+import csv
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db.models import Q, Count
@@ -5,15 +6,20 @@ from django.db.models import Avg
 from users.decorators import teacher_required, registrar_required
 from users.models import User
 from subjects.models import Subject, Enrollment
-from ranks.models import Grade, rank_students_for_subject
+from subjects.rollover import auto_enroll
+from ranks.models import Grade, ALL_TERMS, rank_students_for_subject, subject_statistics, notify_grades_changed
 from ranks.forms import GradeForm
 from django.http import JsonResponse
+from django.db import transaction
 from django.db.utils import OperationalError
 from django.views.decorators.http import require_POST
 from .forms import BulkAssignForm
-from django.http import JsonResponse, HttpResponseBadRequest
+from .grade_import import clean_grade_values, build_grade, upsert_grades, import_grades
+from .dashboard import get_dashboard_snapshot, snapshot_ranking, refresh_dashboard_snapshots, term_student_averages, average_rank_map
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 from notifications.models import Notification
+from notifications.push import get_unread_count
 
 
 def get_teacher_profile(user):
@@ -65,32 +71,26 @@ def enroll_students_for_subject(subject, academic_year=None, semester=None, stat
     # find students with matching grade level
     students = User.objects.filter(role='student', studentprofile__grade_level=subject.grade_level)
     enrolled = 0
-    for student in students:
+    # If there's an existing enrollment (e.g., pending), promote it to the desired status
+    existing = Enrollment.objects.filter(
+        subject=subject, academic_year=academic_year, semester=semester, student__in=students
+    ).exclude(status=status)
+    for enrollment in existing:
+        enrollment.status = status
+        enrollment.is_auto_assigned = True
         try:
-            existing = Enrollment.objects.filter(student=student, subject=subject, academic_year=academic_year, semester=semester).first()
-            if existing:
-                # If there's an existing enrollment (e.g., pending), promote it to the desired status
-                if existing.status != status:
-                    existing.status = status
-                    existing.is_auto_assigned = True
-                    try:
-                        existing.save()
-                    except Exception:
-                        pass
-                    enrolled += 1
-                continue
-
-            Enrollment.objects.create(
-                student=student,
-                subject=subject,
-                academic_year=academic_year,
-                semester=semester,
-                status=status,
-                is_auto_assigned=True
-            )
-            enrolled += 1
+            enrollment.save()
         except Exception:
-            continue
+            pass
+        enrolled += 1
+
+    # the missing ones are inserted in bulk (subjects.rollover)
+    try:
+        enrolled += auto_enroll(
+            academic_year, semester, status=status, students=students, subjects=Subject.objects.filter(pk=subject.pk)
+        )['created']
+    except Exception:
+        pass
     return enrolled
 
 @teacher_required
@@ -123,26 +123,19 @@ def teacher_dashboard(request):
         semester=semester_filter
     ).count()
 
-    # pending scores across all subjects for this teacher
+    # averages, ranks and pending counts come from the cached term snapshot
     try:
-        pending = Grade.objects.filter(
-            subject__instructor__user=request.user,
-            score__isnull=True
-        ).count()
+        teacher_subjects = list(teacher_subjects)
+        snapshot = get_dashboard_snapshot(request.user, [s.id for s in teacher_subjects], academic_year_filter, semester_filter)
     except OperationalError:
-        pending = 0
-
-    # per-subject pending counts (dictionary subject_id -> pending_count)
-    per_subject_pending = {}
-    try:
-        pending_qs = Grade.objects.filter(subject__instructor__user=request.user, score__isnull=True).values('subject').annotate(count=Count('id'))
-        per_subject_pending = {p['subject']: p['count'] for p in pending_qs}
-    except OperationalError:
-        per_subject_pending = {}
+        messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
+        snapshot = {'students': {}, 'averages': {}, 'subject_averages': {}, 'pending': {}}
+    pending = sum(snapshot['pending'].values())
 
-    # attach pending_count to each subject for easy template access
+    # attach pending_count and average to each subject for easy template access
     for s in teacher_subjects:
-        s.pending_count = per_subject_pending.get(s.id, 0)
+        s.pending_count = snapshot['pending'].get(s.id, 0)
+        s.average = snapshot['subject_averages'].get(s.id)
 
     # subjects that are currently unassigned (available for claiming)
     available_qs = Subject.objects.filter(instructor__isnull=True, is_active=True)
@@ -162,50 +155,15 @@ def teacher_dashboard(request):
         student_count=Count('enrollments', filter=Q(enrollments__status__in=['approved','active'], enrollments__academic_year=academic_year_filter, enrollments__semester=semester_filter))
     )
 
-    # distinct students across this teacher's subjects
-    # Respect academic year / semester filters when listing students
-    # use the already-determined filters for term
-    ay = academic_year_filter
-    sem = semester_filter
-    enrolled_qs = Enrollment.objects.filter(subject__in=teacher_subjects, status__in=['approved', 'active'], academic_year=ay, semester=sem).select_related('student')
-    distinct_students = {}
-    for en in enrolled_qs:
-        distinct_students[en.student.id] = en.student
-
-    # compute per-student average across this teacher's subjects
-    student_averages = {}
-    for student_id, student in distinct_students.items():
-        # restrict averaging to this term: find which of the teacher's subjects this student is enrolled in for the term
-        subject_ids_for_term = Enrollment.objects.filter(student__id=student_id, subject__in=teacher_subjects, academic_year=ay, semester=sem, status__in=['approved', 'active']).values_list('subject_id', flat=True)
-        if subject_ids_for_term:
-            avg = Grade.objects.filter(student__id=student_id, subject__id__in=subject_ids_for_term).aggregate(avg=Avg('score'))['avg']
-        else:
-            avg = None
-        student_averages[student_id] = {'student': student, 'average': round(avg, 2) if avg is not None else None}
-
-    # compute ranking (higher average -> better rank). Students with None average go last.
-    ranked = sorted([{'id': sid, 'avg': data['average'], 'student': data['student']} for sid, data in student_averages.items()], key=lambda x: (-(x['avg'] or -1), x['student'].get_full_name()))
-    # assign ranks (ties receive same rank)
-    last_avg = None
-    rank = 0
-    ties = 0
-    for i, item in enumerate(ranked, start=1):
-        if item['avg'] is None:
-            item['rank'] = None
-            continue
-        if item['avg'] != last_avg:
-            rank = i
-            last_avg = item['avg']
-        item['rank'] = rank
+    # distinct students across this teacher's subjects with their term average and rank
+    distinct_students = snapshot['students']
+    ranked = snapshot_ranking(snapshot) if distinct_students else []
+    student_averages = {item['id']: {'student': item['student'], 'average': item['avg']} for item in ranked}
+    subject_averages = snapshot['subject_averages']
 
-    # build per-subject averages
-    subject_averages = {}
-    for s in teacher_subjects:
-        avg = Grade.objects.filter(subject=s).aggregate(avg=Avg('score'))['avg']
-        subject_averages[s.id] = round(avg, 2) if avg is not None else None
-    # Get unread notifications for the teacher
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    # Get unread notifications for the teacher; the count comes from the cached counter
+    unread_notifications = list(Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5])
+    unread_count = get_unread_count(request.user)
     
     # term filters (prefer GET, else current)
     academic_year = request.GET.get('academic_year') or _get_current_academic_year()
@@ -238,10 +196,11 @@ def teacher_dashboard(request):
         'selected_grade_level': grade_level_filter,
         'selected_academic_year': academic_year,
         'selected_semester': semester,
-        'num_subjects': teacher_subjects.count(),
+        'num_subjects': len(teacher_subjects),
         'distinct_student_count': len(distinct_students),
         'student_averages': student_averages,
         'student_ranking': ranked,
+        'subject_averages': subject_averages,
         'unread_notifications': unread_notifications,
         'unread_count': unread_count,
     }
@@ -395,6 +354,18 @@ def assign_selected_subjects(request):
     messages.success(request, f'Assigned {assigned} selected subjects to {teacher_user.get_full_name()}.')
     return redirect('registrar_dashboard')
 
+
+def _parse_grade_row(data, student_id):
+    """Parse one student's score inputs from the enter_grades form.
+
+    Returns (values, error) as `clean_grade_values` does.
+    """
+    components = [data.get(f'{prefix}_{student_id}') for prefix in ('quiz', 'mid', 'assign', 'final')]
+    # a manually edited average overrides the components; the single grade field is the legacy fallback
+    total = data.get(f'avg_{student_id}') if any(components) else data.get(f'grade_{student_id}')
+    return clean_grade_values(*components, total=total, result=data.get(f'result_{student_id}'))
+
+
 @teacher_required
 def enter_grades(request):
     teacher_subjects = Subject.objects.filter(instructor__user=request.user, is_active=True)
@@ -409,10 +380,10 @@ def enter_grades(request):
         # Filter enrollments by academic year & semester (default to current)
         academic_year = request.GET.get('academic_year') or _get_current_academic_year()
         semester = request.GET.get('semester') or _get_current_semester()
-        enrollments = Enrollment.objects.filter(subject=subject, status__in=['approved', 'active'], academic_year=academic_year, semester=semester).select_related('student')
+        enrollments = list(Enrollment.objects.filter(subject=subject, status__in=['approved', 'active'], academic_year=academic_year, semester=semester).select_related('student'))
         
         # load existing grades for this subject to prefill the form
-        existing_grades_qs = Grade.objects.filter(subject=subject).select_related('student')
+        existing_grades_qs = list(Grade.objects.filter(subject=subject).select_related('student'))
         existing_grades = {g.student.id: g.score for g in existing_grades_qs}
         existing_components = {}
         for g in existing_grades_qs:
@@ -431,41 +402,15 @@ def enter_grades(request):
             en.assignment_score = comps.get('assignment')
             en.final_score = comps.get('final')
 
-        # compute per-student average across this teacher's subjects for the selected term
-        student_ids = [en.student.id for en in enrollments]
-        student_averages = {}
+        # per-student average across this teacher's subjects for the selected term, one grouped query
+        student_ids = [en.student_id for en in enrollments]
         try:
-            for sid in student_ids:
-                subj_ids = Enrollment.objects.filter(student__id=sid, subject__in=teacher_subjects, academic_year=academic_year, semester=semester, status__in=['approved','active']).values_list('subject_id', flat=True)
-                if subj_ids:
-                    avg = Grade.objects.filter(student__id=sid, subject__id__in=subj_ids).aggregate(avg=Avg('score'))['avg']
-                else:
-                    avg = None
-                student_averages[sid] = round(avg,2) if avg is not None else None
+            student_averages = term_student_averages(teacher_subjects.values('id'), academic_year, semester, student_ids)
         except Exception:
-            student_averages = {sid: None for sid in student_ids}
-
-        # compute ranking for students by their average (higher is better); ties receive same rank
-        ranking = []
-        for sid, avg in student_averages.items():
-            ranking.append({'student_id': sid, 'avg': avg})
-        ranking = sorted(ranking, key=lambda x: (-(x['avg'] or -1), x['student_id']))
-        last_avg = None
-        last_rank = 0
-        rank_map = {}
-        idx = 0
-        for item in ranking:
-            idx += 1
-            if item['avg'] is None:
-                rank = None
-            else:
-                if item['avg'] == last_avg:
-                    rank = last_rank
-                else:
-                    rank = idx
-                    last_rank = rank
-                    last_avg = item['avg']
-            rank_map[item['student_id']] = rank
+            student_averages = {}
+
+        # ranking by average (higher is better); ties receive same rank, students without scores none
+        rank_map = average_rank_map({sid: student_averages.get(sid) for sid in student_ids})
 
         # attach average and rank to enrollments for template
         for en in enrollments:
@@ -473,96 +418,42 @@ def enter_grades(request):
             en.rank = rank_map.get(en.student.id)
 
         if request.method == 'POST':
-            updated = 0
+            # Parse every row in memory first, then write all grades with one
+            # upsert and all results with one bulk_update in a single transaction.
+            existing_by_student = {g.student_id: g for g in existing_grades_qs}
+            grade_rows = []
+            changed_enrollments = []
+            row_errors = []
             for enrollment in enrollments:
-                    # Support component-based input (quiz, mid, assignment, final)
-                    quiz_val = request.POST.get(f'quiz_{enrollment.student.id}')
-                    mid_val = request.POST.get(f'mid_{enrollment.student.id}')
-                    assign_val = request.POST.get(f'assign_{enrollment.student.id}')
-                    final_val = request.POST.get(f'final_{enrollment.student.id}')
-                    # legacy single score field fallback
-                    grade_value = request.POST.get(f'grade_{enrollment.student.id}')
-
-                    # if no inputs provided, skip
-                    if not any([quiz_val, mid_val, assign_val, final_val, grade_value]):
-                        continue
-
-                    def parse_int(v, default=None):
-                        if v is None or v == '':
-                            return default
-                        try:
-                            return int(float(v))
-                        except Exception:
-                            return default
-
-                    quiz = parse_int(quiz_val)
-                    mid = parse_int(mid_val)
-                    assignment = parse_int(assign_val)
-                    final = parse_int(final_val)
-
-                    override_avg_val = request.POST.get(f'avg_{enrollment.student.id}')
-                    if quiz is None and mid is None and assignment is None and final is None and grade_value:
-                        # legacy path: use single score field
-                        total = parse_int(grade_value, 0)
-                        quiz = mid = assignment = final = None
-                    else:
-                        # if override average provided (teacher manually edited average), use it to set total
-                        if override_avg_val is not None and override_avg_val != '':
-                            parsed_override = parse_int(override_avg_val, None)
-                            if parsed_override is not None:
-                                total = max(0, min(100, parsed_override))
-                        else:
-                            # clamp components to their max values and treat None as 0
-                            quiz = 0 if quiz is None else max(0, min(5, quiz))
-                            mid = 0 if mid is None else max(0, min(25, mid))
-                            assignment = 0 if assignment is None else max(0, min(20, assignment))
-                            final = 0 if final is None else max(0, min(50, final))
-                            total = quiz + mid + assignment + final
-
-                    # Clamp total 0-100
-                    if total < 0:
-                        total = 0
-                    if total > 100:
-                        total = 100
-
-                    try:
-                        grade_obj, created = Grade.objects.get_or_create(
-                            student=enrollment.student,
-                            subject=subject,
-                            defaults={'score': total, 'quiz_score': quiz if quiz is not None else None, 'mid_score': mid if mid is not None else None, 'assignment_score': assignment if assignment is not None else None, 'final_exam_score': final if final is not None else None}
-                        )
-                    except OperationalError:
-                        messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
-                        return redirect(request.path + f'?subject_id={subject.id}')
-
-                    if not created:
-                        grade_obj.score = total
-                        # update component fields if provided
-                        if quiz is not None:
-                            grade_obj.quiz_score = quiz
-                        if mid is not None:
-                            grade_obj.mid_score = mid
-                        if assignment is not None:
-                            grade_obj.assignment_score = assignment
-                        if final is not None:
-                            grade_obj.final_exam_score = final
-                        grade_obj.save()
-
-                    # store remarks/result if provided
-                    result_val = request.POST.get(f'result_{enrollment.student.id}')
-                    if result_val is not None:
-                        try:
-                            grade_obj.remarks = result_val
-                            grade_obj.save()
-                        except Exception:
-                            pass
-                        try:
-                            enrollment.result = result_val
-                            enrollment.save()
-                        except Exception:
-                            pass
-                    updated += 1
-
+                values, error = _parse_grade_row(request.POST, enrollment.student_id)
+                if error:
+                    row_errors.append(f'{enrollment.student.get_full_name() or enrollment.student.username}: {error}')
+                    continue
+                if values is None:
+                    continue
+                grade_obj = build_grade(enrollment.student_id, subject, values, existing_by_student.get(enrollment.student_id))
+                # store remarks/result if provided
+                if values['result'] is not None:
+                    enrollment.result = values['result']
+                    changed_enrollments.append(enrollment)
+                grade_rows.append(grade_obj)
+
+            if grade_rows:
+                try:
+                    with transaction.atomic():
+                        upsert_grades(grade_rows)
+                        if changed_enrollments:
+                            Enrollment.objects.bulk_update(changed_enrollments, ['result'])
+                        # bulk writes skip the Grade/Enrollment signals
+                        notify_grades_changed([g.student_id for g in grade_rows], [subject.id])
+                except OperationalError:
+                    messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
+                    return redirect(request.path + f'?subject_id={subject.id}')
+                refresh_dashboard_snapshots(request.user.id, subject.id, [g.student_id for g in grade_rows])
+
+            for error in row_errors:
+                messages.warning(request, f'Skipped {error}')
+            updated = len(grade_rows)
             messages.success(request, f'Scores updated for {updated} students.')
             return redirect(request.path + f'?subject_id={subject.id}')
     else:
@@ -624,16 +515,10 @@ def performance_reports(request):
 
         # Calculate numeric statistics (average score out of 100) and ranking
         if grades:
-            numeric_scores = [g.score for g in grades if g.score is not None]
-            avg_score = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
-            # build simple distribution buckets
-            score_distribution = {
-                '90-100': len([s for s in numeric_scores if s >= 90]),
-                '80-89': len([s for s in numeric_scores if 80 <= s < 90]),
-                '70-79': len([s for s in numeric_scores if 70 <= s < 80]),
-                '60-69': len([s for s in numeric_scores if 60 <= s < 70]),
-                '0-59': len([s for s in numeric_scores if s < 60]),
-            }
+            # cached per (subject, term), refreshed whenever a grade changes
+            stats = subject_statistics(subject, academic_year, semester)
+            avg_score = stats['average_score']
+            score_distribution = stats['score_distribution']
             # compute ranks using helper
             subject_ranking = rank_students_for_subject(subject)
         else:
@@ -732,88 +617,61 @@ def view_student_performance(request, student_id):
 
 @teacher_required
 def bulk_grade_upload(request, subject_id):
-    """Handle bulk score upload via CSV"""
+    """Handle bulk score upload via CSV or XLSX"""
     subject = get_object_or_404(Subject, id=subject_id, instructor__user=request.user)
+    report_key = f'grade_import_errors_{subject.id}'
+    skipped_key = f'grade_import_skipped_{subject.id}'
     
     if request.method == 'POST' and request.FILES.get('grade_file'):
-        grade_file = request.FILES['grade_file']
-        # Simple CSV processing (you might want to use csv module for more complex files)
         try:
-            # This is a simplified example - implement proper CSV parsing
-            lines = grade_file.read().decode('utf-8').split('\n')
-            processed_count = 0
-            
-            for line in lines[1:]:  # Skip header
-                if line.strip():
-                    parts = line.split(',')
-                    if len(parts) >= 2:
-                        student_id = parts[0].strip()
-                        grade_value = parts[1].strip()
-                        
-                        # Find student and update grade
-                        try:
-                            student = User.objects.get(
-                                studentprofile__student_id=student_id,
-                                role='student'
-                            )
-                            try:
-                                grade, created = Grade.objects.get_or_create(
-                                    student=student,
-                                    subject=subject,
-                                    defaults={'score': None}
-                                )
-                            except OperationalError:
-                                continue
-                            if not created:
-                                # store the submitted letter grade into remarks for trace
-                                grade.remarks = f'entered_grade:{grade_value}'
-                                grade.save()
-                            if not created:
-                                grade.grade = grade_value
-                                grade.save()
-                            processed_count += 1
-                        except User.DoesNotExist:
-                            continue
-            
-            messages.success(request, f'Successfully processed grades for {processed_count} students.')
-            
-        except Exception as e:
+            imported, skipped, errors = import_grades(request.FILES['grade_file'], subject)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
             messages.error(request, f'Error processing file: {str(e)}')
-        
-        return redirect('enter_grades')
+            return redirect('bulk_grade_upload', subject_id=subject.id)
+        except OperationalError:
+            messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
+            return redirect('bulk_grade_upload', subject_id=subject.id)
+
+        if imported:
+            refresh_dashboard_snapshots(request.user.id, subject.id)
+        # keep the row diagnostics for the downloadable error report
+        request.session[report_key] = errors
+        # the report may end in a "N more errors" summary row, so count rejected rows separately
+        request.session[skipped_key] = skipped
+        messages.success(request, f'Successfully processed grades for {imported} students.')
+        if skipped:
+            messages.warning(request, f'{skipped} row(s) were skipped. Download the error report for details.')
+        return redirect('bulk_grade_upload', subject_id=subject.id)
     
     context = {
         'subject': subject,
+        'error_count': request.session.get(skipped_key, 0),
     }
     return render(request, 'teachers/bulk_grade_upload.html', context)
 
+
+@teacher_required
+def bulk_grade_upload_errors(request, subject_id):
+    """Download the row errors of the last bulk score upload as CSV"""
+    subject = get_object_or_404(Subject, id=subject_id, instructor__user=request.user)
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{subject.code}_grade_import_errors.csv"'
+    writer = csv.writer(response)
+    writer.writerow(['line', 'student_id', 'error'])
+    writer.writerows(request.session.get(f'grade_import_errors_{subject.id}', []))
+    return response
+
 @teacher_required
 def get_subject_statistics(request, subject_id):
     """API endpoint for subject statistics (for charts)"""
     subject = get_object_or_404(Subject, id=subject_id, instructor__user=request.user)
+    # Optional term filter (?academic_year=&semester=); defaults to every term
+    academic_year = request.GET.get('academic_year') or ALL_TERMS
+    semester = request.GET.get('semester') or ALL_TERMS
     try:
-        grades = Grade.objects.filter(subject=subject)
+        data = subject_statistics(subject, academic_year, semester)
     except OperationalError:
-        messages.error(request, 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.')
-        grades = []
-    
-    # Numeric distribution buckets and average score
-    numeric_scores = [g.score for g in grades if g.score is not None]
-    distribution = {
-        '90-100': len([s for s in numeric_scores if s >= 90]),
-        '80-89': len([s for s in numeric_scores if 80 <= s < 90]),
-        '70-79': len([s for s in numeric_scores if 70 <= s < 80]),
-        '60-69': len([s for s in numeric_scores if 60 <= s < 70]),
-        '0-59': len([s for s in numeric_scores if s < 60]),
-    }
-    avg_score = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
-
-    data = {
-        'score_distribution': distribution,
-        'average_score': round(avg_score, 2),
-        'total_students': grades.count(),
-        'scored_students': len(numeric_scores),
-    }
+        return JsonResponse({'error': 'Database tables for the `ranks` app are missing. Please run `python manage.py migrate`.'}, status=503)
     
     return JsonResponse(data)
 
@@ -924,6 +782,8 @@ def save_student_score(request):
         except Exception:
             pass
 
+    refresh_dashboard_snapshots(request.user.id, subject.id, [student.id])
+
     # compute updated subject average
     avg = Grade.objects.filter(subject=subject, score__isnull=False).aggregate(avg=Avg('score'))['avg']
     avg = round(avg, 2) if avg is not None else None
@@ -7,6 +7,7 @@ from .models import User, StudentProfile, TeacherProfile
 from subjects.models import Subject
 from notifications.models import Announcement
 from notifications.models import Notification
+from notifications.delivery import queue_announcement_delivery
 from .forms import UserCreationForm, SystemSettingsForm
 from .forms import AdminUserCreationForm 
 from django.utils import timezone 
@@ -338,6 +339,10 @@ def post_announcement(request):
         title = request.POST.get('title')
         content = request.POST.get('content')
         target_roles = request.POST.getlist('target_roles')
+        send_email = request.POST.get('send_email') == 'on'
+        # "all" (the form default) means every user, stored as an empty list
+        if 'all' in target_roles:
+            target_roles = []
         
         announcement = Announcement.objects.create(
             title=title,
@@ -345,47 +350,15 @@ def post_announcement(request):
             created_by=request.user,
             target_roles=target_roles
         )
-        # Create Notification objects and send emails to targeted users
-        try:
-            if target_roles:
-                recipients_qs = User.objects.filter(role__in=target_roles)
-            else:
-                recipients_qs = User.objects.all()
-
-            # Filter out users without email
-            recipients = recipients_qs.exclude(email='').values_list('email', flat=True)
-
-            # Send email individually to each recipient (sends a plain text and HTML part).
-            from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@localhost')
-            site_name = getattr(settings, 'SITE_NAME', None) or ''
-            for email in recipients:
-                try:
-                    subject = title
-                    text_content = content + "\n\n" + f"Posted {announcement.created_at.strftime('%b %d, %Y %H:%M')}"
-                    html_content = f"<html><body><p>{content}</p><hr><p>Posted {announcement.created_at.strftime('%b %d, %Y %H:%M')}</p></body></html>"
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [email])
-                    msg.attach_alternative(html_content, "text/html")
-                    # Send (will use SMTP if configured in settings, otherwise console backend)
-                    msg.send(fail_silently=True)
-                except Exception as exc:
-                    # log to console — don't stop processing other recipients
-                    print(f"Failed sending announcement to {email}: {exc}")
-
-            # Also create Notification entries for in-app notifications
-            for u in recipients_qs:
-                try:
-                    Notification.objects.create(
-                        user=u,
-                        title=title,
-                        message=content,
-                        link=reverse('view_announcements') if 'reverse' in globals() else '/users/announcements/'
-                    )
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # Notifications and emails are fanned out in the background; the
+        # delivery record tracks progress
+        delivery = queue_announcement_delivery(
+            announcement, target_roles, send_email=send_email, requested_by=request.user,
+            link=reverse('view_announcements'),
+        )
 
-        messages.success(request, 'Announcement posted successfully!')
+        progress_url = reverse('announcement_delivery_status', args=[delivery.id])
+        messages.success(request, f'Announcement posted successfully! Delivery to recipients is running in the background (progress: {progress_url}).')
         return redirect('admin_panel')
     
     context = {
@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
@@ -12,8 +13,13 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import User, StudentProfile, TeacherProfile, ParentProfile, StudentParent
 from subjects.models import Subject, Enrollment
+from subjects.registration import approve_enrollments, free_seats, reserve_seat
+from subjects.rollover import auto_enroll
+from subjects.scheduling import describe_overlap, find_overlaps
 from payments.models import Payment
 from notifications.models import Announcement, Notification
+from notifications.push import get_unread_count
+from notifications.delivery import queue_announcement_delivery
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.contrib.auth.views import PasswordResetView, PasswordResetDoneView
@@ -131,15 +137,11 @@ def register(request):
                     grade_lvl = student_profile.grade_level
                     ay = student_profile.academic_year or get_current_academic_year()
                     sem = student_profile.current_semester or get_current_semester()
-                    enrolled_count, failures = enroll_student_in_default_subjects(user, grade_lvl, academic_year=ay, semester=sem, status='pending')
+                    enrolled_count = enroll_student_in_default_subjects(user, grade_lvl, academic_year=ay, semester=sem, status='pending')
                     if enrolled_count > 0:
                         messages.info(request, f'Auto-registered {enrolled_count} core subject(s) for Grade {grade_lvl}.')
-                    if failures:
-                        for subj, reason in failures:
-                            if subj is None:
-                                messages.warning(request, f'Auto-enrollment issue: {reason}')
-                            else:
-                                messages.warning(request, f'Could not auto-enroll {subj.name}: {reason}')
+                except ValidationError as ve:
+                    messages.warning(request, f'Auto-enrollment issue: {"; ".join(ve.messages)}')
                 except Exception:
                     # Do not break registration on auto-enroll failures
                     pass
@@ -210,7 +212,7 @@ def dashboard(request):
     
     # Get unread notifications for the user
     unread_notifications = Notification.objects.filter(user=user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=user, is_read=False).count()
+    unread_count = get_unread_count(user)
     
     context = {
         'total_students': total_students,
@@ -325,195 +327,37 @@ def get_current_semester():
 def enroll_student_in_default_subjects(student_user, grade_level, academic_year=None, semester=None, status='pending'):
     """Auto-enroll a student into default/core subjects for their grade.
 
-    - Enrolls only subjects with subject_type='core' and is_active=True for the given grade_level.
+    - Enrolls only active subjects of settings.AUTO_ENROLL_SUBJECT_TYPES for the given grade_level.
     - Creates Enrollment objects with provided academic_year and semester (defaults to current)
-    - Returns a tuple: (enrolled_count, failures) where failures is list of (subject, reason)
+    - Returns the number of enrollments created; raises ValidationError for an invalid academic year
     """
-    from django.core.exceptions import ValidationError
-    from django.db import IntegrityError
-
     if academic_year is None:
         academic_year = get_current_academic_year()
     if semester is None:
         semester = get_current_semester()
 
-    enrolled_count = 0
-    failures = []
-
-    # Use configurable subject types from settings
-    subject_types = getattr(settings, 'AUTO_ENROLL_SUBJECT_TYPES', ['core'])
-    try:
-        subjects = Subject.objects.filter(
-            grade_level=grade_level,
-            is_active=True,
-            subject_type__in=subject_types
-        ).order_by('code')
-    except Exception as e:
-        return (0, [(None, f'Failed to load subjects: {e}')])
-
-    for subj in subjects:
-        try:
-            # skip if enrollment already exists for this student/subject/term
-            existing = Enrollment.objects.filter(
-                student=student_user,
-                subject=subj,
-                academic_year=academic_year,
-                semester=semester
-            ).first()
-            if existing:
-                continue
-
-            Enrollment.objects.create(
-                student=student_user,
-                subject=subj,
-                academic_year=academic_year,
-                semester=semester,
-                status=status,
-                is_auto_assigned=True
-            )
-            enrolled_count += 1
-        except ValidationError as ve:
-            failures.append((subj, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
-        except IntegrityError as ie:
-            failures.append((subj, str(ie)))
-        except Exception as e:
-            failures.append((subj, str(e)))
-
-    return (enrolled_count, failures)
+    # same service as the term rollover, for a single student
+    result = auto_enroll(
+        academic_year,
+        semester,
+        grade_levels=[grade_level],
+        status=status,
+        students=User.objects.filter(id=student_user.id),
+    )
+    return result['created']
 
 def check_schedule_conflicts(student, selected_subjects, academic_year, semester):
     """
     Check for scheduling conflicts between selected subjects
     """
-    conflicts = []
-    
-    # Get subjects with schedule information
-    scheduled_subjects = [s for s in selected_subjects if s.day_of_week and s.start_time and s.end_time]
-    
-    # Group by day and check for time conflicts
-    days_schedule = {}
-    for subject in scheduled_subjects:
-        if subject.day_of_week not in days_schedule:
-            days_schedule[subject.day_of_week] = []
-        days_schedule[subject.day_of_week].append(subject)
-    
-    # Check for time conflicts on each day
-    for day, subjects in days_schedule.items():
-        # Sort by start time
-        subjects.sort(key=lambda x: x.start_time)
-        
-        for i in range(len(subjects)):
-            for j in range(i + 1, len(subjects)):
-                subject1 = subjects[i]
-                subject2 = subjects[j]
-                
-                # Check if times overlap
-                if (subject1.start_time < subject2.end_time and 
-                    subject1.end_time > subject2.start_time):
-                    
-                    conflicts.append({
-                        'subject1': subject1,
-                        'subject2': subject2,
-                        'day': subject1.get_day_of_week_display() if hasattr(subject1, 'get_day_of_week_display') else subject1.day_of_week,
-                        'time1': f"{subject1.start_time.strftime('%H:%M')} - {subject1.end_time.strftime('%H:%M')}",
-                        'time2': f"{subject2.start_time.strftime('%H:%M')} - {subject2.end_time.strftime('%H:%M')}",
-                    })
-    
-    return conflicts
-
-LETTER_GRADE_TO_SCORE = {
-    'A+': 98,
-    'A': 95,
-    'A-': 92,
-    'B+': 88,
-    'B': 85,
-    'B-': 82,
-    'C+': 78,
-    'C': 75,
-    'C-': 72,
-    'D+': 68,
-    'D': 65,
-    'D-': 62,
-    'F': 55,
-}
-
-
-def letter_grade_to_numeric(letter):
-    """Map letter grades to an elementary-friendly 100 point scale."""
-    if not letter:
-        return None
-    return LETTER_GRADE_TO_SCORE.get(letter.strip().upper())
-
-
-def compute_numeric_scores(student, enrollments):
-    """
-    Return a tuple of (score_map, total, count, average) for the given enrollments.
-    score_map maps enrollment.id -> numeric score (0-100) or None.
-    """
-    subject_ids = [en.subject_id for en in enrollments if getattr(en, 'subject_id', None)]
-    rank_scores = {}
-    if RankGrade is not None and subject_ids:
-        try:
-            rank_scores = {
-                rg.subject_id: rg.score
-                for rg in RankGrade.objects.filter(student=student, subject_id__in=subject_ids)
-            }
-        except Exception:
-            rank_scores = {}
-
-    score_map = {}
-    total = 0.0
-    count = 0
-    for enrollment in enrollments:
-        score = rank_scores.get(enrollment.subject_id)
-        if score is None:
-            # First check enrollment.result field for numeric value
-            result_val = getattr(enrollment, 'result', None)
-            if result_val:
-                try:
-                    # Try to parse as numeric
-                    score = float(result_val)
-                except (ValueError, TypeError):
-                    # If not numeric, fall back to letter grade conversion
-                    score = letter_grade_to_numeric(getattr(enrollment, 'final_grade', None))
-            else:
-                # Fall back to letter grade conversion
-                score = letter_grade_to_numeric(getattr(enrollment, 'final_grade', None))
-        if score is not None:
-            score = float(score)
-            total += score
-            count += 1
-        score_map[enrollment.id] = score
+    # one sweep per day over the sorted slots (subjects.scheduling)
+    return [describe_overlap(subject1, subject2) for subject1, subject2 in find_overlaps(selected_subjects)]
 
-    average = round(total / count, 2) if count else None
-    return score_map, round(total, 2), count, average
-
-
-def build_rank_map(entries):
-    """
-    entries: iterable of {'student_id': id, 'grade_level': grade, 'average': value}
-    returns {student_id: rank}
-    """
-    grade_groups = defaultdict(list)
-    for entry in entries:
-        grade = entry.get('grade_level')
-        avg = entry.get('average')
-        student_id = entry.get('student_id')
-        if grade is None or avg is None or student_id is None:
-            continue
-        grade_groups[grade].append((student_id, avg))
-
-    rank_map = {}
-    for grade, students in grade_groups.items():
-        students.sort(key=lambda item: item[1], reverse=True)
-        rank = 0
-        previous = None
-        for idx, (student_id, avg) in enumerate(students, start=1):
-            if previous != avg:
-                rank = idx
-                previous = avg
-            rank_map[student_id] = rank
-    return rank_map
+# Score and rank helpers live with the ranks models so the materialized
+# ClassRank table can reuse them; re-exported here for existing callers.
+from ranks.models import (
+    LETTER_GRADE_TO_SCORE, letter_grade_to_numeric, compute_numeric_scores, compute_numeric_scores_bulk, build_rank_map,
+)
 
 # users/views.py - UPDATE THE VIEW
 @login_required
@@ -597,9 +441,15 @@ def subject_registration(request):
                             if existing_enrollment.status in ('active', 'approved'):
                                 messages.info(request, f"You are already enrolled in {subject.name} for {current_academic_year} {student_profile.get_current_semester_display()}.")
                             else:
-                                # Reactivate dropped enrollment
-                                existing_enrollment.status = 'active'
-                                existing_enrollment.save()
+                                # Reactivate dropped enrollment, if a seat is free
+                                with transaction.atomic():
+                                    if not reserve_seat(subject, current_academic_year, current_semester):
+                                        messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
+                                        failed.append((subject, 'full'))
+                                        continue
+                                    existing_enrollment.status = 'active'
+                                    existing_enrollment._seat_reserved = True
+                                    existing_enrollment.save()
                                 enrolled_count += 1
                                 messages.success(request, f"Re-enrolled in {subject.name}!")
                         else:
@@ -613,27 +463,29 @@ def subject_registration(request):
                                 failed.append((subject, f"Subject is for Grade {subject.grade_level} but student is Grade {student_grade}"))
                                 continue
 
-                            # Check subject capacity
-                            current_enrollment = subject.current_enrollment_count(current_academic_year, current_semester)
-
-                            if current_enrollment < subject.max_capacity:
-                                try:
-                                    Enrollment.objects.create(
-                                        student=request.user,
-                                        subject=subject,
-                                        academic_year=current_academic_year,
-                                        semester=current_semester,
-                                        status='active'
-                                    )
-                                    enrolled_count += 1
-                                    messages.success(request, f"Successfully enrolled in {subject.name}!")
-                                except ValidationError as ve:
-                                    failed.append((subject, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
-                                except IntegrityError as ie:
-                                    failed.append((subject, str(ie)))
-                            else:
-                                messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
-                                failed.append((subject, 'full'))
+                            # Take a seat with one conditional UPDATE; the savepoint gives it
+                            # back if the enrollment cannot be saved
+                            try:
+                                with transaction.atomic():
+                                    if reserve_seat(subject, current_academic_year, current_semester):
+                                        enrollment = Enrollment(
+                                            student=request.user,
+                                            subject=subject,
+                                            academic_year=current_academic_year,
+                                            semester=current_semester,
+                                            status='active'
+                                        )
+                                        enrollment._seat_reserved = True
+                                        enrollment.save()
+                                        enrolled_count += 1
+                                        messages.success(request, f"Successfully enrolled in {subject.name}!")
+                                    else:
+                                        messages.warning(request, f"Subject {subject.name} is full. Could not enroll.")
+                                        failed.append((subject, 'full'))
+                            except ValidationError as ve:
+                                failed.append((subject, '; '.join(ve.messages) if hasattr(ve, 'messages') else str(ve)))
+                            except IntegrityError as ie:
+                                failed.append((subject, str(ie)))
                     except Subject.DoesNotExist:
                         failed.append((subject, 'missing'))
                     except (IntegrityError, ValidationError) as e:
@@ -682,11 +534,12 @@ def subject_registration(request):
         
         enrolled_subject_ids = [enrollment.subject.id for enrollment in enrolled_subjects]
         
-        # UPDATED: Add enhanced enrollment info to each available subject
+        # UPDATED: Add enhanced enrollment info to each available subject (one read of the seat counters)
+        seats = free_seats([subject.id for subject in available_subjects], current_academic_year, current_semester)
         for subject in available_subjects:
-            subject.current_enrollment = subject.current_enrollment_count(current_academic_year, current_semester)
-            subject.available_slots = subject.available_slots(current_academic_year, current_semester)
-            subject.is_available = subject.is_available(current_academic_year, current_semester)
+            subject.available_slots = seats.get(subject.id, subject.max_capacity)
+            subject.current_enrollment = subject.max_capacity - subject.available_slots
+            subject.is_available = subject.available_slots > 0
             
     except Exception as e:
         print(f"Error in subject registration: {str(e)}")
@@ -1025,112 +878,14 @@ def post_announcement(request):
             is_active=is_active
         )
         
-        # Get all users who should receive this announcement
-        # If target_roles is empty (all selected), get all active users
-        # Otherwise, filter by the selected roles
-        if target_roles and len(target_roles) > 0:
-            recipients = User.objects.filter(role__in=target_roles, is_active=True)
-        else:
-            # Empty list means all users
-            recipients = User.objects.filter(is_active=True)
-        
-        # Create notifications and send emails
-        notifications_created = 0
-        emails_sent = 0
-        emails_failed = 0
-        
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@localhost')
-        site_name = getattr(settings, 'SITE_NAME', 'SIMS')
-        
-        print(f"\n=== POSTING ANNOUNCEMENT ===")
-        print(f"Title: {title}")
-        print(f"Target roles: {target_roles}")
-        print(f"Send email: {send_email}")
-        print(f"Total recipients: {recipients.count()}")
-        print(f"From email: {from_email}")
-        
-        for user in recipients:
-            # Create notification for each user
-            try:
-                # Check if notification already exists to avoid duplicates
-                notification, created = Notification.objects.get_or_create(
-                    user=user,
-                    title=title,
-                    message=content,
-                    defaults={'link': f'/announcements/'}
-                )
-                if created:
-                    notifications_created += 1
-            except Exception as e:
-                print(f"Failed to create notification for {user.username}: {e}")
-                import traceback
-                traceback.print_exc()
-            
-            # Send email if requested and user has email
-            if send_email:
-                if not user.email:
-                    print(f"⚠ User {user.username} has no email address, skipping email")
-                    continue
-                try:
-                    subject = f"[{site_name}] {title}"
-                    # Format content properly - replace newlines with <br> for HTML
-                    formatted_content = content.replace('\n', '<br>').replace('\r', '')
-                    text_content = f"{content}\n\nPosted on {announcement.created_at.strftime('%B %d, %Y at %H:%M')}\n\n---\n{site_name}"
-                    html_content = f"""
-                    <html>
-                    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                            <h2 style="color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px;">{title}</h2>
-                            <div style="margin: 20px 0;">
-                                {formatted_content}
-                            </div>
-                            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
-                            <p style="color: #7f8c8d; font-size: 12px;">
-                                Posted on {announcement.created_at.strftime('%B %d, %Y at %H:%M')}<br>
-                                ---<br>
-                                {site_name}
-                            </p>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [user.email])
-                    msg.attach_alternative(html_content, "text/html")
-                    # Try to send email - first with fail_silently=False to see errors
-                    try:
-                        result = msg.send(fail_silently=False)
-                        emails_sent += 1
-                        print(f"✓ Email sent successfully to {user.email} ({user.get_full_name()})")
-                    except Exception as send_error:
-                        emails_failed += 1
-                        print(f"✗ SMTP Error sending to {user.email}: {send_error}")
-                        # Try with fail_silently=True as fallback
-                        try:
-                            msg.send(fail_silently=True)
-                            print(f"  (Retried silently)")
-                        except:
-                            pass
-                except Exception as e:
-                    emails_failed += 1
-                    print(f"✗ Exception preparing email for {user.email}: {e}")
-                    import traceback
-                    traceback.print_exc()
-        
-        print(f"\n=== ANNOUNCEMENT POSTING SUMMARY ===")
-        print(f"Notifications created: {notifications_created}")
-        print(f"Emails sent: {emails_sent}")
-        print(f"Emails failed: {emails_failed}")
-        print(f"=====================================\n")
-        
-        success_msg = f'Announcement posted successfully!'
-        if notifications_created > 0:
-            success_msg += f' Notifications created: {notifications_created}.'
-        if send_email:
-            success_msg += f' Emails sent: {emails_sent}'
-            if emails_failed > 0:
-                success_msg += f' (Failed: {emails_failed} - check console/terminal for details)'
+        # Notifications and emails are fanned out in the background; the
+        # delivery record tracks progress
+        delivery = queue_announcement_delivery(
+            announcement, target_roles, send_email=send_email, requested_by=request.user,
+        )
         
-        messages.success(request, success_msg)
+        progress_url = reverse('announcement_delivery_status', args=[delivery.id])
+        messages.success(request, f'Announcement posted successfully! Delivery to recipients is running in the background (progress: {progress_url}).')
         return redirect('admin_panel')
     
     context = {
@@ -1191,7 +946,7 @@ def registrar_dashboard(request):
     """Registrar dashboard view"""
     # Get unread notifications for the registrar
     unread_notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    unread_count = get_unread_count(request.user)
     
     context = {
         'page_title': 'Registrar Dashboard',
@@ -1242,20 +997,10 @@ def approve_single_registration(request, enrollment_id):
     
     if request.method == 'POST':
         try:
-            # Check if subject has available capacity
-            current_enrollment = Enrollment.objects.filter(
-                subject=enrollment.subject,
-                academic_year=enrollment.academic_year,
-                semester=enrollment.semester,
-                status='active'
-            ).count()
+            # Approve only if the subject has a free seat; a full subject leaves the request pending
+            result = approve_enrollments([enrollment.id], status='active', waitlist=False)
             
-            if current_enrollment < enrollment.subject.max_capacity:
-                enrollment.status = 'active'
-                enrollment.approved_by = request.user
-                enrollment.approved_date = timezone.now()
-                enrollment.save()
-                
+            if result['approved']:
                 messages.success(request, f"Approved {enrollment.student.username}'s registration for {enrollment.subject.name}")
             else:
                 messages.error(request, f"Cannot approve - {enrollment.subject.name} is full")
@@ -1284,37 +1029,22 @@ def reject_single_registration(request, enrollment_id):
 @login_required
 @user_passes_test(is_registrar)
 def bulk_approve_registrations(request):
-    """Bulk approve multiple registrations"""
+    """Bulk approve multiple registrations (oldest first; the rest are waitlisted when full)"""
     if request.method == 'POST':
-        enrollment_ids = request.POST.getlist('enrollment_ids')
-        approved_count = 0
-        
-        for enrollment_id in enrollment_ids:
-            try:
-                enrollment = Enrollment.objects.get(id=enrollment_id, status='pending')
-                
-                # Check capacity
-                current_enrollment = Enrollment.objects.filter(
-                    subject=enrollment.subject,
-                    academic_year=enrollment.academic_year,
-                    semester=enrollment.semester,
-                    status='active'
-                ).count()
-                
-                if current_enrollment < enrollment.subject.max_capacity:
-                    enrollment.status = 'active'
-                    enrollment.approved_by = request.user
-                    enrollment.approved_date = timezone.now()
-                    enrollment.save()
-                    approved_count += 1
-                    
-            except Enrollment.DoesNotExist:
-                continue
+        enrollment_ids = [value for value in request.POST.getlist('enrollment_ids') if value.isdigit()]
+        try:
+            result = approve_enrollments(enrollment_ids, status='active')
+        except Exception as e:
+            print(f"Bulk registration approval failed: {e}")
+            messages.error(request, f"Error approving registrations: {str(e)}")
+            return redirect('approve_registrations')
         
-        if approved_count > 0:
-            messages.success(request, f"Approved {approved_count} registration(s)")
+        if result['approved']:
+            messages.success(request, f"Approved {len(result['approved'])} registration(s)")
         else:
             messages.warning(request, "No registrations were approved")
+        if result['waitlisted']:
+            messages.warning(request, f"{len(result['waitlisted'])} registration(s) waitlisted: subject is full")
     
     return redirect('approve_registrations')
 
@@ -1362,7 +1092,8 @@ from subjects.models import Enrollment, Grade
 from django.db import OperationalError
 try:
     from ranks.models import Grade as RankGrade
-    from ranks.models import calculate_student_average, rank_students_for_subject
+    from ranks.models import calculate_student_average, rank_students_for_subject, subject_rank_for_score
+    from ranks.models import get_class_rank, get_class_rank_map
 except Exception:
     RankGrade = None
 
@@ -1401,24 +1132,21 @@ def manage_academic_records(request):
     grade_levels = StudentProfile.objects.values_list('grade_level', flat=True).distinct().order_by('grade_level')
     academic_years = Enrollment.objects.values_list('academic_year', flat=True).distinct().order_by('-academic_year')
 
-    # Precompute GPA and total credits per student to simplify template rendering
-    rank_entries = []
+    # Precompute GPA and total credits per student to simplify template rendering;
+    # enrollments are already prefetched, so scoring costs one ranks query in total
+    scores = compute_numeric_scores_bulk(
+        students,
+        enrollments=(enrollment for student in students for enrollment in student.subject_enrollments.all()),
+    )
     for student in students:
-        enrollment_manager = getattr(student, 'subject_enrollments', None)
-        enrollments = list(enrollment_manager.all()) if enrollment_manager is not None else []
-        score_map, total_result, graded_count, average_result = compute_numeric_scores(student, enrollments)
+        score_map, total_result, graded_count, average_result = scores[student.id]
         student.result_total = total_result
         student.result_average = average_result
         student.graded_subjects = graded_count
         student.class_rank = None
-        grade_level = getattr(getattr(student, 'studentprofile', None), 'grade_level', None)
-        rank_entries.append({
-            'student_id': student.id,
-            'grade_level': grade_level,
-            'average': average_result,
-        })
 
-    rank_map = build_rank_map(rank_entries)
+    # Class ranks come from the materialized ClassRank table
+    rank_map = get_class_rank_map(student.id for student in students)
     for student in students:
         student.class_rank = rank_map.get(student.id)
     
@@ -1450,25 +1178,8 @@ def student_academic_record(request, student_id):
     for enrollment in enrollments:
         enrollment.result_score = score_map.get(enrollment.id)
     
-    class_rank = None
-    grade_level = getattr(getattr(student, 'studentprofile', None), 'grade_level', None)
-    if grade_level is not None:
-        peers = list(
-            User.objects.filter(role='student', studentprofile__grade_level=grade_level)
-            .prefetch_related('subject_enrollments', 'subject_enrollments__subject', 'studentprofile')
-        )
-        rank_entries = []
-        for peer in peers:
-            enrollment_manager = getattr(peer, 'subject_enrollments', None)
-            peer_enrollments = list(enrollment_manager.all()) if enrollment_manager is not None else []
-            _, _, _, peer_average = compute_numeric_scores(peer, peer_enrollments)
-            rank_entries.append({
-                'student_id': peer.id,
-                'grade_level': getattr(getattr(peer, 'studentprofile', None), 'grade_level', None),
-                'average': peer_average,
-            })
-        rank_map = build_rank_map(rank_entries)
-        class_rank = rank_map.get(student.id)
+    rank_row = get_class_rank(student)
+    class_rank = rank_row.rank if rank_row else None
     
     context = {
         'page_title': f'Academic Record - {student.get_full_name()}',
@@ -1563,11 +1274,7 @@ def generate_transcript(request, student_id):
                 if rg and rg.score is not None:
                     numeric_score = rg.score
                     # compute subject rank
-                    subject_rankings = rank_students_for_subject(enrollment.subject)
-                    for s, sc, r in subject_rankings:
-                        if s.id == student.id:
-                            subject_rank = r
-                            break
+                    subject_rank = subject_rank_for_score(enrollment.subject, rg.score)
         except OperationalError:
             messages.error(request, "Database schema for ranks not found. Run `python manage.py migrate ranks`.")
             return redirect('manage_academic_records')
@@ -1656,30 +1363,12 @@ def generate_transcript(request, student_id):
         if graded_count > 0:
             numeric_average = total_result / graded_count
 
-    # Compute student's rank among peers in same grade (by numeric average)
+    # Student's rank among peers in same grade, from the materialized ClassRank table
     student_rank = None
     try:
         if RankGrade is not None:
-            peers = User.objects.filter(role='student', studentprofile__grade_level=student.studentprofile.grade_level)
-            peer_averages = []
-            for p in peers:
-                avg = calculate_student_average(p) or 0
-                peer_averages.append((p.id, avg))
-            peer_averages.sort(key=lambda x: x[1], reverse=True)
-            rank = 0
-            last_score = None
-            idx = 0
-            for pid, avg in peer_averages:
-                idx += 1
-                if avg == last_score:
-                    # same rank
-                    pass
-                else:
-                    rank = idx
-                    last_score = avg
-                if pid == student.id:
-                    student_rank = rank
-                    break
+            rank_row = get_class_rank(student)
+            student_rank = rank_row.rank if rank_row else None
     except OperationalError:
         student_rank = None
 